@@ -0,0 +1,105 @@
+# bench_inventory.py
+"""
+Latency of the car lookups on a large inventory: the in-memory NumPy
+snapshot (chatbot/tools/inventory.py) against the equivalent SQL query.
+
+Builds a synthetic database with --cars cars, builds the snapshot once, then
+times each preference set through match_cars (the vectorized filter alone),
+select_cars (with the result rows) and SQL, reporting the median
+milliseconds and the number of matching cars, and through rank_cars (the
+top-k partial-match ranking of chatbot/tools/ranking.py).
+
+Usage: python benchmarks/bench_inventory.py [--cars N] [--iterations N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(BENCHMARKS_DIR, "..", "chatbot")
+
+PREFERENCES = {
+    "color": {"color": "red"},
+    "brand+location": {"brand": "Tesla", "location": "Miami"},
+    "year+price": {"year": 2022, "price": 90},
+    "all filters": {"color": "blue", "brand": "toyota", "location": "Chicago", "year": 2020, "price": 150},
+    "dates": {"brand": "Ford", "start_date": "2024-06-01", "end_date": "2024-06-05"},
+    "no filter": {},
+}
+
+
+def sql_select(fetch_all, to_day_number, preferences):
+    """
+    The SQL lookup that select_cars replaces.
+    """
+    query = """
+    SELECT Cars.Model, Cars.Brand, Cars.Year, Cars.Color, Cars.PricePerDay, Shop.Location
+    FROM Cars
+    INNER JOIN Shop ON Cars.ShopID = Shop.ShopID
+    WHERE 1=1
+    """
+    params = []
+    for key, condition in [("color", "Cars.Color = ? COLLATE NOCASE"), ("brand", "Cars.Brand = ? COLLATE NOCASE"),
+                           ("location", "Shop.Location = ? COLLATE NOCASE"), ("year", "Cars.Year = ?"),
+                           ("price", "Cars.PricePerDay <= ?")]:
+        if preferences.get(key):
+            query += f" AND {condition}"
+            params.append(preferences[key])
+    if preferences.get("start_date") and preferences.get("end_date"):
+        query += " AND Cars.CarID IN (SELECT CarID FROM AvailabilityIndex WHERE StartDay <= ? AND EndDay >= ?)"
+        params += [to_day_number(preferences["end_date"]), to_day_number(preferences["start_date"])]
+    return fetch_all(query, params)
+
+
+def median_ms(call, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cars", type=int, default=500000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from synthetic_db import create_database
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rental_car.db")
+        started = time.perf_counter()
+        size = create_database(path, cars=args.cars)
+        print(f"Synthetic database: {size['cars']} cars, {size['windows']} windows "
+              f"({time.perf_counter() - started:.1f}s)")
+        os.environ["RENTAL_DB_PATH"] = path
+        sys.path.insert(0, CHATBOT_DIR)
+        from tools.database import fetch_all, to_day_number, close_connections
+        from tools.inventory import get_inventory, match_cars, select_cars, get_inventory_stats
+        from tools.ranking import rank_cars
+
+        inventory = get_inventory()
+        print(f"Snapshot build: {get_inventory_stats()['build_seconds'] * 1000:.0f} ms")
+
+        header = f"{'preferences':16} {'matches':>8} {'mask ms':>8} {'rows ms':>8} {'sql ms':>9} {'speedup':>8} {'rank ms':>8}"
+        print(header)
+        print("-" * len(header))
+        for name, preferences in PREFERENCES.items():
+            mask_ms, _ = median_ms(lambda: match_cars(inventory, preferences), args.iterations)
+            numpy_ms, rows = median_ms(lambda: select_cars(preferences), args.iterations)
+            sql_ms, sql_rows = median_ms(lambda: sql_select(fetch_all, to_day_number, preferences), args.iterations)
+            rank_ms, _ = median_ms(lambda: rank_cars(preferences), args.iterations)
+            if sorted(rows) != sorted(sql_rows):
+                print(f"{name}: results differ ({len(rows)} vs {len(sql_rows)} rows)")
+            print(f"{name:16} {len(rows):8} {mask_ms:8.2f} {numpy_ms:8.2f} {sql_ms:9.2f} {sql_ms / numpy_ms:7.1f}x {rank_ms:8.2f}")
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# bench_llm_batching.py
+"""
+Throughput of concurrent enrichment calls with and without the LLM batching
+dispatcher (chatbot/tools/llm_dispatcher.py).
+
+Simulates many users issuing enrichment prompts at the same time against the
+fake LLM of benchmarks/fake_llm.py. The fake provider serves at most
+--connections requests at once and each request costs --latency. Like
+ChatGroq's, its batch methods send one request per prompt, so the numbers
+show the overhead of the dispatcher (the wait to fill a batch, the slowest
+prompt of a batch, the batches in flight) rather than a saving; this is why
+LLM_BATCHING is off by default. Reports the wall time, throughput, caller
+latency percentiles and provider requests, for the thread-based dispatcher
+and for the async one.
+
+Usage:
+    python benchmarks/bench_llm_batching.py [--users N] [--calls N] [--latency MS] [--connections N]
+                                            [--batch-size N] [--max-wait MS] [--max-inflight N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(BENCHMARKS_DIR, "..", "chatbot")
+
+PROMPT = "System: Rephrase the answer.\nHuman: We have 3 cars available in Miami. The Tesla Model 3 (2022, red) is available for $90.00 per day."
+
+
+def run_threads(users, calls, call):
+    """
+    Runs calls prompts in each of users threads and returns the wall time
+    and the latency of every call.
+    """
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Barrier(users + 1)
+
+    def user():
+        start.wait()
+        for _ in range(calls):
+            started = time.perf_counter()
+            call(PROMPT)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=user) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+async def run_tasks(users, calls, call):
+    """
+    Async counterpart of run_threads with one task per user.
+    """
+    latencies = []
+
+    async def user():
+        for _ in range(calls):
+            started = time.perf_counter()
+            await call(PROMPT)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(users)))
+    return time.perf_counter() - started, latencies
+
+
+def report(name, llm, elapsed, latencies):
+    from run_benchmarks import percentile
+
+    latencies.sort()
+    print(f"{name:16} {elapsed:8.2f} {len(latencies) / elapsed:10.1f} {percentile(latencies, 50) * 1000:9.1f} "
+          f"{percentile(latencies, 95) * 1000:9.1f} {llm.requests:9}")
+    return len(latencies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=64, help="concurrent users")
+    parser.add_argument("--calls", type=int, default=5, help="enrichment calls per user")
+    parser.add_argument("--latency", type=float, default=50.0, help="milliseconds per provider request")
+    parser.add_argument("--connections", type=int, default=16, help="requests the provider serves at once")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=5.0, help="milliseconds a batch waits to fill")
+    parser.add_argument("--max-inflight", type=int, default=4, help="batches in flight")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCHMARKS_DIR)
+    sys.path.insert(0, CHATBOT_DIR)
+    from fake_llm import FakeLLM
+    from tools.llm_dispatcher import BatchDispatcher, AsyncBatchDispatcher
+
+    def new_llm():
+        return FakeLLM(latency=args.latency / 1000, connections=args.connections)
+
+    settings = {
+        "max_size": args.batch_size, "max_wait": args.max_wait / 1000,
+        "max_inflight": args.max_inflight, "concurrency": args.batch_size,
+    }
+
+    print(f"{args.users} users x {args.calls} calls; provider: {args.latency:.0f} ms per request, "
+          f"{args.connections} connections; "
+          f"batches of {args.batch_size}, {args.max_wait:.0f} ms wait, {args.max_inflight} in flight")
+    header = f"{'mode':16} {'wall s':>8} {'calls/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'requests':>9}"
+    print(header)
+    print("-" * len(header))
+
+    llm = new_llm()
+    direct = report("threads direct", llm, *run_threads(args.users, args.calls, llm.invoke))
+    llm = new_llm()
+    dispatcher = BatchDispatcher(llm, **settings)
+    batched = report("threads batched", llm, *run_threads(args.users, args.calls, lambda prompt: dispatcher.submit(prompt).result()))
+
+    async def run_async():
+        llm = new_llm()
+        async_direct = report("async direct", llm, *await run_tasks(args.users, args.calls, llm.ainvoke))
+        llm = new_llm()
+        dispatcher = AsyncBatchDispatcher(llm, **settings)
+        async_batched = report("async batched", llm, *await run_tasks(args.users, args.calls, dispatcher.submit))
+        return async_direct, async_batched
+
+    async_direct, async_batched = asyncio.run(run_async())
+    print(f"Batched / direct throughput: threads {batched / direct:.2f}x, async {async_batched / async_direct:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# check_prompt_budget.py
+"""
+Guards the size of the LLM prompts built from car listings.
+
+Renders every template that lists cars for the LLM (see prompt_text in
+chatbot/tools/rendering.py) with --cars synthetic cars, grouped into few or
+many brands and locations, and checks that the estimated prompt stays within
+PROMPT_TOKEN_BUDGET, that the same list always gives the same prompt, and
+that building it stays fast.
+
+Usage: python benchmarks/check_prompt_budget.py [--cars N] [--max-ms MS]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(BENCHMARKS_DIR, "..", "chatbot")
+
+BRANDS = ["Tesla", "Toyota", "Honda", "Ford", "BMW", "Audi", "Kia", "Hyundai"]
+LOCATIONS = ["Miami", "New York", "Chicago", "Boston", "Los Angeles"]
+MODELS = ["Model 3", "Corolla", "Civic", "Mustang", "X5", "A4", "Sportage", "Elantra"]
+COLORS = ["Red", "Blue", "Black", "White", "Silver"]
+
+# Listing templates rendered for the LLM and the rest of their context
+LISTINGS = {
+    "brand_cars": {"brand": "Toyota"},
+    "color_cars": {"color": "red"},
+    "location_cars": {"location": "Miami"},
+    "price_filter": {"comparison": "less than or equal to", "price": 150.0},
+    "price_brand": {"brand": "Toyota"},
+    "year_cars": {"year": 2022},
+    "recommendation_cars": {},
+}
+
+
+def make_cars(count, distinct):
+    """
+    Synthetic cars; with distinct, every car has its own brand and location,
+    the worst case for grouping.
+    """
+    generator = random.Random(count)
+    cars = []
+    for index in range(count):
+        cars.append({
+            "model": generator.choice(MODELS),
+            "brand": f"Brand {index}" if distinct else generator.choice(BRANDS),
+            "year": generator.randint(2015, 2024),
+            "color": generator.choice(COLORS),
+            "price": float(generator.randint(30, 300)),
+            "monthly_price": float(generator.randint(600, 6000)),
+            "location": f"Town {index}" if distinct else generator.choice(LOCATIONS),
+        })
+    return cars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cars", type=int, default=10000)
+    parser.add_argument("--max-ms", type=float, default=500)
+    args = parser.parse_args()
+
+    sys.path.insert(0, CHATBOT_DIR)
+    from tools.prompt_budget import estimate_tokens, PROMPT_TOKEN_BUDGET
+    from tools.rendering import prompt_text, render_template
+
+    failures = 0
+    for distinct in (False, True):
+        cars = make_cars(args.cars, distinct)
+        for template, extra in LISTINGS.items():
+            context = dict(extra, cars=cars, total=len(cars))
+            text = render_template(template, context)
+            started = time.perf_counter()
+            prompt = prompt_text(template, context, text)
+            elapsed = (time.perf_counter() - started) * 1000
+            tokens = estimate_tokens(prompt)
+
+            problems = []
+            if tokens > PROMPT_TOKEN_BUDGET:
+                problems.append("over budget")
+            if prompt_text(template, dict(context), text) != prompt:
+                problems.append("not deterministic")
+            if elapsed > args.max_ms:
+                problems.append("too slow")
+            failures += bool(problems)
+            label = f"{template} ({'distinct' if distinct else 'grouped'})"
+            print(f"{label:34} {estimate_tokens(text):8} -> {tokens:4} tokens {elapsed:7.1f} ms  {', '.join(problems)}")
+
+    print(f"Budget {PROMPT_TOKEN_BUDGET} tokens for {args.cars} cars.")
+    print("Prompt budget check " + ("failed." if failures else "passed."))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
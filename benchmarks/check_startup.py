@@ -0,0 +1,86 @@
+# check_startup.py
+"""
+Guards the cold start of the server processes.
+
+Imports each server module in a fresh interpreter under "python -X importtime",
+several times, and checks the median import time against the budget. Also
+fails when a dependency that must load lazily (LangChain, the Groq SDK, the
+date and number parsers, NumPy) is imported with the app.
+
+Usage: python benchmarks/check_startup.py [--runs N] [--budget SECONDS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(BENCHMARKS_DIR, "..", "chatbot")
+
+APP_MODULES = ["server", "asgi_server"]
+
+# Seconds a worker may spend importing the app
+IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "0.5"))
+
+# Loaded on first use or by the warmup hook (tools/warmup.py), never at import
+LAZY_MODULES = ["langchain_core", "langchain_groq", "groq", "dateutil", "word2number", "numpy"]
+
+IMPORT_SCRIPT = (
+    "import time; started = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def time_import(module):
+    """
+    Imports a module in a new interpreter. Returns the seconds spent and the
+    "-X importtime" report as {module: cumulative microseconds}.
+    """
+    env = dict(os.environ)
+    env.setdefault("GROQ_API_KEY", "startup-check")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT.format(module=module)],
+        cwd=CHATBOT_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    report = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        report[name.strip()] = int(cumulative)
+    return float(result.stdout.strip().splitlines()[-1]), report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET)
+    args = parser.parse_args()
+
+    failures = 0
+    for module in APP_MODULES:
+        timings = []
+        for _ in range(args.runs):
+            seconds, report = time_import(module)
+            timings.append(seconds)
+        median = statistics.median(timings)
+        print(f"{module}: median {median * 1000:.0f} ms over {args.runs} runs (budget {args.budget * 1000:.0f} ms)")
+
+        slowest = sorted(((us, name) for name, us in report.items() if "." not in name), reverse=True)[:5]
+        print("    slowest packages: " + ", ".join(f"{name} {us / 1000:.0f} ms" for us, name in slowest))
+
+        eager = [name for name in LAZY_MODULES if name in report]
+        if eager:
+            failures += 1
+            print(f"    imported eagerly: {', '.join(eager)}")
+        if median > args.budget:
+            failures += 1
+            print("    over budget")
+
+    print("Startup check " + ("failed." if failures else "passed."))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
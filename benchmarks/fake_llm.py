@@ -0,0 +1,112 @@
+# fake_llm.py
+"""
+Deterministic stand-in for the Groq chat client, used by the benchmarks.
+
+Understanding prompts are answered from canned outputs keyed by the user
+query; every other prompt (enrichment, summaries) is answered by echoing the
+text it was asked to rephrase. Each call can be delayed to simulate the
+provider's latency, and every call is counted.
+
+Like ChatGroq's, the batch
+methods send one request per prompt, concurrently. With connections set, at
+most that many requests are served at the same time, as with a rate-limited
+provider or a bounded connection pool.
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_UNDERSTANDING = {"intent": "general_query", "preferences": {}}
+
+
+class FakeMessage:
+    """The parts of a LangChain AIMessage the chatbot reads."""
+
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 0, "output_tokens": len(content.split())}
+
+
+class FakeLLM:
+    """
+    Chat client with canned answers and a fixed latency in seconds.
+    understanding maps a user query to {"intent": ..., "preferences": {...}}.
+    """
+
+    model_name = "fake-llm"
+
+    def __init__(self, understanding=None, latency=0.0, connections=None):
+        self.understanding = understanding or {}
+        self.latency = latency
+        self.connections = connections
+        self.calls = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(connections) if connections else None
+        self._async_semaphore = None
+
+    def invoke(self, prompt, *args, **kwargs):
+        self._request()
+        return FakeMessage(self.answer(str(prompt)))
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        await self._arequest()
+        return FakeMessage(self.answer(str(prompt)))
+
+    def batch(self, prompts, config=None, return_exceptions=False, **kwargs):
+        with ThreadPoolExecutor(max_workers=max(len(prompts), 1)) as pool:
+            return list(pool.map(self.invoke, prompts))
+
+    async def abatch(self, prompts, config=None, return_exceptions=False, **kwargs):
+        return list(await asyncio.gather(*(self.ainvoke(prompt) for prompt in prompts)))
+
+    def stream(self, prompt, *args, **kwargs):
+        for word in self.invoke(prompt).content.split(" "):
+            yield FakeMessage(word + " ")
+
+    async def astream(self, prompt, *args, **kwargs):
+        for word in (await self.ainvoke(prompt)).content.split(" "):
+            yield FakeMessage(word + " ")
+
+    def answer(self, prompt):
+        """
+        Returns the canned answer to a prompt formatted by tools/prompts.py.
+        """
+        system, _, query = prompt.rpartition("\nHuman: ")
+        understanding = self.understanding.get(query, DEFAULT_UNDERSTANDING)
+        if "Identify the user's intent and extract" in system:
+            return json.dumps(understanding)
+        if "Respond with only one of these intents" in system:
+            return understanding["intent"]
+        if "extract preferences in JSON format" in system:
+            return json.dumps(understanding["preferences"])
+        return query
+
+    def _request(self):
+        self._count()
+        delay = self.latency
+        if self._semaphore is None:
+            if delay:
+                time.sleep(delay)
+            return
+        with self._semaphore:
+            time.sleep(delay)
+
+    async def _arequest(self):
+        self._count()
+        delay = self.latency
+        if self.connections is None:
+            if delay:
+                await asyncio.sleep(delay)
+            return
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.connections)
+        async with self._async_semaphore:
+            await asyncio.sleep(delay)
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+            self.requests += 1
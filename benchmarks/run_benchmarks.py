@@ -0,0 +1,285 @@
+# run_benchmarks.py
+"""
+Offline micro-benchmarks of the routing pipeline.
+
+Builds a synthetic database, replaces every LLM client with a deterministic
+fake (benchmarks/fake_llm.py) and times process_input, the nodes and agents
+and the entity detectors in isolation. Reports latency percentiles, LLM calls
+and SQL statements per call and the peak memory allocated per call.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--iterations N] [--cars N] [--llm-latency MS]
+                                        [--only NAME] [--save FILE] [--baseline FILE]
+
+With --baseline, exits with status 1 when a benchmark got slower than the
+saved run by more than --tolerance, or makes more LLM calls or SQL statements.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(BENCHMARKS_DIR, "..", "chatbot")
+
+# Canned understanding of the queries that do not take the rule-based fast path
+UNDERSTANDING = {
+    "recommend me a blue toyota in Miami": {
+        "intent": "recommendation_request",
+        "preferences": {"color": "blue", "brand": "Toyota", "location": "Miami"},
+    },
+    "which cars can I rent between January 2 and January 5": {
+        "intent": "availability_query",
+        "preferences": {"start_date": "2024-01-02", "end_date": "2024-01-05"},
+    },
+    "I'd like to book a car": {"intent": "booking", "preferences": {}},
+    "anything fun for a weekend trip?": {"intent": "general_query", "preferences": {}},
+}
+
+# Turns of process_input: fast-path queries first, then queries needing the LLM
+TURNS = [
+    "red cars",
+    "cars under 70",
+    "cars in Miami",
+    "Tesla models",
+    "cars from 2022",
+    "recommend me a blue toyota in Miami",
+    "which cars can I rent between January 2 and January 5",
+    "I'd like to book a car",
+    "anything fun for a weekend trip?",
+]
+
+DETECTOR_QUERIES = [
+    "show me red cars in Miami under 70",
+    "do you have a Tesla Model 3 from 2022",
+    "cars from four years ago above 100",
+    "what does a black Ford Mustang cost in Los Angeles",
+]
+
+# Absolute slack (seconds) so microsecond benchmarks do not fail on timer noise
+ABSOLUTE_SLACK = 0.0002
+
+
+def setup_environment(directory, cars):
+    """
+    Points the chatbot at a synthetic database in directory, before any
+    chatbot module reads its settings.
+    """
+    from synthetic_db import create_database
+
+    path = os.path.join(directory, "rental_car.db")
+    inventory = create_database(path, cars=cars)
+    os.environ["RENTAL_DB_PATH"] = path
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(directory, "response_cache.db")
+    os.environ.setdefault("RESPONSE_CACHE_ENABLED", "0")
+    os.environ.setdefault("QUERY_CACHE_MODE", "off")
+    os.environ.setdefault("LLM_BATCHING", "0")
+    os.environ.setdefault("RENDER_MODE", "llm")
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    sys.path.insert(0, CHATBOT_DIR)
+    return inventory
+
+
+def build_benchmarks(llm):
+    """
+    Returns {name: (setup, call)}: setup() runs outside the timing and returns
+    the arguments of call.
+    """
+    from agents.manager_agent import process_input
+    from agents.booking_agent import handle_booking_intent
+    from agents.recommendation_agent import recommend_cars_with_groq
+    from nodes.availability import check_availability
+    from nodes.brand import detect_brand_in_query
+    from nodes.color import detect_color_in_query
+    from nodes.location import detect_location_in_query
+    from nodes.price import handle_price_query, detect_price_in_query
+    from nodes.year import detect_year_in_query
+    from tools.entity_extractor import extract_entities
+    from tools.helpers import detect_car_model_in_query
+    from tools.session_store import new_session
+    import tools.entity_extractor as entity_extractor
+
+    def rotate(items):
+        position = [0]
+
+        def next_item():
+            position[0] = (position[0] + 1) % len(items)
+            return items[position[0]]
+        return next_item
+
+    next_turn = rotate(TURNS)
+    next_detector_query = rotate(DETECTOR_QUERIES)
+
+    def detector_setup():
+        # Every detector call scans the query again instead of hitting the per-turn cache
+        entity_extractor._cache.clear()
+        return (next_detector_query(),)
+
+    def booking_setup():
+        session = new_session()
+        session["booking"] = {"active_booking": True, "preferences": {"brand": "Tesla", "color": "Red"}}
+        return ("a red tesla in Miami", {"location": "Miami"}, llm, session)
+
+    benchmarks = {
+        "process_input": (lambda: (next_turn(), None, new_session()), process_input),
+        "handle_price_query": (lambda: ("cars under 70", llm), handle_price_query),
+        "check_availability": (lambda: ({"start_date": "2024-03-01", "end_date": "2024-03-04"},), check_availability),
+        "recommend_cars_with_groq": (lambda: ({"color": "Blue", "brand": "Toyota", "location": "Miami"}, llm), recommend_cars_with_groq),
+        "handle_booking_intent": (booking_setup, handle_booking_intent),
+        "extract_entities": (detector_setup, extract_entities),
+        "detect_price_in_query": (detector_setup, detect_price_in_query),
+        "detect_year_in_query": (detector_setup, detect_year_in_query),
+        "detect_brand_in_query": (detector_setup, detect_brand_in_query),
+        "detect_car_model_in_query": (detector_setup, detect_car_model_in_query),
+        "detect_color_in_query": (detector_setup, detect_color_in_query),
+        "detect_location_in_query": (detector_setup, detect_location_in_query),
+    }
+    return benchmarks
+
+
+def run_benchmark(setup, call, llm, iterations, warmup, allocation_iterations):
+    """
+    Times one benchmark and returns its report.
+    """
+    from tools.database import start_request_stats, get_request_stats
+
+    for _ in range(warmup):
+        call(*setup())
+
+    timings = []
+    llm_calls = 0
+    statements = 0
+    for _ in range(iterations):
+        args = setup()
+        calls_before = llm.calls
+        start_request_stats()
+        started = time.perf_counter()
+        call(*args)
+        timings.append(time.perf_counter() - started)
+        statements += get_request_stats()["queries"]
+        llm_calls += llm.calls - calls_before
+
+    # Allocations are measured separately: tracing slows every call down
+    peaks = []
+    tracemalloc.start()
+    for _ in range(allocation_iterations):
+        args = setup()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        call(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "mean": statistics.fmean(timings),
+        "p50": percentile(timings, 50),
+        "p95": percentile(timings, 95),
+        "p99": percentile(timings, 99),
+        "llm_calls": llm_calls / iterations,
+        "sql_statements": statements / iterations,
+        "peak_alloc_kib": statistics.median(peaks) / 1024 if peaks else 0.0,
+    }
+
+
+def percentile(sorted_values, percent):
+    """
+    Returns the nearest-rank percentile of sorted values.
+    """
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def print_report(results, inventory, llm_latency):
+    print(f"Synthetic inventory: {inventory['cars']} cars, {inventory['shops']} shops, "
+          f"{inventory['windows']} availability windows; fake LLM latency {llm_latency * 1000:.0f} ms")
+    header = f"{'benchmark':28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'LLM/call':>9} {'SQL/call':>9} {'peak KiB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(f"{name:28} {result['p50'] * 1000:9.3f} {result['p95'] * 1000:9.3f} {result['p99'] * 1000:9.3f} "
+              f"{result['llm_calls']:9.2f} {result['sql_statements']:9.2f} {result['peak_alloc_kib']:9.1f}")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of results against a saved run.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ["p50", "p95"]:
+            limit = previous[metric] * (1 + tolerance) + ABSOLUTE_SLACK
+            if result[metric] > limit:
+                regressions.append(f"{name}: {metric} {result[metric] * 1000:.3f} ms, was {previous[metric] * 1000:.3f} ms")
+        for metric in ["llm_calls", "sql_statements"]:
+            if result[metric] > previous[metric] + 1e-9:
+                regressions.append(f"{name}: {metric} {result[metric]:.2f}, was {previous[metric]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--allocation-iterations", type=int, default=20)
+    parser.add_argument("--cars", type=int, default=2000, help="size of the synthetic inventory")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="milliseconds added to every fake LLM call")
+    parser.add_argument("--only", action="append", help="run only these benchmarks")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from fake_llm import FakeLLM
+
+    with tempfile.TemporaryDirectory() as directory:
+        inventory = setup_environment(directory, args.cars)
+        llm = FakeLLM(UNDERSTANDING, latency=args.llm_latency / 1000)
+
+        from tools.llm_registry import set_llm
+        from tools.warmup import load_parsers
+        from tools.prompts import load_prompts
+        from tools.entity_extractor import load_extractor
+        from tools.database import close_connections
+        set_llm(llm)
+
+        results = {}
+        # Expected warnings (e.g., booking fallbacks) would clutter the report
+        logging.disable(logging.WARNING)
+        load_extractor()
+        load_prompts()
+        load_parsers()
+        for name, (setup, call) in build_benchmarks(llm).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = run_benchmark(setup, call, llm, args.iterations, args.warmup, args.allocation_iterations)
+        logging.disable(logging.NOTSET)
+        close_connections()
+
+    print_report(results, inventory, llm.latency)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# synthetic_db.py
+"""
+Builds a rental database of any size with the schema of database/initialize.sql.
+The inventory is random but reproducible for a given seed; the chatbot
+applies the migrations when it first opens the file.
+"""
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database")
+
+MODELS = {
+    "Tesla": ["Model S", "Model X", "Model 3", "Model Y"],
+    "Toyota": ["Corolla", "Camry", "RAV4", "Prius"],
+    "Honda": ["Civic", "Accord", "CR-V"],
+    "Ford": ["Mustang", "F-150", "Explorer", "Focus"],
+    "BMW": ["X5", "M3", "i4"],
+    "Audi": ["A4", "Q5", "E-Tron"],
+    "Kia": ["Sportage", "Sorento", "Rio"],
+    "Hyundai": ["Elantra", "Tucson", "Kona"],
+}
+COLORS = ["Red", "Blue", "Black", "White", "Gray", "Silver", "Green", "Yellow"]
+LOCATIONS = [
+    "New York", "Los Angeles", "Chicago", "Miami", "San Francisco", "Boston", "Seattle",
+    "Denver", "Austin", "Atlanta", "Dallas", "Phoenix", "Portland", "San Diego", "Orlando",
+]
+YEARS = range(2016, 2025)
+FIRST_DAY = date(2024, 1, 1)
+
+
+def create_database(path, cars=2000, windows_per_car=3, seed=7):
+    """
+    Creates the database with the given number of cars, spread over every
+    location, each with up to windows_per_car availability windows.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    with open(os.path.join(DATABASE_DIR, "initialize.sql"), encoding="utf-8") as f:
+        conn.executescript(f.read())
+
+    conn.executemany(
+        "INSERT INTO Shop (ShopID, Location) VALUES (?, ?)",
+        [(shop_id, location) for shop_id, location in enumerate(LOCATIONS, start=1)]
+    )
+
+    car_rows = []
+    window_rows = []
+    for car_id in range(1, cars + 1):
+        brand = rng.choice(list(MODELS))
+        price = round(rng.uniform(35, 250), 0)
+        car_rows.append((
+            car_id, rng.choice(MODELS[brand]), brand, rng.choice(YEARS), rng.choice(COLORS),
+            price, rng.randint(1, len(LOCATIONS))
+        ))
+        for _ in range(rng.randint(0, windows_per_car)):
+            start = FIRST_DAY + timedelta(days=rng.randint(0, 540))
+            end = start + timedelta(days=rng.randint(2, 30))
+            window_rows.append((car_id, start.isoformat(), end.isoformat()))
+
+    conn.executemany(
+        "INSERT INTO Cars (CarID, Model, Brand, Year, Color, PricePerDay, ShopID) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        car_rows
+    )
+    conn.executemany("INSERT INTO CarAvailability (CarID, StartDate, EndDate) VALUES (?, ?, ?)", window_rows)
+    conn.commit()
+    conn.close()
+    return {"cars": len(car_rows), "shops": len(LOCATIONS), "windows": len(window_rows)}
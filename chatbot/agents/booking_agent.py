@@ -1,31 +1,71 @@
 
-import sqlite3
-from langchain_groq import ChatGroq
-
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
-
-# Memory to store session state and preferences
-session_memory = {
-    "active_booking": False,
-    "preferences": {}
-}
+import logging
+from tools.database import to_day_number
+from tools.pagination import list_cars, to_car
+from tools.ranking import rank_cars
+from tools.streaming import emit_event
+from tools.rendering import render_reply, render_reply_async, render_template
+from tools.pipeline import run_blocking
+
+logger = logging.getLogger(__name__)
+
+BOOKING_CONFIRMATION_PROMPT = (
+    "You are a car rental assistant. Based on the user's preferences, suggest this car as a booking option. Dont say hello or goodbye. "
+    "Include the details in a friendly and professional tone, but concisely and clarify that this is an option, not a final confirmation. "
+    "End the message by letting the user know you're available to help with recommendations, more bookings, or any questions."
+)
 
 # General: add dates (ask)
 
-def handle_booking_intent(query, preferences, llm):
+def handle_booking_intent(query, preferences, llm, session):
     """
     Handles the car booking process.
     Uses LLM to guide the conversation and format responses.
+    The booking state is kept in the user's session (see tools/session_store.py).
     """
-    global session_memory
+    template, context = plan_booking(preferences, session)
+    if template != "booking_option":
+        return {"message": render_template(template, context)}
+
+    car_details = context["car"]
+    # Let a streaming client render the booking card before the LLM answers
+    emit_event("car_details", car_details)
+    response = render_reply("booking", template, context, llm, BOOKING_CONFIRMATION_PROMPT)
+    return {
+        "message": response.strip(),
+        "car_details": car_details,  # Pass car details for the frontend
+    }
+
+
+async def handle_booking_intent_async(query, preferences, llm, session):
+    """
+    Async counterpart of handle_booking_intent.
+    """
+    template, context = await run_blocking(plan_booking, preferences, session)
+    if template != "booking_option":
+        return {"message": render_template(template, context)}
+
+    car_details = context["car"]
+    emit_event("car_details", car_details)
+    response = await render_reply_async("booking", template, context, llm, BOOKING_CONFIRMATION_PROMPT)
+    return {
+        "message": response.strip(),
+        "car_details": car_details,
+    }
+
+
+def plan_booking(preferences, session):
+    """
+    Advances the booking conversation stored in the session and looks up the cars.
+    Returns the template of the answer and its context.
+    """
+    session_memory = session["booking"]
 
     # Start booking session if not active
     if not session_memory["active_booking"]:
         session_memory["active_booking"] = True
         session_memory["preferences"] = preferences.copy()
-        return {
-            "message": "Great! Let's start your booking. What are your preferences for the car? (e.g., color, brand, location, date range)."
-        }
+        return "booking_start", {}
 
     # Update session preferences with new details from the query
     for key, value in preferences.items():
@@ -34,158 +74,73 @@ def handle_booking_intent(query, preferences, llm):
 
     # If no preferences are provided yet, ask for them
     if not any(session_memory["preferences"].values()):
-        return {
-            "message": "I still need more details to help you. Could you share your preferences for the car? (e.g., color, brand, location, etc.)"
-        }
+        return "booking_need_details", {}
+
+    # Dates the availability index cannot read (e.g. "2024-02-30") are dropped and asked again
+    if not has_valid_dates(session_memory["preferences"]):
+        session_memory["preferences"].update(start_date=None, end_date=None)
+        return "booking_date_error", {}
 
     # Fetch cars matching the current preferences
-    cars = query_cars_with_preferences(session_memory["preferences"])
+    cars, total = query_cars_with_preferences(session_memory["preferences"])
 
     # If a single car is found, finalize the booking
-    if len(cars) == 1:
+    if total == 1:
         selected_car = cars[0]
-        reset_booking_session()  # Reset session after booking
-
-        #  LLM for a confirmation message
-        car_details = {
-            "brand": selected_car[1],
-            "model": selected_car[0],
-            "year": selected_car[2],
-            "color": selected_car[3],
-            "price": f"{selected_car[4]:.2f}",
-            "location": selected_car[5],
-        }
-        confirmation_prompt = (
-            f"You are a car rental assistant. Based on the user's preferences, suggest this car as a booking option. Dont say hello or goodbye"
-            f"Include the details below in a friendly and professional tone, but concisely and clarify that this is an option, not a final confirmation:\n"
-            f"{car_details['brand']} {car_details['model']} ({car_details['year']}, {car_details['color']}) - "
-            f"${car_details['price']}/day located in {car_details['location']}.\n\n"
-            "End the message by letting the user know you're available to help with recommendations, more bookings, or any questions. "
-        )
-        messages = [{"role": "system", "content": confirmation_prompt}]
-        response = llm.invoke(messages)
-
-        return {
-            "message": response.content.strip(),
-            "car_details": car_details,  # Pass car details for the frontend
-        }
+        reset_booking_session(session)  # Reset session after booking
+
+        #  LLM (or template) for a confirmation message
+        car_details = dict(selected_car, price=f"{selected_car['price']:.2f}")
+        return "booking_option", {"car": car_details}
 
     # If multiple cars are found, ask the user to narrow down preferences
-    if len(cars) > 1:
-        car_options = [
-            f"{idx + 1}. {car[1]} {car[0]} ({car[3]} color, {car[2]} year) - ${car[4]:.2f}/day in {car[5]}"
-            for idx, car in enumerate(cars)
-        ]
-        return {
-            "message": "I found multiple cars matching your preferences. Please choose one from the options below:\n" + "\n".join(car_options),
-        }
+    if total > 1:
+        return "booking_multiple", {"cars": cars, "total": total}
 
     # if no matches are found, suggest fallback options
     fallback_cars = fetch_fallback_cars(preferences)
     if fallback_cars:
-        fallback_options = [
-            f"{idx + 1}. {car[1]} {car[0]} ({car[3]} color) - ${car[4]:.2f}/day in {car[5]}"
-            for idx, car in enumerate(fallback_cars)
-        ]
-        return {
-            "message": "No exact matches were found for your preferences, but you might be interested in the following cars:\n"
-            + "\n".join(fallback_options)
-        }
+        fallback_options = [to_car(car) for car in fallback_cars]
+        return "booking_fallback", {"cars": fallback_options}
 
     # If no fallback matches are available, reset session
-    reset_booking_session()
-    return {
-        "message": "Unfortunately, I couldn't find any cars matching your preferences. Please try adjusting your criteria or starting over."
-    }
+    reset_booking_session(session)
+    return "booking_none", {}
 
 
-def reset_booking_session():
+def has_valid_dates(preferences):
+    """
+    Checks that the start and end dates, when set, are real dates.
+    """
+    try:
+        for key in ["start_date", "end_date"]:
+            if preferences.get(key):
+                to_day_number(preferences[key])
+    except (TypeError, ValueError) as e:
+        logger.warning("Error processing dates: %s", e)
+        return False
+    return True
+
+
+def reset_booking_session(session):
     """
     Resets the booking session state.
     """
-    global session_memory
-    session_memory["active_booking"] = False
-    session_memory["preferences"] = {}
+    session["booking"] = {"active_booking": False, "preferences": {}}
 
 
 def query_cars_with_preferences(preferences):
     """
-    Queries the database for cars matching user preferences, eliminating duplicates.
-    """
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    query = """
-    SELECT DISTINCT Cars.Model, Cars.Brand, Cars.Year, Cars.Color, Cars.PricePerDay, Shop.Location
-    FROM Cars
-    INNER JOIN Shop ON Cars.ShopID = Shop.ShopID
-    INNER JOIN CarAvailability ON Cars.CarID = CarAvailability.CarID
-    WHERE 1=1
+    Looks up the cars matching user preferences in the inventory: the first
+    page of cars and how many match in total.
+    Without dates, only cars that have an availability window at all.
     """
-    params = []
-
-    if preferences.get("color"):
-        query += " AND LOWER(Cars.Color) = ?"
-        params.append(preferences["color"].lower())
-    if preferences.get("brand"):
-        query += " AND LOWER(Cars.Brand) = ?"
-        params.append(preferences["brand"].lower())
-    if preferences.get("location"):
-        query += " AND LOWER(Shop.Location) = ?"
-        params.append(preferences["location"].lower())
-    if preferences.get("year"):
-        query += " AND Cars.Year = ?"
-        params.append(preferences["year"])
-    if preferences.get("price"):
-        query += " AND Cars.PricePerDay <= ?"
-        params.append(preferences["price"])
-    if preferences.get("start_date") and preferences.get("end_date"):
-        query += " AND CarAvailability.StartDate <= ? AND CarAvailability.EndDate >= ?"
-        params.append(preferences["end_date"])
-        params.append(preferences["start_date"])
-
-    print("Executing Query:", query)
-    print("Query Parameters:", params)
-
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    conn.close()
-
-    # Remove doiuble rows if they still exist after query execution
-    unique_results = list(set(results))
-    return unique_results
+    logger.debug("Booking preferences: %s", preferences)
+    return list_cars({"kind": "cars", "preferences": preferences, "require_window": True})
 
 
 def fetch_fallback_cars(preferences):
     """
-    Fetches fallback cars matching at least one of the user's preferences.
-    """
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    query = """
-    SELECT Cars.Model, Cars.Brand, Cars.Year, Cars.Color, Cars.PricePerDay, Shop.Location
-    FROM Cars
-    INNER JOIN Shop ON Cars.ShopID = Shop.ShopID
-    WHERE 1=1
+    Fetches the cars closest to the user's preferences, best first.
     """
-    params = []
-
-    # Match on any single preference
-    if preferences.get("color"):
-        query += " AND LOWER(Cars.Color) = ?"
-        params.append(preferences["color"].lower())
-    elif preferences.get("brand"):
-        query += " AND LOWER(Cars.Brand) = ?"
-        params.append(preferences["brand"].lower())
-    elif preferences.get("location"):
-        query += " AND LOWER(Shop.Location) = ?"
-        params.append(preferences["location"].lower())
-
-    print("Executing Fallback Query:", query)
-    print("Fallback Query Parameters:", params)
-
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return rank_cars(preferences)
@@ -1,154 +1,452 @@
 
-from nodes.price import handle_price_query
-from nodes.color import get_cars_by_color_with_groq
-from nodes.availability import check_availability
-from agents.recommendation_agent import recommend_cars_with_groq
-from agents.booking_agent import handle_booking_intent, reset_booking_session
-from nodes.location import get_cars_by_location_with_groq
-from nodes.year import get_cars_by_year_with_groq
-from nodes.brand import get_models_by_brand_with_groq
-from langchain_groq import ChatGroq
-from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
-from dotenv import load_dotenv
+import logging
+from nodes.price import handle_price_query, handle_price_query_async
+from nodes.color import get_cars_by_color_with_groq, get_cars_by_color_async
+from nodes.availability import check_availability, check_availability_async
+from agents.recommendation_agent import recommend_cars_with_groq, recommend_cars_async
+from agents.booking_agent import handle_booking_intent, handle_booking_intent_async
+from nodes.location import get_cars_by_location_with_groq, get_cars_by_location_async
+from nodes.year import get_cars_by_year_with_groq, get_cars_by_year_async
+from nodes.brand import get_models_by_brand_with_groq, get_models_by_brand_async
 from tools.helpers import parse_natural_language_date, get_current_year
-from datetime import datetime
+from tools.pipeline import run_stages, run_stages_async, run_blocking, stage
+from tools.intent_router import fast_understand, rule_based_understand
+from tools.rendering import render_template
+from tools.session_store import new_session
+from tools.llm_registry import get_llm
+from tools.prompts import format_chat_prompt
+from tools.tracing import span, record_llm_usage
+from tools.llm_budget import reserve_llm_call, llm_calls_left
+from tools.query_cache import find_similar_understanding, remember_understanding, QUERY_CACHE_MODE
+from tools.pagination import next_page, is_more_request
 import os
 import json
 
-# Global session memory for booking state
-session_memory = {
-    "active_booking": False,
-    "preferences": {}
+logger = logging.getLogger(__name__)
+
+VALID_INTENTS = {
+    "availability_query",
+    "price_query",
+    "color_query",
+    "location_query",
+    "year_query",
+    "recommendation_request",
+    "brand_query",
+    "booking"
 }
 
+PREFERENCE_KEYS = ["color", "location", "price", "brand", "year", "start_date", "end_date"]
+
+# System prompts of the understanding stage
+INTENT_PROMPT = (
+    "You are a car rental assistant. Identify the user's intent and relevant details from their query. "
+    "Possible intents include booking a car, checking car availability (based on month, date, or time frame), "
+    "finding car prices, exploring options by color, finding cars by location, seeking recommendations, "
+    "or inquiring about car brands and models. "
+    "A query mentioning more than one preference (e.g., color, brand, and location) is likely a recommendation_request. "
+    "Respond with only one of these intents: availability_query, price_query, color_query, "
+    "location_query, year_query, recommendation_request, 'booking', or brand_query."
+)
+
+PREFERENCES_PROMPT = (
+    "You are a car rental assistant. Analyze the user's query and extract preferences in JSON format. "
+    "Preferences can include 'color', 'location', 'price', 'brand', 'year', 'start_date', or 'end_date'. "
+    "Respond in JSON format, e.g., {\"color\": \"blue\", \"brand\": \"audi\", \"location\": null, \"year\": 2020, \"price\": 100, \"start_date\": \"December 1\", \"end_date\": \"December 10\"}."
+)
 
+UNDERSTANDING_PROMPT = (
+    "You are a car rental assistant. Identify the user's intent and extract their preferences from the query. "
+    "Possible intents include booking a car, checking car availability (based on month, date, or time frame), "
+    "finding car prices, exploring options by color, finding cars by location, seeking recommendations, "
+    "or inquiring about car brands and models. "
+    "A query mentioning more than one preference (e.g., color, brand, and location) is likely a recommendation_request. "
+    "The intent must be one of: availability_query, price_query, color_query, location_query, year_query, "
+    "recommendation_request, booking, or brand_query. "
+    "Preferences can include 'color', 'location', 'price', 'brand', 'year', 'start_date', or 'end_date'; use null when not mentioned. "
+    "Respond with only valid JSON, e.g., {\"intent\": \"recommendation_request\", \"preferences\": {\"color\": \"blue\", \"brand\": \"audi\", "
+    "\"location\": null, \"year\": 2020, \"price\": 100, \"start_date\": \"December 1\", \"end_date\": \"December 10\"}}."
+)
 
-load_dotenv()
-llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"))
+# Seconds the routing stage may take before the user gets a timeout message
+ROUTING_TIMEOUT = float(os.getenv("ROUTING_TIMEOUT", "60"))
+ROUTING_TIMEOUT_RESPONSE = {"message": "Sorry, this is taking longer than expected. Please try again in a moment."}
 
-def process_input(query):
+# Seconds each separate understanding stage may take before its default is used
+UNDERSTANDING_STAGE_TIMEOUT = float(os.getenv("UNDERSTANDING_STAGE_TIMEOUT", "15"))
+
+# Nodes answering a single-preference query, called with (query, llm)
+QUERY_NODES = {
+    "price_query": handle_price_query,
+    "color_query": get_cars_by_color_with_groq,
+    "location_query": get_cars_by_location_with_groq,
+    "year_query": get_cars_by_year_with_groq,
+    "brand_query": get_models_by_brand_with_groq,
+}
+ASYNC_QUERY_NODES = {
+    "price_query": handle_price_query_async,
+    "color_query": get_cars_by_color_async,
+    "location_query": get_cars_by_location_async,
+    "year_query": get_cars_by_year_async,
+    "brand_query": get_models_by_brand_async,
+}
+
+def process_input(query, understanding=None, session=None):
     """
     Processes the user query by detecting intent and preferences,
     then routes the query to the appropriate agent or node.
+    Accepts a precomputed understanding (see understand_query) so the
+    caller can share a single LLM call with the preferences store.
+    The session holds the booking state of this user; without one the
+    query is handled as the first message of a new conversation.
     """
-    global session_memory
+    if session is None:
+        session = new_session()
 
     # Detect intent and extract preferences
-    intent_data = detect_intent_with_llm(query)
-    intent = extract_intent_from_llm_response(intent_data)
-    preferences = extract_preferences_with_llm(query, llm)
+    if understanding is None:
+        understanding = understand(query)
+    intent = understanding["intent"]
+    preferences = understanding["preferences"]
+
+    route = choose_route(intent, preferences, session)
+    with span("node", route):
+        if route == "booking":
+            return handle_booking_intent(query, preferences, get_llm("enrichment"), session)
+        if route == "recommendation":
+            return recommend_cars_with_groq(preferences, get_llm("enrichment"))
+        if route == "availability_query":
+            return check_availability(preferences)
+        if route in QUERY_NODES:
+            return QUERY_NODES[route](query, get_llm("enrichment"))
+
+        # Fallback message
+        return {"message": render_template("general_help", {})}
+
+async def process_input_async(query, understanding=None, session=None):
+    """
+    Async counterpart of process_input for the async server: LLM calls are
+    awaited and database lookups run on the blocking executor.
+    """
+    if session is None:
+        session = new_session()
+
+    if understanding is None:
+        understanding = await understand_async(query)
+    intent = understanding["intent"]
+    preferences = understanding["preferences"]
+
+    route = choose_route(intent, preferences, session)
+    with span("node", route):
+        if route == "booking":
+            return await handle_booking_intent_async(query, preferences, get_llm("enrichment"), session)
+        if route == "recommendation":
+            return await recommend_cars_async(preferences, get_llm("enrichment"))
+        if route == "availability_query":
+            return await check_availability_async(preferences)
+        if route in ASYNC_QUERY_NODES:
+            return await ASYNC_QUERY_NODES[route](query, get_llm("enrichment"))
 
-    print(f"Detected Intent: {intent}")
-    print(f"Extracted Preferences: {preferences}")
+        return {"message": render_template("general_help", {})}
+
+def show_more(token=None):
+    """
+    Answers a "show more" follow-up, or a continuation token, with the next
+    page of the last list of the session; the query is not understood again.
+    """
+    with span("node", "show_more"):
+        return {"message": render_template(*next_page(token))}
 
-    # Handle active booking session
-    if session_memory["active_booking"]:
-        print("Booking session active. Updating preferences...")
-        for key, value in preferences.items():
-            if value:
-                session_memory["preferences"][key] = value
-        return handle_booking_intent(query, session_memory["preferences"], llm)
+def wants_more(query, token=None):
+    """
+    Checks whether a turn asks for the next page of the last list.
+    """
+    return bool(token) or is_more_request(query or "")
+
+def choose_route(intent, preferences, session):
+    """
+    Picks the agent or node answering a turn: "booking", "recommendation",
+    the intent of a single-preference query, or "general_query".
+    """
+    logger.debug("Detected intent: %s", intent)
+    logger.debug("Extracted preferences: %s", preferences)
+
+    # Handle active booking session; the booking agent merges the new preferences
+    if session["booking"]["active_booking"]:
+        logger.debug("Booking session active. Updating preferences...")
+        return "booking"
 
     # If booking intent, start a booking session
     if intent == "booking":
-        session_memory["active_booking"] = True
-        session_memory["preferences"] = preferences
-        return handle_booking_intent(query, preferences, llm)
+        return "booking"
 
     # Count non-date preferences for recommendation logic
     non_date_preferences = {key: value for key, value in preferences.items() if key not in ["start_date", "end_date"] and value is not None}
     if len(non_date_preferences) >= 2:
-        return recommend_cars_with_groq(preferences, llm)
+        return "recommendation"
 
     # Route based on intent
-    if intent == "availability_query":
-        return check_availability(preferences)
-    elif intent == "price_query":
-        return handle_price_query(query, llm)
-    elif intent == "color_query":
-        return get_cars_by_color_with_groq(query, llm)
-    elif intent == "location_query":
-        return get_cars_by_location_with_groq(query, llm)
-    elif intent == "year_query":
-        return get_cars_by_year_with_groq(query, llm)
-    elif intent == "brand_query":
-        return get_models_by_brand_with_groq(query, llm)
-
-    # Fallback message
-    return {"message": "I'm here to help! You can ask for car prices, availability, or recommendations."}
+    if intent == "availability_query" or intent in QUERY_NODES:
+        return intent
+    return "general_query"
 
 def detect_intent_with_llm(query):
     """
     Detects the user's intent using the LLM by sending the query
     as part of a structured prompt that clarifies the intent categories.
+    Returns an empty answer when the turn is out of LLM budget.
+    """
+    if not reserve_llm_call("intent"):
+        return ""
+    with span("llm", "intent"):
+        response = get_llm("intent").invoke(intent_prompt(query))
+        record_llm_usage(response, "intent")
+
+    logger.debug("Raw intent response: %s", response.content.strip())
+    return response.content.strip()
+
+async def detect_intent_async(query):
+    """
+    Async counterpart of detect_intent_with_llm.
     """
-    messages = [
-        SystemMessage(content=(
-            "You are a car rental assistant. Identify the user's intent and relevant details from their query. "
-            "Possible intents include booking a car, checking car availability (based on month, date, or time frame), "
-            "finding car prices, exploring options by color, finding cars by location, seeking recommendations, "
-            "or inquiring about car brands and models. "
-            "A query mentioning more than one preference (e.g., color, brand, and location) is likely a recommendation_request. "
-            "Respond with only one of these intents: availability_query, price_query, color_query, "
-            "location_query, year_query, recommendation_request, 'booking', or brand_query."
-        )),
-        HumanMessage(content=query)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    prompt_text = prompt.format()
-    response = llm.invoke(prompt_text)
-
-    print(f"Raw Intent Response: {response.content.strip()}")  #
+    if not reserve_llm_call("intent"):
+        return ""
+    with span("llm", "intent"):
+        response = await get_llm("intent").ainvoke(intent_prompt(query))
+        record_llm_usage(response, "intent")
     return response.content.strip()
 
+def intent_prompt(query):
+    """
+    Returns the prompt asking the LLM for the intent of a query.
+    """
+    return format_chat_prompt(INTENT_PROMPT, query)
+
 def extract_intent_from_llm_response(llm_response):
     """
     Extracts the intent from the LLM's response based on exact matches.
     """
-    valid_intents = {
-        "availability_query",
-        "price_query",
-        "color_query",
-        "location_query",
-        "year_query",
-        "recommendation_request",
-        "brand_query",
-        "booking"
-    }
-
     intent = llm_response.lower().strip()
-    return intent if intent in valid_intents else "general_query"
+    return intent if intent in VALID_INTENTS else "general_query"
 
 def extract_preferences_with_llm(query, llm):
     """
     Extracts preferences from the user's query using LLM.
     Handles natural language dates and ensures the current year is added if missing.
+    Returns no preferences when the turn is out of LLM budget.
     """
-    messages = [
-        SystemMessage(content=(
-            "You are a car rental assistant. Analyze the user's query and extract preferences in JSON format. "
-            "Preferences can include 'color', 'location', 'price', 'brand', 'year', 'start_date', or 'end_date'. "
-            "Respond in JSON format, e.g., {\"color\": \"blue\", \"brand\": \"audi\", \"location\": null, \"year\": 2020, \"price\": 100, \"start_date\": \"December 1\", \"end_date\": \"December 10\"}."
-        )),
-        HumanMessage(content=query)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    prompt_text = prompt.format()
+    if not reserve_llm_call("extraction"):
+        return empty_preferences()
+    with span("llm", "extraction"):
+        response = llm.invoke(preferences_prompt(query))
+        record_llm_usage(response, "extraction")
+    return parse_preferences_response(response.content)
 
+async def extract_preferences_async(query, llm):
+    """
+    Async counterpart of extract_preferences_with_llm.
+    """
+    if not reserve_llm_call("extraction"):
+        return empty_preferences()
+    with span("llm", "extraction"):
+        response = await llm.ainvoke(preferences_prompt(query))
+        record_llm_usage(response, "extraction")
+    return parse_preferences_response(response.content)
+
+def preferences_prompt(query):
+    """
+    Returns the prompt asking the LLM for the preferences in a query.
+    """
+    return format_chat_prompt(PREFERENCES_PROMPT, query)
+
+def parse_preferences_response(content):
+    """
+    Parses and normalizes the preferences answered by the LLM.
+    """
     try:
-        response = llm.invoke(prompt_text)
-        preferences = json.loads(response.content.strip())
-        print(f"Raw Preferences from LLM: {preferences}")
+        preferences = parse_json_response(content)
+        logger.debug("Raw preferences from LLM: %s", preferences)
+        return normalize_preferences(preferences)
 
-        current_year = get_current_year()
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning("Error extracting preferences with LLM: %s", e)
+        return empty_preferences()
 
-        if preferences.get("start_date"):
-            preferences["start_date"] = parse_natural_language_date(preferences["start_date"], current_year)
-        if preferences.get("end_date"):
-            preferences["end_date"] = parse_natural_language_date(preferences["end_date"], current_year)
+def understand_query(query, llm):
+    """
+    Single "understanding" stage for a turn: one LLM call that returns the
+    intent together with normalized preferences.
+    Returns None when the LLM answer is not valid JSON so the caller can fall back.
+    """
+    with span("llm", "understanding"):
+        response = llm.invoke(understanding_prompt(query))
+        record_llm_usage(response, "understanding")
+    return parse_understanding_response(response.content)
 
+async def understand_query_async(query, llm):
+    """
+    Async counterpart of understand_query.
+    """
+    with span("llm", "understanding"):
+        response = await llm.ainvoke(understanding_prompt(query))
+        record_llm_usage(response, "understanding")
+    return parse_understanding_response(response.content)
+
+def understanding_prompt(query):
+    """
+    Returns the combined prompt asking the LLM for the intent and the preferences.
+    """
+    return format_chat_prompt(UNDERSTANDING_PROMPT, query)
+
+def parse_understanding_response(content):
+    """
+    Validates the combined understanding answered by the LLM, or returns None.
+    """
+    try:
+        data = parse_json_response(content)
+        logger.debug("Raw understanding response: %s", data)
+        if not isinstance(data, dict) or not isinstance(data.get("preferences", {}), dict):
+            raise ValueError("Understanding response must be a JSON object")
+        return {
+            "intent": extract_intent_from_llm_response(str(data.get("intent") or "")),
+            "preferences": normalize_preferences(data.get("preferences") or {})
+        }
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning("Error parsing understanding response: %s", e)
+        return None
+
+def understand(query):
+    """
+    Returns the understanding (intent and preferences) for a query.
+    Unambiguous queries are answered by the rule-based router without any
+    LLM call, and near duplicates of earlier queries reuse their understanding;
+    otherwise the combined LLM prompt is used, falling back to the separate intent and extraction prompts (run
+    concurrently) if the combined response could not be validated.
+    Turns out of LLM budget keep the best guess of the rule-based router.
+    """
+    with span("understanding") as attributes:
+        attributes["path"] = "fast"
+        understanding = fast_understand(query)
+
+        similar = find_similar_understanding(query) if understanding is None else None
+        if similar is not None and QUERY_CACHE_MODE == "on":
+            attributes["path"] = "similar"
+            understanding = similar
+
+        if understanding is None and reserve_llm_call("understanding"):
+            attributes["path"] = "llm"
+            understanding = understand_query(query, get_llm("understanding"))
+            if understanding is not None:
+                remember_understanding(query, understanding, similar)
+
+        if understanding is None and not fallback_within_budget():
+            attributes["path"] = "rules"
+            understanding = rule_based_understand(query)
+
+        if understanding is None:
+            # Intent and preferences do not depend on each other, run them concurrently
+            attributes["path"] = "fallback"
+            results = run_stages({
+                "intent": stage(detect_intent_with_llm, query, timeout=UNDERSTANDING_STAGE_TIMEOUT, default=""),
+                "preferences": stage(extract_preferences_with_llm, query, get_llm("extraction"), timeout=UNDERSTANDING_STAGE_TIMEOUT, default=empty_preferences()),
+            })
+            intent = extract_intent_from_llm_response(results["intent"])
+            understanding = {"intent": intent, "preferences": results["preferences"]}
+
+        attributes["intent"] = understanding["intent"]
+    return understanding
+
+async def understand_async(query):
+    """
+    Async counterpart of understand: the LLM calls are awaited, and the
+    fallback prompts run concurrently on the event loop.
+    """
+    with span("understanding") as attributes:
+        attributes["path"] = "fast"
+        understanding = await run_blocking(fast_understand, query)
+
+        similar = find_similar_understanding(query) if understanding is None else None
+        if similar is not None and QUERY_CACHE_MODE == "on":
+            attributes["path"] = "similar"
+            understanding = similar
+
+        if understanding is None and reserve_llm_call("understanding"):
+            attributes["path"] = "llm"
+            understanding = await understand_query_async(query, get_llm("understanding"))
+            if understanding is not None:
+                remember_understanding(query, understanding, similar)
+
+        if understanding is None and not fallback_within_budget():
+            attributes["path"] = "rules"
+            understanding = await run_blocking(rule_based_understand, query)
+
+        if understanding is None:
+            attributes["path"] = "fallback"
+            results = await run_stages_async({
+                "intent": stage(detect_intent_async, query, timeout=UNDERSTANDING_STAGE_TIMEOUT, default=""),
+                "preferences": stage(extract_preferences_async, query, get_llm("extraction"), timeout=UNDERSTANDING_STAGE_TIMEOUT, default=empty_preferences()),
+            })
+            intent = extract_intent_from_llm_response(results["intent"])
+            understanding = {"intent": intent, "preferences": results["preferences"]}
+
+        attributes["intent"] = understanding["intent"]
+    return understanding
+
+def fallback_within_budget():
+    """
+    Checks that the turn may still make both fallback calls (intent and extraction).
+    """
+    calls_left = llm_calls_left()
+    return calls_left is None or calls_left >= 2
+
+def parse_json_response(content):
+    """
+    Parses a JSON object from an LLM response, tolerating markdown code fences.
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    return json.loads(text.strip())
+
+def empty_preferences():
+    """
+    Returns a preferences dictionary with every known key unset.
+    """
+    return {key: None for key in PREFERENCE_KEYS}
+
+def normalize_preferences(raw_preferences):
+    """
+    Validates the preferences returned by the LLM: keeps only the known keys,
+    coerces price and year to numbers and parses natural language dates.
+    """
+    preferences = empty_preferences()
+    if not isinstance(raw_preferences, dict):
         return preferences
 
-    except json.JSONDecodeError as e:
-        print(f"Error extracting preferences with LLM: {e}")
-        return {"color": None, "location": None, "price": None, "brand": None, "year": None, "start_date": None, "end_date": None}
+    for key in ["color", "location", "brand"]:
+        value = raw_preferences.get(key)
+        if isinstance(value, str) and value.strip() and value.strip().lower() not in ["null", "none"]:
+            preferences[key] = value.strip()
+
+    try:
+        price = raw_preferences.get("price")
+        if price not in (None, ""):
+            preferences["price"] = float(str(price).replace("$", "").replace(",", "").strip())
+    except ValueError:
+        preferences["price"] = None
+
+    try:
+        year = raw_preferences.get("year")
+        if year not in (None, ""):
+            preferences["year"] = int(str(year).strip())
+    except ValueError:
+        preferences["year"] = None
+
+    current_year = get_current_year()
+    for key in ["start_date", "end_date"]:
+        value = raw_preferences.get(key)
+        if value:
+            preferences[key] = parse_natural_language_date(str(value), current_year)
+
+    return preferences
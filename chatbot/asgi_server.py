@@ -0,0 +1,209 @@
+# asgi_server.py
+"""
+Async server exposing the same routes as server.py. LLM calls are awaited on
+the event loop and database work runs on a bounded pool, so a worker serves
+many conversations waiting on the LLM without a thread for each of them.
+
+Run with: python asgi_server.py  (or: uvicorn asgi_server:app --port 5000)
+"""
+from tools.llm_registry import aclose_llm_clients  # Reads .env before other modules read their settings
+import asyncio
+import copy
+import logging
+import os
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from agents.manager_agent import process_input_async, understand_async, show_more, wants_more, ROUTING_TIMEOUT, ROUTING_TIMEOUT_RESPONSE
+from tools.stats import collect_stats
+from tools.user_preferences import update_preferences, get_preferences
+from tools.pipeline import run_blocking
+from tools.streaming import astream_turn
+from tools.database import start_request_stats, get_request_stats
+from tools.warmup import warmup, WARMUP
+from tools.tracing import configure_logging, start_trace, get_trace, span, render_metrics, TRACE_RESPONSES
+from tools.llm_budget import start_llm_budget, get_llm_budget
+from tools.pagination import start_listings, get_continuation
+from tools.session_store import (
+    open_session_async, read_session, new_session_id, is_valid_session_id,
+    SessionBusy, SESSION_HEADER, SESSION_COOKIE, SESSION_TTL
+)
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+async def chat(request):
+    """
+    Handles chat queries from the user and routes them to the appropriate agent.
+    """
+    body = await request.json()
+    user_message = body.get("message")
+    continuation = body.get("continuation")
+    if not user_message and not continuation:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_id = get_session_id(request)
+    try:
+        response = JSONResponse(await handle_chat_turn_async(user_message, session_id, continuation))
+    except SessionBusy as e:
+        response = JSONResponse({"error": str(e)}, status_code=409)
+    except Exception as e:
+        return JSONResponse({"error": f"An error occurred: {str(e)}"}, status_code=500)
+    return set_session_cookie(response, session_id)
+
+
+async def chat_stream(request):
+    """
+    Same as /chat, but streams the answer as server-sent events (see server.py).
+    """
+    body = await request.json()
+    user_message = body.get("message")
+    continuation = body.get("continuation")
+    if not user_message and not continuation:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_id = get_session_id(request)
+    response = StreamingResponse(
+        astream_turn(handle_chat_turn_async, user_message, session_id, continuation),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    return set_session_cookie(response, session_id)
+
+
+async def handle_chat_turn_async(user_message, session_id, continuation=None):
+    """
+    Runs one chat turn and returns the chatbot response with the preferences.
+    Turns of the same session run one after another; other sessions run concurrently.
+    The LLM calls of the turn are counted against the turn and session budgets.
+    A list longer than a page comes with a continuation for its next page.
+    """
+    start_request_stats()
+    start_trace()
+
+    with span("turn"):
+        async with open_session_async(session_id) as session:
+            start_llm_budget(session)
+            start_listings(session)
+
+            if wants_more(user_message, continuation):
+                # The next page of the last list, without understanding the query
+                response = await run_blocking(show_more, continuation)
+                preferences = get_preferences(session)
+                next_continuation = get_continuation()
+            else:
+                # Detect intent and preferences with a single LLM call
+                understanding = await understand_async(user_message)
+
+                preferences = update_preferences(understanding["preferences"], session)
+                try:
+                    response, working, next_continuation = await asyncio.wait_for(
+                        route_on_copy_async(user_message, understanding, copy.deepcopy(session)), ROUTING_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning("Routing timed out after %ss", ROUTING_TIMEOUT)
+                    response, next_continuation = ROUTING_TIMEOUT_RESPONSE, None
+                else:
+                    # The turn's LLM usage was counted into the session's own totals
+                    working["llm_usage"] = session["llm_usage"]
+                    session.clear()
+                    session.update(working)
+
+    result = {
+        "response": response,
+        "preferences": preferences,
+        "session_id": session_id,
+        "continuation": next_continuation,
+        "database": get_request_stats(),
+        "llm": get_llm_budget()
+    }
+    if TRACE_RESPONSES:
+        result["trace"] = get_trace()
+    return result
+
+
+async def route_on_copy_async(user_message, understanding, session):
+    """
+    Async counterpart of route_on_copy in server.py: routes the query against
+    a copy of the session, so a turn that times out leaves the session as it was.
+    """
+    start_listings(session)
+    return await process_input_async(user_message, understanding, session), session, get_continuation()
+
+
+def get_session_id(request):
+    """
+    Returns the session id sent in the X-Session-ID header or the session
+    cookie, or a new one for a new conversation.
+    """
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if is_valid_session_id(session_id):
+        return session_id
+    return new_session_id()
+
+
+def set_session_cookie(response, session_id):
+    """
+    Keeps the session id in a cookie for browsers that do not send the header.
+    """
+    response.set_cookie(SESSION_COOKIE, session_id, max_age=int(SESSION_TTL), httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = session_id
+    return response
+
+
+async def get_user_preferences(request):
+    """
+    Returns the current preferences of the user's session.
+    """
+    try:
+        session = await run_blocking(read_session, get_session_id(request))
+        return JSONResponse(get_preferences(session))
+    except Exception as e:
+        return JSONResponse({"error": f"An error occurred: {str(e)}"}, status_code=500)
+
+
+async def get_stats(request):
+    """
+    Returns the same counters as the /stats route of server.py.
+    """
+    return JSONResponse(await run_blocking(collect_stats))
+
+
+async def get_metrics(request):
+    """
+    Returns the same metrics as the /metrics route of server.py.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Build the entity vocabulary and extractor and load the LLM clients before the first request
+    if WARMUP:
+        await run_blocking(warmup)
+    yield
+    await aclose_llm_clients()
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/preferences", get_user_preferences, methods=["GET"]),
+        Route("/stats", get_stats, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=[SESSION_HEADER])
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=int(os.getenv("PORT", "5000")))
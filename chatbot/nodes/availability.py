@@ -1,10 +1,20 @@
 
 
+import logging
 import sqlite3
-from datetime import datetime
+from tools.database import to_day_number
+from tools.pagination import list_cars
 from tools.helpers import parse_natural_language_date, get_current_year
+from tools.rendering import render_template
+from tools.pipeline import run_blocking
 
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
+logger = logging.getLogger(__name__)
+
+async def check_availability_async(preferences):
+    """
+    Async counterpart of check_availability; its answers are all templates.
+    """
+    return await run_blocking(check_availability, preferences)
 
 def check_availability(preferences):
     """
@@ -14,7 +24,7 @@ def check_availability(preferences):
     raw_start_date = preferences.get("start_date")
     raw_end_date = preferences.get("end_date")
 
-    print(f"Raw Start Date: {raw_start_date}, Raw End Date: {raw_end_date}")
+    logger.debug("Raw Start Date: %s, Raw End Date: %s", raw_start_date, raw_end_date)
 
     # Use current year if not explicitly provided
     current_year = get_current_year()
@@ -22,53 +32,39 @@ def check_availability(preferences):
     try:
         # Handle missing dates
         if not raw_start_date or not raw_end_date:
-            return {"message": "Please specify valid start and end dates in YYYY-MM-DD format or natural language."}
+            return {"message": render_template("availability_missing_dates", {})}
 
         # Parse the dates
         start_date = parse_natural_language_date(raw_start_date, current_year)
         end_date = parse_natural_language_date(raw_end_date, current_year)
 
-        print(f"Parsed Start Date: {start_date}, Parsed End Date: {end_date}")
+        logger.debug("Parsed Start Date: %s, Parsed End Date: %s", start_date, end_date)
 
         if not start_date or not end_date:
-            return {"message": "Please specify valid start and end dates in YYYY-MM-DD format or natural language."}
+            return {"message": render_template("availability_missing_dates", {})}
+
+        # Day numbers used by the availability index; fails on invalid dates
+        to_day_number(start_date)
+        to_day_number(end_date)
 
     except Exception as e:
-        return {"message": f"Error processing dates: {str(e)}"}
+        logger.warning("Error processing dates: %s", e)
+        return {"message": render_template("availability_date_error", {})}
 
-    # Query the database
+    # Cars of a shop with an availability window overlapping the dates, one page at a time
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-
-        sql_query = """
-        SELECT Cars.Model, Cars.Brand, Cars.Year, Cars.Color, Cars.PricePerDay, Shop.Location
-        FROM Cars
-        INNER JOIN Shop ON Cars.ShopID = Shop.ShopID
-        INNER JOIN CarAvailability ON Cars.CarID = CarAvailability.CarID
-        WHERE CarAvailability.StartDate <= ? AND CarAvailability.EndDate >= ?
-        """
-        print("Executing SQL Query:", sql_query)
-        print("Query Parameters:", (end_date, start_date))
-
-        # Execute the query with parsed dates
-        cursor.execute(sql_query, (end_date, start_date))
-        results = cursor.fetchall()
-
-        print("Query Results:", results)
+        search = {"kind": "cars", "preferences": {"start_date": start_date, "end_date": end_date}}
+        cars, total = list_cars(search)
+        logger.debug("Available cars: %d", total)
 
     except sqlite3.Error as e:
-        return {"message": f"Database error: {e}"}
-
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return {"message": render_template("database_error", {})}
 
     # Format and return the results
-    if results:
-        cars = [
-            f"{car[1]} {car[0]} ({car[2]}, {car[3]} color) - ${car[4]:.2f}/day in {car[5]}"
-            for car in results
-        ]
-        return {"message": "Here are the available cars:\n" + "\n".join(cars)}
-
-    return {"message": f"No cars are available from {start_date} to {end_date}."}
+    context = {"start_date": start_date, "end_date": end_date}
+    if cars:
+        context.update(cars=cars, total=total)
+        return {"message": render_template("availability_cars", context)}
+
+    return {"message": render_template("availability_none", context)}
@@ -1,66 +1,56 @@
 # brand.py
+import logging
 import sqlite3
-from langchain_groq import ChatGroq
-from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
+from tools.pagination import list_cars
+from tools.rendering import render_reply, render_reply_async
+from tools.pipeline import run_blocking
+from tools.entity_extractor import find_entity
 
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
+logger = logging.getLogger(__name__)
+
+# Details of the cars listed for a brand
+BRAND_FIELDS = ("brand", "model", "year", "color")
 
 def get_models_by_brand_with_groq(query, llm):
     """
     Handles brand-based queries using the database and LLM for enriched responses.
     """
+    template, context = find_models_by_brand(query)
+    return render_reply("brand_query", template, context, llm)
+
+async def get_models_by_brand_async(query, llm):
+    """
+    Async counterpart of get_models_by_brand_with_groq.
+    """
+    template, context = await run_blocking(find_models_by_brand, query)
+    return await render_reply_async("brand_query", template, context, llm)
+
+def find_models_by_brand(query):
+    """
+    Looks up the models of the brand named in the query.
+    Returns the template of the answer and its context.
+    """
     # Detect the brand from the  query
     brand = detect_brand_in_query(query)
     if not brand:
-        return enrich_response_with_llm("Please specify a valid brand in your query. For example, BMW, Tesla, or Toyota.", llm)
+        return "brand_missing", {}
 
-    #  car models from the specified brand
+    #  car models from the specified brand, one page at a time
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT Model, Year, Color FROM Cars WHERE Brand = ?", (brand,))
-        results = cursor.fetchall()
+        cars, total = list_cars({"kind": "cars", "preferences": {"brand": brand}, "require_shop": False}, BRAND_FIELDS)
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
     # Format and return the response
-    if results:
-        cars = [f"{car[0]} ({car[1]}, {car[2]} color)" for car in results]
-        return enrich_response_with_llm(f"Cars by {brand}: {', '.join(cars)}.", llm)
-    return enrich_response_with_llm(f"No cars available by {brand}.", llm)
+    if cars:
+        return "brand_cars", {"brand": brand, "cars": cars, "total": total}
+    return "brand_no_cars", {"brand": brand}
 
 def detect_brand_in_query(query):
     """
     Detects a brand in the user's query by matching it against database values.
     """
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT Brand FROM Cars")
-        brands = [row[0] for row in cursor.fetchall()] 
-    except sqlite3.Error as e:
-        return None
-    finally:
-        conn.close()
-
-    # Caseinsensitive matching
-    query_lower = query.lower()
-    for brand in brands:
-        if brand.lower() in query_lower:
-            return brand  # Return the original case from the database
-    return None
-
-def enrich_response_with_llm(base_response, llm):
-    """
-    Enhances the base response using the LLM for a conversational tone.
-    """
-    messages = [
-        SystemMessage(content="You are a car rental assistant. Respond to the user's query with concise details. If you give several options do not list the options with numbers, just give each option as a sentence. And be supportive if needed something else."),
-        HumanMessage(content=base_response)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    prompt_text = prompt.format()
-    response = llm.invoke(prompt_text)
-    return response.content
+    # Caseinsensitive matching on word boundaries
+    entity = find_entity(query, "brand")
+    return entity["value"] if entity else None  # Return the original case from the database
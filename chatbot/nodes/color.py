@@ -1,55 +1,60 @@
 # color.py
+import logging
 import sqlite3
-from langchain_groq import ChatGroq
-from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
+from tools.pagination import list_cars
+from tools.rendering import render_reply, render_reply_async
+from tools.pipeline import run_blocking
+from tools.entity_extractor import find_entity
 
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
+logger = logging.getLogger(__name__)
+
+COLOR_ENRICHMENT_PROMPT = (
+    "You are a car rental assistant. Respond to the user's query with concise details. "
+    "Do not give extra information if not needed. "
+    "If you give several options do not list the options with numbers, just give each option as a sentence. "
+    "And be supportive if needed something else."
+)
+
+# Details of the cars listed for a color
+COLOR_FIELDS = ("model", "brand", "year", "price")
 
 def get_cars_by_color_with_groq(query, llm):
     """
     Handles color-based queries using the database and LLM for enriched responses.
     """
+    template, context = find_cars_by_color(query)
+    return render_reply("color_query", template, context, llm, COLOR_ENRICHMENT_PROMPT)
+
+async def get_cars_by_color_async(query, llm):
+    """
+    Async counterpart of get_cars_by_color_with_groq.
+    """
+    template, context = await run_blocking(find_cars_by_color, query)
+    return await render_reply_async("color_query", template, context, llm, COLOR_ENRICHMENT_PROMPT)
+
+def find_cars_by_color(query):
+    """
+    Looks up the cars of the color named in the query.
+    Returns the template of the answer and its context.
+    """
     color = detect_color_in_query(query)
     if not color:
-        return enrich_response_with_llm("Please specify a color in your query.", llm)
+        return "color_missing", {}
 
-    #  database for cars with the specified color
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT Model, Brand, Year, PricePerDay FROM Cars WHERE Color = ?", (color.capitalize(),))
-    results = cursor.fetchall()
-    conn.close()
+    #  cars with the specified color, one page at a time
+    try:
+        cars, total = list_cars({"kind": "cars", "preferences": {"color": color}, "require_shop": False}, COLOR_FIELDS)
+    except sqlite3.Error as e:
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
-    if results:
-        cars = [f"{car[0]} ({car[1]}, {car[2]}) - ${car[3]:.2f} per day" for car in results]
-        base_response = f"Here are the cars available in {color.capitalize()}:\n" + "\n".join(cars)
-        return enrich_response_with_llm(base_response, llm)
-    return enrich_response_with_llm(f"No cars available in {color.capitalize()}.", llm)
+    if cars:
+        return "color_cars", {"color": color.capitalize(), "cars": cars, "total": total}
+    return "color_no_cars", {"color": color.capitalize()}
 
 def detect_color_in_query(query):
     """
     Detects a color in the user's query by matching it against database values.
     """
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT Color FROM Cars")
-    colors = [row[0].lower() for row in cursor.fetchall()]
-    conn.close()
-
-    for color in colors:
-        if color in query.lower():
-            return color
-    return None
-
-def enrich_response_with_llm(base_response, llm):
-    """
-    Enhances the base response using the LLM for a more conversational tone.
-    """
-    messages = [
-        SystemMessage(content="You are a car rental assistant. Respond to the user's query with concise details. Do not give extra information if not needed. If you give several options do not list the options with numbers, just give each option as a sentence. And be supportive if needed something else."),
-        HumanMessage(content=base_response)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    prompt_text = prompt.format()
-    response = llm.invoke(prompt_text)
-    return response.content
+    entity = find_entity(query, "color")
+    return entity["value"].lower() if entity else None
@@ -1,82 +1,62 @@
 # location.py
+import logging
 import sqlite3
-from langchain_groq import ChatGroq
-from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
-from dotenv import load_dotenv
-import os
+from tools.pagination import list_cars
+from tools.rendering import render_reply, render_reply_async
+from tools.pipeline import run_blocking
+from tools.vocabulary import get_terms
+from tools.entity_extractor import find_entity
 
+logger = logging.getLogger(__name__)
 
-load_dotenv()
-llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"))
+# Details of the cars listed for a location
+LOCATION_FIELDS = ("model", "brand", "year", "color")
 
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
 
 def get_cars_by_location_with_groq(query, llm):
     """
     Handles location-based queries using the database and LLM for enriched responses.
     """
+    template, context = find_cars_by_location(query)
+    return render_reply("location_query", template, context, llm)
+
+async def get_cars_by_location_async(query, llm):
+    """
+    Async counterpart of get_cars_by_location_with_groq.
+    """
+    template, context = await run_blocking(find_cars_by_location, query)
+    return await render_reply_async("location_query", template, context, llm)
+
+def find_cars_by_location(query):
+    """
+    Looks up the cars at the location named in the query.
+    Returns the template of the answer and its context.
+    """
     location, available_locations = detect_location_in_query(query)
     if not location:
         # Respond with available locations if the queried location is not found
-        locations_list = ', '.join([loc.capitalize() for loc in available_locations])
-        return enrich_response_with_llm(
-            f"We currently don't have any shops in the specified location. "
-            f"Our available shops are in: {locations_list}.", llm
-        )
+        locations = [loc.title() for loc in available_locations]
+        return "location_unknown", {"locations": locations}
 
-    # Query th for cars available at the specified location
+    # Cars available at the specified location (case-insensitive), one page at a time
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        sql_query = """
-            SELECT Cars.Model, Cars.Brand, Cars.Year, Cars.Color
-            FROM Cars
-            JOIN Shop ON Cars.ShopID = Shop.ShopID
-            WHERE LOWER(Shop.Location) = ?
-        """
-        cursor.execute(sql_query, (location.lower(),))  #  caseinsensitive matching
-        results = cursor.fetchall()
+        cars, total = list_cars({"kind": "cars", "preferences": {"location": location}}, LOCATION_FIELDS)
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
     # Format and return the response
-    if results:
-        cars = [f"{car[0]} ({car[1]}, {car[2]}) - {car[3]} color" for car in results]
-        return enrich_response_with_llm(f"Cars available in {location.capitalize()}: {', '.join(cars)}.", llm)
-    return enrich_response_with_llm(f"No cars are available in {location.capitalize()}.", llm)
+    if cars:
+        return "location_cars", {"location": location.title(), "cars": cars, "total": total}
+    return "location_no_cars", {"location": location.title()}
 
 def detect_location_in_query(query):
     """
     Detects a location in the user's query by matching it against database values.
     Returns the detected location and the list of all available locations.
     """
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT LOWER(Location) FROM Shop")
-        locations = [row[0] for row in cursor.fetchall()]  
-    except sqlite3.Error as e:
-        return None, []
-    finally:
-        conn.close()
-
-    query_lower = query.lower()
-    for location in locations:
-        if location in query_lower:
-            return location.capitalize(), locations  # Return found location and all available locations
-    return None, locations  
-
-def enrich_response_with_llm(base_response, llm):
-    """
-    Enhances the base response using the LLM for a conversational tone.
-    """
-    messages = [
-        SystemMessage(content="You are a car rental assistant. Respond to the user's query with concise details. If you give several options do not list the options with numbers, just give each option as a sentence. And be supportive if needed something else."),
-        HumanMessage(content=base_response)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    prompt_text = prompt.format()
-    response = llm.invoke(prompt_text)
-    return response.content
+    locations = [location.lower() for location in get_terms("locations")]
+    entity = find_entity(query, "location")
+    if entity:
+        return entity["value"].lower().capitalize(), locations  # Return found location and all available locations
+    return None, locations
@@ -1,198 +1,137 @@
 # price.py
+import logging
 import sqlite3
-from langchain_groq import ChatGroq
-from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
-from dotenv import load_dotenv
-import os
+from tools.database import fetch_one
+from tools.pagination import list_cars
+from tools.rendering import render_reply, render_reply_async
+from tools.pipeline import run_blocking
+from tools.helpers import detect_car_brand_in_query, detect_car_model_in_query
+from tools.entity_extractor import find_entity
 
+logger = logging.getLogger(__name__)
 
-load_dotenv()
-llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"))
+# Details of the cars listed by the price filters, from the cheapest
+PRICE_FIELDS = ("model", "brand", "year", "price")
+
+# Details of the models listed with the prices of a brand, in CarID order
+BRAND_PRICE_FIELDS = ("model", "brand", "price")
 
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
 
 def handle_price_query(query, llm):
     """
     Handles price-related queries using the database and LLM.
     """
+    template, context = find_price_answer(query)
+    return render_reply("price_query", template, context, llm)
+
+async def handle_price_query_async(query, llm):
+    """
+    Async counterpart of handle_price_query.
+    """
+    template, context = await run_blocking(find_price_answer, query)
+    return await render_reply_async("price_query", template, context, llm)
+
+def find_price_answer(query):
+    """
+    Looks up the prices asked for in the query.
+    Returns the template of the answer and its context.
+    """
     # Detect price range and filter type from query
     price_threshold, filter_type = detect_price_in_query(query)
     
     if price_threshold is not None:
         if filter_type == "below":
-            return get_cars_below_or_equal_price(price_threshold, llm)
+            return get_cars_below_or_equal_price(price_threshold)
         elif filter_type == "above":
-            return get_cars_above_price(price_threshold, llm)
-        elif filter_type == "costs":
-            return get_cars_with_exact_price(price_threshold, llm)
+            return get_cars_above_price(price_threshold)
+        elif filter_type == "exact":
+            return get_cars_with_exact_price(price_threshold)
 
     car_brand = detect_car_brand_in_query(query)
     car_model = detect_car_model_in_query(query)
 
     if car_model:
-        return get_price_by_model(car_model, llm)
+        return get_price_by_model(car_model)
     elif car_brand:
-        return get_prices_by_brand(car_brand, llm)
+        return get_prices_by_brand(car_brand)
     else:
-        return enrich_response_with_llm(
-            "Please specify a car brand, model, or price range to provide price information.", llm
-        )
+        return "price_missing", {}
 
-def get_cars_below_or_equal_price(price_threshold, llm):
+def get_cars_below_or_equal_price(price_threshold):
     """Fetches cars with a daily price below or equal to the given threshold."""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        sql_query = "SELECT Model, Brand, Year, PricePerDay FROM Cars WHERE PricePerDay <= ?"
-        cursor.execute(sql_query, (price_threshold,))
-        results = cursor.fetchall()
+        cars, total = list_cars({"kind": "price", "filter": "below", "price": price_threshold}, PRICE_FIELDS)
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
-    if results:
-        cars = [f"{car[0]} ({car[1]}, {car[2]}) - ${car[3]:.2f} per day" for car in results]
-        base_response = f"Here are the cars available under or equal to ${price_threshold:.2f} per day:\n" + "\n".join(cars)
-        return enrich_response_with_llm(base_response, llm)
-    return enrich_response_with_llm(f"No cars are available under or equal to ${price_threshold:.2f} per day.", llm)
+    context = {"comparison": "under or equal to", "price": price_threshold}
+    if cars:
+        context.update(cars=cars, total=total)
+        return "price_filter", context
+    return "price_filter_none", context
 
-def get_cars_above_price(price_threshold, llm):
+def get_cars_above_price(price_threshold):
     """Fetches cars with a daily price above the given threshold."""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        sql_query = "SELECT Model, Brand, Year, PricePerDay FROM Cars WHERE PricePerDay > ?"
-        cursor.execute(sql_query, (price_threshold,))
-        results = cursor.fetchall()
+        cars, total = list_cars({"kind": "price", "filter": "above", "price": price_threshold}, PRICE_FIELDS)
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
-    if results:
-        cars = [f"{car[0]} ({car[1]}, {car[2]}) - ${car[3]:.2f} per day" for car in results]
-        base_response = f"Here are the cars available above ${price_threshold:.2f} per day:\n" + "\n".join(cars)
-        return enrich_response_with_llm(base_response, llm)
-    return enrich_response_with_llm(f"No cars are available above ${price_threshold:.2f} per day.", llm)
+    context = {"comparison": "above", "price": price_threshold}
+    if cars:
+        context.update(cars=cars, total=total)
+        return "price_filter", context
+    return "price_filter_none", context
 
-def get_cars_with_exact_price(price_threshold, llm):
+def get_cars_with_exact_price(price_threshold):
     """Fetches cars with a daily price exactly equal to the given threshold."""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        sql_query = "SELECT Model, Brand, Year, PricePerDay FROM Cars WHERE PricePerDay = ?"
-        cursor.execute(sql_query, (price_threshold,))
-        results = cursor.fetchall()
+        cars, total = list_cars({"kind": "price", "filter": "exact", "price": price_threshold}, PRICE_FIELDS)
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
-
-    if results:
-        cars = [f"{car[0]} ({car[1]}, {car[2]}) - ${car[3]:.2f} per day" for car in results]
-        base_response = f"Here are the cars available for exactly ${price_threshold:.2f} per day:\n" + "\n".join(cars)
-        return enrich_response_with_llm(base_response, llm)
-    return enrich_response_with_llm(f"No cars are available for exactly ${price_threshold:.2f} per day.", llm)
-
-def get_price_by_model(car_model, llm):
-    """Fetches price for a specific car model and uses LLM to enrich the response."""
+        logger.error("Database error: %s", e)
+        return "database_error", {}
+
+    context = {"comparison": "exactly", "price": price_threshold}
+    if cars:
+        context.update(cars=cars, total=total)
+        return "price_filter", context
+    return "price_filter_none", context
+
+def get_price_by_model(car_model):
+    """Fetches the daily price of a specific car model."""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT PricePerDay, PriceIfMonth FROM Cars WHERE LOWER(Model) = ?", (car_model.lower(),))
-        result = cursor.fetchone()
+        result = fetch_one("SELECT PricePerDay FROM Cars WHERE Model = ? COLLATE NOCASE", (car_model,))
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
     if result:
-        daily_price, monthly_price = result
-        base_response = f"The price for {car_model.capitalize()} is ${daily_price:.2f} per day or ${monthly_price:.2f} per month."
-        return enrich_response_with_llm(base_response, llm)
-    return enrich_response_with_llm(f"Price information for {car_model.capitalize()} is not available.", llm)
+        # The schema has no monthly price; the template only mentions one when given
+        context = {"model": car_model.capitalize(), "daily_price": result[0]}
+        return "price_model", context
+    return "price_model_none", {"model": car_model.capitalize()}
 
-def get_prices_by_brand(car_brand, llm):
-    """Fetches prices for all models of a given brand and uses LLM to enrich the response."""
+def get_prices_by_brand(car_brand):
+    """Fetches the prices of the models of a given brand, one page at a time."""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT Model, PricePerDay, PriceIfMonth FROM Cars WHERE LOWER(Brand) = ?", (car_brand.lower(),))
-        results = cursor.fetchall()
+        search = {"kind": "cars", "preferences": {"brand": car_brand}, "require_shop": False}
+        cars, total = list_cars(search, BRAND_PRICE_FIELDS)
     except sqlite3.Error as e:
-        return f"Database error: {e}"
-    finally:
-        conn.close()
+        logger.error("Database error: %s", e)
+        return "database_error", {}
 
-    if results:
-        cars = [f"{car[0]}: ${car[1]:.2f}/day, ${car[2]:.2f}/month" for car in results]
-        base_response = f"Here are the prices for {car_brand.capitalize()} models:\n" + "\n".join(cars)
-        return enrich_response_with_llm(base_response, llm)
-    return enrich_response_with_llm(f"No pricing information available for {car_brand.capitalize()}.", llm)
+    if cars:
+        return "price_brand", {"brand": car_brand.capitalize(), "cars": cars, "total": total}
+    return "price_brand_none", {"brand": car_brand.capitalize()}
 
 def detect_price_in_query(query):
     """
     Detects a price threshold and filter type (below, above, exact) in the user's query.
     Examples: 'under 70', 'below 100', 'cheaper than 50', 'above 100', 'for 70'.
     """
-    import re
-    # Match for phrases 
-    match = re.search(r'\b(under|below|less than|cheaper than|above|for)\s(\d+)', query.lower())
-    if match:
-        filter_type = match.group(1)
-        price = float(match.group(2))
-        if filter_type in ["under", "below", "less than", "cheaper than"]:
-            return price, "below"
-        elif filter_type == "above":
-            return price, "above"
-        elif filter_type == "for":
-            return price, "exact"
+    entity = find_entity(query, "price")
+    if entity:
+        return entity["value"], entity["filter"]
     return None, None
-
-def detect_car_model_in_query(query):
-    """Detects car model in the query based on database records."""
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT Model FROM Cars")
-        models = [row[0].lower() for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        return None
-    finally:
-        conn.close()
-
-    for model in models:
-        if model in query.lower():
-            return model.capitalize()
-    return None
-
-def detect_car_brand_in_query(query):
-    """Detects car brand in the query based on database records."""
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT Brand FROM Cars")
-        brands = [row[0].lower() for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        return None
-    finally:
-        conn.close()
-
-    for brand in brands:
-        if brand in query.lower():
-            return brand.capitalize()
-    return None
-
-def enrich_response_with_llm(base_response, llm):
-    """
-    Enhances the base response using the LLM for a conversational tone.
-    """
-    messages = [
-        SystemMessage(content="You are a car rental assistant. Respond to the user's query with concise details. If you give several options do not list the options with numbers, just give each option as a sentence. And be supportive if needed something else."),
-        HumanMessage(content=base_response)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    prompt_text = prompt.format()
-    response = llm.invoke(prompt_text)
-    return response.content
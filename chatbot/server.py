@@ -1,53 +1,178 @@
-from flask import Flask, request, jsonify
+import tools.llm_registry  # Reads .env before other modules read their settings
+import copy
+import logging
+from concurrent.futures import TimeoutError
+from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
-from agents.manager_agent import process_input  # For routing queries to the appropriate agent
-from tools.user_preferences import update_preferences_from_query, get_preferences
-from agents.recommendation_agent import recommend_cars_with_groq
-from langchain_groq import ChatGroq
-from dotenv import load_dotenv
-import os
+from agents.manager_agent import process_input, understand, show_more, wants_more, ROUTING_TIMEOUT, ROUTING_TIMEOUT_RESPONSE  # For routing queries to the appropriate agent
+from tools.user_preferences import update_preferences, get_preferences
+from tools.pipeline import submit
+from tools.streaming import stream_turn
+from tools.database import start_request_stats, get_request_stats
+from tools.stats import collect_stats
+from tools.warmup import warmup, WARMUP
+from tools.tracing import configure_logging, start_trace, get_trace, span, render_metrics, TRACE_RESPONSES
+from tools.llm_budget import start_llm_budget, get_llm_budget
+from tools.pagination import start_listings, get_continuation
+from tools.session_store import (
+    open_session, read_session, new_session_id, is_valid_session_id,
+    SessionBusy, SESSION_HEADER, SESSION_COOKIE, SESSION_TTL
+)
 
-# Load environment variables
-load_dotenv()
-llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"))
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app)  # cross origin
+CORS(app, expose_headers=[SESSION_HEADER])  # cross origin
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """
     Handles chat queries from the user and routes them to the appropriate agent.
+    A "continuation" token returned with a list fetches its next page.
     """
     user_message = request.json.get("message")
-    if not user_message:
+    continuation = request.json.get("continuation")
+    if not user_message and not continuation:
         return jsonify({"error": "No message provided"}), 400
 
+    session_id = get_session_id()
     try:
-        # Update user preferences
-        preferences = update_preferences_from_query(user_message, llm)
-
-        # Process query and route to the appropriate agent
-        response = process_input(user_message)
-
-        #   chatbot response and preferences for debugging
-        return jsonify({
-            "response": response,
-            "preferences": preferences
-        })
+        response = jsonify(handle_chat_turn(user_message, session_id, continuation))
+    except SessionBusy as e:
+        response = jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+    return set_session_cookie(make_response(response), session_id)
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Same as /chat, but streams the answer as server-sent events: "token"
+    events while the LLM generates, "car_details" as soon as a booking
+    option is found and a final "done" event with the full response.
+    """
+    user_message = request.json.get("message")
+    continuation = request.json.get("continuation")
+    if not user_message and not continuation:
+        return jsonify({"error": "No message provided"}), 400
+
+    session_id = get_session_id()
+    response = Response(
+        stream_turn(handle_chat_turn, user_message, session_id, continuation),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    return set_session_cookie(response, session_id)
+
+def handle_chat_turn(user_message, session_id, continuation=None):
+    """
+    Runs one chat turn and returns the chatbot response with the preferences.
+    Turns of the same session run one after another; other sessions run concurrently.
+    The LLM calls of the turn are counted against the turn and session budgets.
+    A list longer than a page comes with a continuation for its next page.
+    """
+    start_request_stats()
+    start_trace()
+
+    with span("turn"), open_session(session_id) as session:
+        start_llm_budget(session)
+        start_listings(session)
+
+        if wants_more(user_message, continuation):
+            # The next page of the last list, without understanding the query
+            response = show_more(continuation)
+            preferences = get_preferences(session)
+            next_continuation = get_continuation()
+        else:
+            # Detect intent and preferences with a single LLM call
+            understanding = understand(user_message)
+            preferences = update_preferences(understanding["preferences"], session)
+
+            # Route the query to the appropriate agent; only a timeout gives the
+            # default answer, any other error fails the turn
+            future, cancel_event = submit(route_on_copy, user_message, understanding, copy.deepcopy(session))
+            try:
+                response, working, next_continuation = future.result(timeout=ROUTING_TIMEOUT)
+            except TimeoutError:
+                logger.warning("Routing timed out after %ss", ROUTING_TIMEOUT)
+                cancel_event.set()
+                response, next_continuation = ROUTING_TIMEOUT_RESPONSE, None
+            else:
+                # The turn's LLM usage was counted into the session's own totals
+                working["llm_usage"] = session["llm_usage"]
+                session.clear()
+                session.update(working)
+
+    #   chatbot response and preferences for debugging
+    result = {
+        "response": response,
+        "preferences": preferences,
+        "session_id": session_id,
+        "continuation": next_continuation,
+        "database": get_request_stats(),
+        "llm": get_llm_budget()
+    }
+    if TRACE_RESPONSES:
+        result["trace"] = get_trace()
+    return result
+
+def route_on_copy(user_message, understanding, session):
+    """
+    Routes the query against a copy of the session and returns the response,
+    the updated copy and the continuation of its list. A turn that times out
+    leaves its copy behind, so it cannot change the session once it has
+    been saved and released.
+    """
+    start_listings(session)
+    return process_input(user_message, understanding, session), session, get_continuation()
+
+def get_session_id():
+    """
+    Returns the session id sent in the X-Session-ID header or the session
+    cookie, or a new one for a new conversation.
+    """
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if is_valid_session_id(session_id):
+        return session_id
+    return new_session_id()
+
+def set_session_cookie(response, session_id):
+    """
+    Keeps the session id in a cookie for browsers that do not send the header.
+    """
+    response.set_cookie(SESSION_COOKIE, session_id, max_age=int(SESSION_TTL), httponly=True, samesite="Lax")
+    response.headers[SESSION_HEADER] = session_id
+    return response
 
 @app.route('/preferences', methods=['GET'])
 def get_user_preferences():
     """
-    Returns the current user preferences.
+    Returns the current preferences of the user's session.
     """
     try:
-        preferences = get_preferences()
+        preferences = get_preferences(read_session(get_session_id()))
         return jsonify(preferences)
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Returns the routing counters, including the fast-path hit rate,
+    the response cache statistics, the rendering counters, the database counters, the vocabulary and extractor counters, the session store and the LLM clients.
+    """
+    return jsonify(collect_stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Returns the stage durations, errors, LLM tokens and cache hit rates
+    in the Prometheus text format.
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 if __name__ == '__main__':
+    # Build the entity vocabulary and extractor and load the LLM clients before the first request
+    if WARMUP:
+        warmup()
     app.run(debug=True, port=5000)
@@ -0,0 +1,262 @@
+# database.py
+import logging
+import contextvars
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from urllib.parse import quote
+from dotenv import load_dotenv
+from tools.tracing import span, is_tracing
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Database location and tuning, configured from the environment
+DATABASE_PATH = os.path.abspath(os.getenv(
+    "RENTAL_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "rental_car.db")
+))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(64 * 1024)))
+# Size of each connection's prepared statement cache (keyed by SQL text)
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "256"))
+
+# Versioned schema changes, applied in order on startup (see apply_migrations)
+MIGRATIONS_PATH = os.path.abspath(os.getenv(
+    "RENTAL_DB_MIGRATIONS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "migrations")
+))
+
+# Julian day number of 0001-01-01, the first proleptic Gregorian ordinal
+JULIAN_DAY_OFFSET = 1721425
+
+# One read-only and one read-write connection per thread
+_local = threading.local()
+_configure_lock = threading.Lock()
+_configured = False
+
+# Dedicated connection used to notice commits from other connections and processes
+_version_conn = None
+_version_lock = threading.Lock()
+_last_data_version = None
+_inventory_version = None
+
+# Counters for the current request; a dictionary shared by the stages of a turn
+_request_stats = contextvars.ContextVar("db_request_stats", default=None)
+_stats_lock = threading.Lock()
+database_stats = {"queries": 0, "connections": 0}
+
+
+def configure_database():
+    """
+    Applies the persistent database settings and pending migrations once per
+    process: WAL mode lets readers keep going while the inventory is being written.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        try:
+            conn = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            apply_migrations(conn)
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error("Could not configure the database: %s", e)
+        _configured = True
+
+
+def apply_migrations(conn):
+    """
+    Applies the migrations in MIGRATIONS_PATH that are newer than the database.
+    Files are named like 0002_lookup_indexes.sql; PRAGMA user_version holds the
+    number of the last one applied, and each file runs in its own transaction.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, path in list_migrations():
+        if number <= current:
+            continue
+        with open(path, encoding="utf-8") as f:
+            script = f.read()
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        logger.info("Applied migration %s", os.path.basename(path))
+        current = number
+    return current
+
+
+def list_migrations():
+    """
+    Returns (number, path) for every migration file, in order.
+    """
+    if not os.path.isdir(MIGRATIONS_PATH):
+        return []
+    migrations = []
+    for name in os.listdir(MIGRATIONS_PATH):
+        number = name.split("_", 1)[0]
+        if name.endswith(".sql") and number.isdigit():
+            migrations.append((int(number), os.path.join(MIGRATIONS_PATH, name)))
+    return sorted(migrations)
+
+
+def get_connection(readonly=True):
+    """
+    Returns this thread's connection, opening it on first use.
+    Lookups use a read-only URI connection; writes get a separate one.
+    """
+    attribute = "readonly_conn" if readonly else "write_conn"
+    conn = getattr(_local, attribute, None)
+    if conn is not None:
+        return conn
+
+    configure_database()
+    if readonly:
+        uri = f"file:{quote(DATABASE_PATH)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    setattr(_local, attribute, conn)
+    _count("connections")
+    return conn
+
+
+def close_connections():
+    """
+    Closes this thread's connections, e.g., when a worker shuts down.
+    """
+    for attribute in ["readonly_conn", "write_conn"]:
+        conn = getattr(_local, attribute, None)
+        if conn is not None:
+            conn.close()
+            setattr(_local, attribute, None)
+
+
+def fetch_all(sql, params=()):
+    """
+    Runs a read-only query and returns all rows.
+    """
+    _count("queries")
+    with span("sql", **_describe(sql)) as attributes:
+        rows = get_connection().execute(sql, params).fetchall()
+        attributes["rows"] = len(rows)
+    return rows
+
+
+def fetch_one(sql, params=()):
+    """
+    Runs a read-only query and returns the first row, or None.
+    """
+    _count("queries")
+    with span("sql", **_describe(sql)):
+        return get_connection().execute(sql, params).fetchone()
+
+
+def execute_write(sql, params=()):
+    """
+    Runs a statement on the read-write connection and commits it.
+    """
+    _count("queries")
+    with span("sql", **_describe(sql)) as attributes:
+        conn = get_connection(readonly=False)
+        with conn:
+            attributes["rows"] = conn.execute(sql, params).rowcount
+    return attributes["rows"]
+
+
+def _describe(sql):
+    """
+    Returns the span attributes of a statement; the text only goes into traced turns.
+    """
+    return {"statement": " ".join(sql.split())[:300]} if is_tracing() else {}
+
+
+def to_day_number(value):
+    """
+    Returns the Julian day number of a date, datetime or "YYYY-MM-DD" string,
+    as stored in AvailabilityIndex.
+    """
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal() + JULIAN_DAY_OFFSET
+
+
+def get_inventory_version():
+    """
+    Returns the inventory version, which changes whenever Cars, Shop or
+    CarAvailability are written by any connection or process.
+    PRAGMA data_version makes the check cheap: the version row is only
+    read again after a commit happened somewhere else.
+    """
+    global _version_conn, _last_data_version, _inventory_version
+    configure_database()
+    with _version_lock:
+        try:
+            if _version_conn is None:
+                uri = f"file:{quote(DATABASE_PATH)}?mode=ro"
+                _version_conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            data_version = _version_conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != _last_data_version or _inventory_version is None:
+                row = _version_conn.execute("SELECT Version FROM InventoryVersion WHERE ID = 1").fetchone()
+                _inventory_version = str(row[0]) if row else "0"
+                _last_data_version = data_version
+            return _inventory_version
+        except sqlite3.Error as e:
+            logger.warning("Could not read the inventory version: %s", e)
+            return "unknown"
+
+
+def bump_inventory_version():
+    """
+    Marks the inventory as changed, e.g., after a bulk load with the triggers disabled.
+    """
+    execute_write("UPDATE InventoryVersion SET Version = Version + 1 WHERE ID = 1")
+
+
+def start_request_stats():
+    """
+    Starts counting queries and connections for the current request.
+    """
+    stats = {"queries": 0, "connections": 0}
+    _request_stats.set(stats)
+    return stats
+
+
+def get_request_stats():
+    """
+    Returns the query and connection counts of the current request.
+    """
+    stats = _request_stats.get()
+    return dict(stats) if stats is not None else {"queries": 0, "connections": 0}
+
+
+def get_database_stats():
+    """
+    Returns the process-wide query and connection counts.
+    """
+    with _stats_lock:
+        return dict(database_stats)
+
+
+def _count(name):
+    """
+    Increments a counter for the process and for the current request.
+    """
+    stats = _request_stats.get()
+    with _stats_lock:
+        database_stats[name] += 1
+        if stats is not None:
+            stats[name] += 1
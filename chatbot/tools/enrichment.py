@@ -0,0 +1,67 @@
+# enrichment.py
+from tools.prompts import format_chat_prompt
+from tools.response_cache import get_cached_response, set_cached_response, get_model_name
+from tools.pipeline import raise_if_cancelled, run_blocking
+from tools.streaming import invoke_llm, ainvoke_llm, emit_event
+from tools.tracing import span
+from tools.llm_budget import reserve_llm_call
+
+ENRICHMENT_PROMPT = (
+    "You are a car rental assistant. Respond to the user's query with concise details. "
+    "If you give several options do not list the options with numbers, just give each option as a sentence. "
+    "And be supportive if needed something else."
+)
+
+def enrich_response_with_llm(base_response, llm, system_prompt=ENRICHMENT_PROMPT):
+    """
+    Enhances the base response using the LLM for a conversational tone.
+    Responses are cached by prompt, base response and model, so repeated
+    catalogue answers do not call the LLM again. Streamed turns receive
+    the tokens as they are generated. When the turn is out of LLM budget
+    the base response is returned as is.
+    """
+    model = get_model_name(llm)
+    cached = get_cached_response(system_prompt, base_response, model)
+    if cached is not None:
+        emit_event("token", {"text": cached})
+        return cached
+
+    # The request may have timed out while the database was queried
+    raise_if_cancelled()
+
+    if not reserve_llm_call("enrichment"):
+        emit_event("token", {"text": base_response})
+        return base_response
+
+    with span("llm", "enrichment"):
+        response = invoke_llm(llm, build_enrichment_prompt(base_response, system_prompt))
+
+    set_cached_response(system_prompt, base_response, model, response)
+    return response
+
+async def enrich_response_with_llm_async(base_response, llm, system_prompt=ENRICHMENT_PROMPT):
+    """
+    Async counterpart of enrich_response_with_llm: the cache is read and
+    written on the blocking pool and the LLM call is awaited.
+    """
+    model = get_model_name(llm)
+    cached = await run_blocking(get_cached_response, system_prompt, base_response, model)
+    if cached is not None:
+        emit_event("token", {"text": cached})
+        return cached
+
+    if not reserve_llm_call("enrichment"):
+        emit_event("token", {"text": base_response})
+        return base_response
+
+    with span("llm", "enrichment"):
+        response = await ainvoke_llm(llm, build_enrichment_prompt(base_response, system_prompt))
+
+    await run_blocking(set_cached_response, system_prompt, base_response, model, response)
+    return response
+
+def build_enrichment_prompt(base_response, system_prompt=ENRICHMENT_PROMPT):
+    """
+    Returns the prompt text asking the LLM to rephrase a base response.
+    """
+    return format_chat_prompt(system_prompt, base_response)
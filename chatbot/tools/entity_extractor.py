@@ -0,0 +1,275 @@
+# entity_extractor.py
+import os
+import threading
+from collections import OrderedDict, deque
+from tools.vocabulary import get_vocabulary
+from tools.tracing import record_cache
+
+# Vocabulary kinds and the entity type they produce
+VOCABULARY_TYPES = {"brands": "brand", "models": "model", "colors": "color", "locations": "location"}
+
+# Fixed phrases matched by the same automaton as the vocabulary
+PHRASES = {
+    "price_below": ["under", "below", "less than", "cheaper than"],
+    "price_above": ["above"],
+    "price_exact": ["for"],
+    "years_ago": ["year ago", "years ago"],
+    "relative_year": ["last year", "this year", "next year"],
+}
+PRICE_FILTERS = {"price_below": "below", "price_above": "above", "price_exact": "exact"}
+RELATIVE_YEARS = {"last year": -1, "this year": 0, "next year": 1}
+
+# Number of (query, inventory version) results kept
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "2048"))
+
+# Automaton for the current vocabulary: {"version": ..., "goto": ..., "fail": ..., "output": ...}
+_automaton = None
+_automaton_lock = threading.Lock()
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+extractor_stats = {"builds": 0, "hits": 0, "misses": 0}
+
+
+def extract_entities(query):
+    """
+    Returns every brand, model, color, location, price phrase and year phrase
+    found in the query as a list of entities ordered by position:
+        {"type": "color", "value": "Red", "text": "red", "start": 4, "end": 7}
+    Price entities also carry a "filter" (below, above or exact). Relative
+    years carry an "offset" or the "years_ago" text instead of a value. The result is cached per query and
+    inventory version, so the router and the nodes share one scan per turn.
+    Callers must not modify the returned list.
+    """
+    automaton = get_automaton()
+    key = (query, automaton["version"])
+    with _cache_lock:
+        entities = _cache.get(key)
+        if entities is not None:
+            _cache.move_to_end(key)
+            extractor_stats["hits"] += 1
+    if entities is not None:
+        record_cache("extraction", True)
+        return entities
+
+    record_cache("extraction", False)
+    entities = scan(query, automaton)
+    with _cache_lock:
+        extractor_stats["misses"] += 1
+        _cache[key] = entities
+        while len(_cache) > EXTRACTION_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entities
+
+
+def find_entity(query, entity_type):
+    """
+    Returns the first entity of the given type in the query, or None.
+    """
+    for entity in extract_entities(query):
+        if entity["type"] == entity_type:
+            return entity
+    return None
+
+
+def get_automaton():
+    """
+    Returns the automaton for the current vocabulary, rebuilding it when the
+    inventory version changed.
+    """
+    global _automaton
+    vocabulary = get_vocabulary()
+    automaton = _automaton
+    if automaton is not None and automaton["version"] == vocabulary["version"]:
+        return automaton
+
+    with _automaton_lock:
+        if _automaton is None or _automaton["version"] != vocabulary["version"]:
+            _automaton = build_automaton(vocabulary)
+        return _automaton
+
+
+def build_automaton(vocabulary):
+    """
+    Builds an Aho-Corasick automaton over the lowercase vocabulary and phrases.
+    Each state has its transitions, a failure link and the patterns that end
+    there as (length, kind, value) tuples.
+    """
+    goto = [{}]
+    output = [[]]
+
+    def add(pattern, kind, value):
+        state = 0
+        for char in pattern:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][char] = next_state
+                goto.append({})
+                output.append([])
+            state = next_state
+        output[state].append((len(pattern), kind, value))
+
+    for kind, entity_type in VOCABULARY_TYPES.items():
+        for term, original in vocabulary["terms"][kind]:
+            if term:
+                add(term, entity_type, original)
+    for kind, phrases in PHRASES.items():
+        for phrase in phrases:
+            add(phrase, kind, phrase)
+
+    # Breadth-first pass to set the failure links
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            link = fail[state]
+            while link and char not in goto[link]:
+                link = fail[link]
+            fail_state = goto[link].get(char, 0) if state else 0
+            fail[next_state] = fail_state
+            if output[fail_state]:
+                output[next_state] = output[next_state] + output[fail_state]
+
+    extractor_stats["builds"] += 1
+    return {"version": vocabulary["version"], "goto": goto, "fail": fail, "output": output}
+
+
+def scan(query, automaton):
+    """
+    Runs the automaton over the query once, collecting the vocabulary and
+    phrase matches on word boundaries as well as the numbers, then resolves
+    them into entities.
+    """
+    text = query.lower()
+    goto, fail, output = automaton["goto"], automaton["fail"], automaton["output"]
+    matches = []
+    numbers = []
+    state = 0
+    number_start = None
+
+    for index, char in enumerate(text):
+        # Numbers are collected in the same pass
+        if char.isdigit():
+            if number_start is None:
+                number_start = index
+        elif number_start is not None:
+            numbers.append((number_start, index))
+            number_start = None
+
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        for length, kind, value in output[state]:
+            start = index - length + 1
+            end = index + 1
+            if is_boundary(text, start - 1) and is_word_end(text, end):
+                matches.append((start, end, kind, value))
+    if number_start is not None:
+        numbers.append((number_start, len(text)))
+
+    return resolve(text, longest_matches(matches), numbers)
+
+
+def is_boundary(text, index):
+    """
+    Checks that the character at index does not continue a word.
+    """
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+def is_word_end(text, end):
+    """
+    Checks that a match ends on a word boundary. A plural "s" is accepted,
+    so "Teslas" still matches "Tesla" while "Fred" does not match "red".
+    """
+    if is_boundary(text, end):
+        return True
+    return text[end] == "s" and is_boundary(text, end + 1)
+
+
+def longest_matches(matches):
+    """
+    Keeps the longest match of each type at every position, dropping matches
+    that lie inside a longer one of the same type (e.g., "Model" in "Model S").
+    """
+    matches.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+    kept = []
+    covered = {}
+    for start, end, kind, value in matches:
+        if covered.get(kind, 0) > start:
+            continue
+        covered[kind] = end
+        kept.append((start, end, kind, value))
+    return kept
+
+
+def resolve(text, matches, numbers):
+    """
+    Turns raw matches and numbers into entities: vocabulary terms as they are,
+    price phrases followed by a number, explicit years, and relative years.
+    """
+    entities = []
+    numbers_by_start = {start: end for start, end in numbers}
+
+    for start, end, kind, value in matches:
+        if kind in VOCABULARY_TYPES.values():
+            entities.append({"type": kind, "value": value, "text": text[start:end], "start": start, "end": end})
+
+        elif kind in PRICE_FILTERS:
+            # "under 70" or "under $70"
+            number_start = end + 1
+            if end < len(text) and text[end].isspace():
+                if text[number_start:number_start + 1] == "$":
+                    number_start += 1
+                number_end = numbers_by_start.get(number_start)
+                if number_end is not None:
+                    entities.append({
+                        "type": "price", "value": float(text[number_start:number_end]), "filter": PRICE_FILTERS[kind],
+                        "text": text[start:number_end], "start": start, "end": number_end
+                    })
+
+        elif kind == "years_ago":
+            # "4 years ago" or "four years ago"
+            word_end = start
+            while word_end > 0 and text[word_end - 1].isspace():
+                word_end -= 1
+            word_start = word_end
+            while word_start > 0 and text[word_start - 1].isalnum():
+                word_start -= 1
+            if word_start < word_end < start:
+                entities.append({
+                    "type": "year", "years_ago": text[word_start:word_end],
+                    "text": text[word_start:end], "start": word_start, "end": end
+                })
+
+        elif kind == "relative_year":
+            entities.append({"type": "year", "offset": RELATIVE_YEARS[value], "text": value, "start": start, "end": end})
+
+    for start, end in numbers:
+        value = text[start:end]
+        if len(value) == 4 and value[:2] in ("19", "20") and is_boundary(text, start - 1) and is_boundary(text, end):
+            entities.append({"type": "year", "value": int(value), "text": value, "start": start, "end": end})
+
+    entities.sort(key=lambda entity: entity["start"])
+    return entities
+
+
+def load_extractor():
+    """
+    Builds the vocabulary and the automaton ahead of the first request.
+    """
+    get_automaton()
+
+
+def get_extractor_stats():
+    """
+    Returns the automaton builds and the extraction cache hits and misses.
+    """
+    with _cache_lock:
+        stats = dict(extractor_stats)
+        stats["cached_queries"] = len(_cache)
+    return stats
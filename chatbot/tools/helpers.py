@@ -1,52 +1,20 @@
 #helpers.py
-import sqlite3
+import logging
+from tools.entity_extractor import find_entity
 from datetime import datetime
-from dateutil import parser  
 import re
-from dateutil.parser import parse
-import json
 
-DATABASE_PATH = 'C:/Users/danyn/Documents/car_rental_project/database/rental_car.db'
+logger = logging.getLogger(__name__)
 
 def detect_car_brand_in_query(query):
     """Detects car brand in the query based on database records."""
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT Brand FROM Cars")
-        brands = [row[0].lower() for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return None
-    finally:
-        conn.close()
-
-    for brand in brands:
-        if brand in query.lower():
-            return brand.capitalize()
-    return None
+    entity = find_entity(query, "brand")
+    return entity["value"].lower().capitalize() if entity else None
 
 def detect_car_model_in_query(query):
     """Detects car model in the query based on database records."""
-    try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        # Fetch all models
-        cursor.execute("SELECT DISTINCT Model FROM Cars")
-        models = [row[0].lower() for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        print(f"Database error in detect_car_model_in_query: {e}")
-        return None
-    finally:
-        conn.close()
-
-    query_lower = query.lower()
-
-    # Check for exact or partial matches
-    for model in models:
-        if model in query_lower:
-            return model.capitalize() 
-    return None
+    entity = find_entity(query, "model")
+    return entity["value"].lower().capitalize() if entity else None
 
 def extract_date_from_query(query):
     """Extracts start and end dates from the user's query."""
@@ -54,6 +22,8 @@ def extract_date_from_query(query):
     match = re.search(date_range_pattern, query, re.IGNORECASE)
 
     if match:
+        # Imported on first use so that starting the server does not load dateutil
+        from dateutil import parser
         try:
             start_date = parser.parse(match.group(1)).date() 
             end_date = parser.parse(match.group(2)).date()
@@ -64,6 +34,7 @@ def extract_date_from_query(query):
     single_date_pattern = r"on (\w+ \d{1,2})"
     match = re.search(single_date_pattern, query, re.IGNORECASE)
     if match:
+        from dateutil import parser
         try:
             single_date = parser.parse(match.group(1)).date()  
             return single_date, None
@@ -83,6 +54,8 @@ def parse_natural_language_date(date_string, default_year):
         if re.match(r"^\d{4}-\d{2}-\d{2}$", date_string):
             return date_string
 
+        from dateutil import parser
+
         #  natural language dates
         parsed_date = parser.parse(date_string, fuzzy=True, default=datetime(default_year, 1, 1))
 
@@ -93,15 +66,13 @@ def parse_natural_language_date(date_string, default_year):
 
         return parsed_date.strftime("%Y-%m-%d")
     except (ValueError, TypeError) as e:
-        print(f"Error parsing date: {e}")
+        logger.warning("Error parsing date: %s", e)
         return None
 
-
-
 def get_current_year():
     """
     Returns the current year dynamically.
     """
     current_year = datetime.now().year
-    print(f"Current Year: {current_year}")  
+    logger.debug("Current Year: %s", current_year)
     return current_year
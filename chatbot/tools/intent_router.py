@@ -0,0 +1,182 @@
+# intent_router.py
+import logging
+import os
+import re
+import threading
+from nodes.price import detect_price_in_query
+from nodes.year import detect_year_in_query
+from nodes.brand import detect_brand_in_query
+from nodes.color import detect_color_in_query
+from nodes.location import detect_location_in_query
+from tools.helpers import detect_car_model_in_query, extract_date_from_query
+
+logger = logging.getLogger(__name__)
+
+# Minimum confidence for answering without the LLM
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.8"))
+
+# Queries longer than this are usually conversational and left to the LLM
+MAX_FAST_PATH_WORDS = 12
+
+BOOKING_WORDS = ["book", "reserve", "reservation"]
+PRICE_WORDS = ["price", "prices", "cost", "costs", "how much", "per day", "rate"]
+RECOMMENDATION_WORDS = ["recommend", "suggest", "best", "should i"]
+# Words that change the meaning of a detected entity (e.g., "not red"), with
+# negative contractions written with or without their apostrophe ("dont")
+NEGATIVE_CONTRACTIONS = ["don't", "doesn't", "didn't", "isn't", "aren't", "won't", "can't", "wouldn't", "shouldn't"]
+AMBIGUOUS_WORDS = [
+    "not", "no", "never", "neither", "nor", "except", "excluding", "without", "but", "or", "instead", "other than",
+    "cheap", "cheapest", "expensive",
+] + NEGATIVE_CONTRACTIONS + [word.replace("'", "") for word in NEGATIVE_CONTRACTIONS]
+# Any other negative contraction, e.g., "shouldn't" or "don’t"
+NEGATION_PATTERN = re.compile(r"\w+n['’]t\b")
+
+SINGLE_ENTITY_INTENTS = {
+    "color": "color_query",
+    "location": "location_query",
+    "year": "year_query",
+    "brand": "brand_query",
+    "price": "price_query",
+}
+
+# Fast-path hit counters
+router_stats = {"fast_path": 0, "llm": 0}
+_stats_lock = threading.Lock()
+
+
+def route_query(query):
+    """
+    Rule-based first-tier router built on the deterministic detectors.
+    Returns the intent, the preferences found and a confidence between 0 and 1.
+    """
+    query_lower = query.lower()
+    preferences = {"color": None, "location": None, "price": None, "brand": None, "year": None, "start_date": None, "end_date": None}
+    # Entities that were found, including ones that are not stored as preferences
+    found = set()
+    confidence = 0.95
+
+    color = detect_color_in_query(query)
+    if color:
+        preferences["color"] = color
+        found.add("color")
+        if not contains_word(query_lower, color):
+            confidence -= 0.3
+
+    location, _ = detect_location_in_query(query)
+    if location:
+        preferences["location"] = location
+        found.add("location")
+        if not contains_word(query_lower, location):
+            confidence -= 0.3
+
+    brand = detect_brand_in_query(query)
+    if brand:
+        preferences["brand"] = brand
+        found.add("brand")
+        if not contains_word(query_lower, brand):
+            confidence -= 0.3
+
+    year = detect_year_in_query(query)
+    if year:
+        preferences["year"] = year
+        found.add("year")
+
+    price, filter_type = detect_price_in_query(query)
+    if price is not None:
+        found.add("price")
+        if filter_type == "below":
+            preferences["price"] = price
+
+    start_date, end_date = extract_date_from_query(query)
+    if start_date:
+        preferences["start_date"] = start_date.isoformat()
+        preferences["end_date"] = (end_date or start_date).isoformat()
+
+    model = detect_car_model_in_query(query)
+    has_price_words = any(contains_word(query_lower, word) for word in PRICE_WORDS)
+
+    non_date_preferences = [key for key in ["color", "location", "price", "brand", "year"] if preferences[key] is not None]
+
+    # Pick the intent
+    if any(contains_word(query_lower, word) for word in BOOKING_WORDS):
+        intent = "booking"
+    elif len(non_date_preferences) >= 2:
+        intent = "recommendation_request"
+    elif len(found) == 1:
+        entity = next(iter(found))
+        intent = SINGLE_ENTITY_INTENTS[entity]
+        if entity == "brand" and has_price_words:
+            intent = "price_query"
+    elif model and has_price_words:
+        intent = "price_query"
+    elif start_date and not found:
+        intent = "availability_query"
+    else:
+        return {"intent": None, "preferences": preferences, "confidence": 0.0}
+
+    # Lower the confidence when the query carries cues the rules do not understand
+    if start_date and found and intent != "booking":
+        confidence -= 0.4
+    if any(contains_word(query_lower, word) for word in AMBIGUOUS_WORDS) or NEGATION_PATTERN.search(query_lower):
+        confidence -= 0.4
+    if any(contains_word(query_lower, word) for word in RECOMMENDATION_WORDS) and intent != "recommendation_request":
+        confidence -= 0.3
+    if len(query_lower.split()) > MAX_FAST_PATH_WORDS:
+        confidence -= 0.3
+
+    return {"intent": intent, "preferences": preferences, "confidence": max(confidence, 0.0)}
+
+
+def fast_understand(query):
+    """
+    Returns an understanding (intent and preferences) without calling the LLM
+    when the query is unambiguous, otherwise None. Updates the hit counters.
+    """
+    route = route_query(query)
+    logger.debug("Fast-path route: %s (confidence %.2f)", route['intent'], route['confidence'])
+
+    if route["intent"] and route["confidence"] >= FAST_PATH_THRESHOLD:
+        record_route(fast_path=True)
+        return {"intent": route["intent"], "preferences": route["preferences"]}
+
+    record_route(fast_path=False)
+    return None
+
+
+def rule_based_understand(query):
+    """
+    Returns the best understanding the rules can give, whatever the confidence,
+    for turns that may not call the LLM. Queries without a recognized intent
+    are treated as general queries.
+    """
+    route = route_query(query)
+    return {"intent": route["intent"] or "general_query", "preferences": route["preferences"]}
+
+
+def contains_word(text, word):
+    """
+    Checks that a word or phrase appears in the text on word boundaries.
+    """
+    return re.search(r"\b" + re.escape(str(word).lower()) + r"\b", text) is not None
+
+
+def record_route(fast_path):
+    """
+    Counts a query answered by the fast path or sent to the LLM.
+    """
+    with _stats_lock:
+        router_stats["fast_path" if fast_path else "llm"] += 1
+
+
+def get_router_stats():
+    """
+    Returns the fast-path counters and hit rate.
+    """
+    with _stats_lock:
+        total = router_stats["fast_path"] + router_stats["llm"]
+        return {
+            "fast_path": router_stats["fast_path"],
+            "llm": router_stats["llm"],
+            "total": total,
+            "hit_rate": router_stats["fast_path"] / total if total else 0.0,
+        }
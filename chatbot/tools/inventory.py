@@ -0,0 +1,226 @@
+# inventory.py
+import logging
+import threading
+import time
+from tools.database import get_connection, get_inventory_version, to_day_number
+from tools.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Columns of the rows returned by car_rows, as selected by the former SQL lookups
+CAR_COLUMNS = ("Model", "Brand", "Year", "Color", "PricePerDay", "Location")
+
+# Preferences matched on a categorical column, case-insensitively like COLLATE NOCASE
+CATEGORICAL_PREFERENCES = ("color", "brand", "location")
+
+# Snapshot of Cars, Shop and CarAvailability as NumPy columns (see build_inventory);
+# replaced as a whole, so a lookup always sees one consistent version
+_inventory = None
+_lock = threading.Lock()
+
+inventory_stats = {"builds": 0, "version": None, "cars": 0, "windows": 0, "build_seconds": 0.0}
+
+
+def get_inventory():
+    """
+    Returns the inventory snapshot, rebuilding it when the inventory version
+    changed. While one thread rebuilds, the others keep using the previous
+    snapshot instead of waiting.
+    """
+    global _inventory
+    version = get_inventory_version()
+    inventory = _inventory
+    if inventory is not None and inventory["version"] == version:
+        return inventory
+
+    if not _lock.acquire(blocking=inventory is None):
+        return inventory
+    try:
+        if _inventory is None or _inventory["version"] != version:
+            _inventory = build_inventory()
+        return _inventory
+    finally:
+        _lock.release()
+
+
+def build_inventory():
+    """
+    Loads the cars, their shop location and their availability windows in a
+    single read transaction. Brand, color and location are stored as integer
+    codes of their lowercase value; the availability windows as Julian day
+    numbers with the row of their car.
+    """
+    # Imported here so that starting the server does not load NumPy
+    import numpy as np
+
+    started = time.perf_counter()
+    conn = get_connection()
+    with span("inventory", "build"):
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT Version FROM InventoryVersion WHERE ID = 1").fetchone()
+            cars = conn.execute("SELECT CarID, Model, Brand, Year, Color, PricePerDay, ShopID FROM Cars ORDER BY CarID").fetchall()
+            shops = dict(conn.execute("SELECT ShopID, Location FROM Shop").fetchall())
+            windows = conn.execute("SELECT CarID, StartDay, EndDay FROM AvailabilityIndex").fetchall()
+        finally:
+            conn.execute("COMMIT")
+
+    count = len(cars)
+    car_ids, models, brands, years, colors, prices, shop_ids = (list(column) for column in zip(*cars)) if cars else ([],) * 7
+    locations = [shops.get(shop_id) for shop_id in shop_ids]
+    car_ids = np.array(car_ids, dtype=np.int64)
+    inventory = {
+        "version": str(row[0]) if row else "0",
+        "car_id": car_ids,
+        "models": models,
+        "brands": brands,
+        "colors": colors,
+        "locations": locations,
+        "year": np.array(years, dtype=np.int32),
+        "price": np.array(prices, dtype=np.float64),
+        "in_shop": np.array([location is not None for location in locations], dtype=bool),
+    }
+    inventory["codes"] = {}
+    for key, values in [("color", colors), ("brand", brands), ("location", locations)]:
+        inventory[key], inventory["codes"][key] = encode(values)
+
+    # Windows of cars that were deleted since are left out
+    window_cars, window_starts, window_ends = (np.array(column, dtype=np.int64) for column in zip(*windows)) if windows else (np.empty(0, dtype=np.int64),) * 3
+    if count:
+        rows = np.minimum(np.searchsorted(car_ids, window_cars), count - 1)
+        known = car_ids[rows] == window_cars
+    else:
+        rows = known = np.zeros(len(windows), dtype=bool)
+    inventory["window_car"] = rows[known].astype(np.int32)
+    inventory["window_start"] = window_starts[known].astype(np.int32)
+    inventory["window_end"] = window_ends[known].astype(np.int32)
+    inventory["has_window"] = np.zeros(count, dtype=bool)
+    inventory["has_window"][inventory["window_car"]] = True
+
+    elapsed = time.perf_counter() - started
+    inventory_stats.update({
+        "builds": inventory_stats["builds"] + 1, "version": inventory["version"], "cars": count,
+        "windows": len(inventory["window_car"]), "build_seconds": round(elapsed, 4),
+    })
+    logger.info("Inventory snapshot built for version %s: %d cars, %d windows in %.3fs",
+                inventory["version"], count, len(inventory["window_car"]), elapsed)
+    return inventory
+
+
+def encode(values):
+    """
+    Returns the code of every value and the code of each lowercase value;
+    missing values get the code -1.
+    """
+    import numpy as np
+
+    codes = {}
+    value_codes = {None: -1}
+    for value in set(values):
+        if value is not None:
+            value_codes[value] = codes.setdefault(value.lower(), len(codes))
+    return np.array([value_codes[value] for value in values], dtype=np.int32), codes
+
+
+def select_cars(preferences, require_shop=True, require_window=False):
+    """
+    Returns the rows, in CarID order, of the cars matching every preference
+    that is set (see match_cars).
+    """
+    inventory = get_inventory()
+    return car_rows(inventory, match_cars(inventory, preferences, require_shop, require_window))
+
+
+def match_cars(inventory, preferences, require_shop=True, require_window=False):
+    """
+    Returns the indices of the cars matching every preference that is set:
+    color, brand and location (case-insensitive), year, price (a daily
+    ceiling) and start_date with end_date (an availability window
+    overlapping the dates). Cars without a shop are left out unless
+    require_shop is False; with require_window, cars without any
+    availability window are left out when no dates are given.
+    """
+    import numpy as np
+
+    with span("inventory", "select"):
+        mask = inventory["in_shop"].copy() if require_shop else np.ones(len(inventory["models"]), dtype=bool)
+
+        for key in CATEGORICAL_PREFERENCES:
+            value = preferences.get(key)
+            if value:
+                code = inventory["codes"][key].get(str(value).lower())
+                if code is None:
+                    return np.empty(0, dtype=np.intp)
+                mask &= inventory[key] == code
+        try:
+            if preferences.get("year"):
+                mask &= inventory["year"] == int(preferences["year"])
+            if preferences.get("price"):
+                mask &= inventory["price"] <= float(preferences["price"])
+        except (TypeError, ValueError):
+            # A value that is not a number matches no car
+            return np.empty(0, dtype=np.intp)
+
+        if preferences.get("start_date") and preferences.get("end_date"):
+            mask &= available_between(inventory, preferences["start_date"], preferences["end_date"])
+        elif require_window:
+            mask &= inventory["has_window"]
+
+        return np.flatnonzero(mask)
+
+
+def match_price(inventory, filter_type, price):
+    """
+    Returns the indices, in CarID order, of the cars whose daily price is
+    below or equal to, above, or exactly the given price.
+    """
+    import numpy as np
+
+    with span("inventory", "select"):
+        prices = inventory["price"]
+        if filter_type == "below":
+            mask = prices <= price
+        elif filter_type == "above":
+            mask = prices > price
+        else:
+            mask = prices == price
+        return np.flatnonzero(mask)
+
+
+def available_between(inventory, start_date, end_date):
+    """
+    Returns the mask of the cars with an availability window overlapping the dates.
+    """
+    import numpy as np
+
+    overlapping = (inventory["window_start"] <= to_day_number(end_date)) & (inventory["window_end"] >= to_day_number(start_date))
+    mask = np.zeros(len(inventory["models"]), dtype=bool)
+    mask[inventory["window_car"][overlapping]] = True
+    return mask
+
+
+def car_rows(inventory, indices):
+    """
+    Returns (Model, Brand, Year, Color, PricePerDay, Location) rows for car indices.
+    """
+    models, brands, colors, locations = inventory["models"], inventory["brands"], inventory["colors"], inventory["locations"]
+    years = inventory["year"][indices].tolist()
+    prices = inventory["price"][indices].tolist()
+    return [
+        (models[index], brands[index], year, colors[index], price, locations[index])
+        for index, year, price in zip(indices.tolist(), years, prices)
+    ]
+
+
+def load_inventory():
+    """
+    Builds the inventory snapshot ahead of the first request.
+    """
+    get_inventory()
+
+
+def get_inventory_stats():
+    """
+    Returns how often the snapshot was built, its version and size.
+    """
+    return dict(inventory_stats)
@@ -0,0 +1,137 @@
+# llm_budget.py
+import contextvars
+import os
+import threading
+
+# Ceilings on the LLM work of one chat turn and of a whole conversation;
+# 0 disables a limit. Once a limit is reached the remaining stages of the
+# turn answer from the rule-based router and the templates.
+LLM_TURN_MAX_CALLS = int(os.getenv("LLM_TURN_MAX_CALLS", "4"))
+LLM_TURN_MAX_TOKENS = int(os.getenv("LLM_TURN_MAX_TOKENS", "8000"))
+LLM_SESSION_MAX_CALLS = int(os.getenv("LLM_SESSION_MAX_CALLS", "0"))
+LLM_SESSION_MAX_TOKENS = int(os.getenv("LLM_SESSION_MAX_TOKENS", "0"))
+
+# Budget of the current turn, None outside a chat turn (no limits apply)
+_budget = contextvars.ContextVar("llm_budget", default=None)
+
+_lock = threading.Lock()
+budget_stats = {"calls": {}, "exhausted": {}}  # profile -> count, profile -> {limit: count}
+
+
+def new_usage():
+    """
+    Returns empty LLM usage counters, as kept per turn and in the session.
+    """
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+def start_llm_budget(session=None):
+    """
+    Starts the LLM budget of the current turn. With a session, its usage is
+    also added to the conversation totals stored in the session.
+    """
+    budget = {
+        "turn": new_usage(),
+        "session": session.setdefault("llm_usage", new_usage()) if session is not None else None,
+        "exhausted": None,
+    }
+    _budget.set(budget)
+    return budget
+
+
+def reserve_llm_call(profile):
+    """
+    Counts an LLM call of the current turn under a profile name, or returns
+    False when the turn or the session is out of budget and the caller must
+    answer without the LLM.
+    """
+    budget = _budget.get()
+    with _lock:
+        if budget is not None:
+            limit = _exceeded_limit(budget)
+            if limit is not None:
+                budget["exhausted"] = limit
+                refused = budget_stats["exhausted"].setdefault(profile, {})
+                refused[limit] = refused.get(limit, 0) + 1
+                return False
+            for usage in _usages(budget):
+                usage["calls"] += 1
+        budget_stats["calls"][profile] = budget_stats["calls"].get(profile, 0) + 1
+    return True
+
+
+def charge_llm_tokens(input_tokens, output_tokens):
+    """
+    Adds the tokens reported by the LLM to the current turn and session.
+    """
+    budget = _budget.get()
+    if budget is None:
+        return
+    with _lock:
+        for usage in _usages(budget):
+            usage["input_tokens"] += input_tokens
+            usage["output_tokens"] += output_tokens
+
+
+def llm_calls_left():
+    """
+    Returns how many more LLM calls the current turn may make, None without a limit.
+    """
+    budget = _budget.get()
+    if budget is None:
+        return None
+    with _lock:
+        if _exceeded_limit(budget) is not None:
+            return 0
+        left = [
+            limit - usage["calls"]
+            for usage, limit in [(budget["turn"], LLM_TURN_MAX_CALLS), (budget["session"], LLM_SESSION_MAX_CALLS)]
+            if usage is not None and limit
+        ]
+    return min(left) if left else None
+
+
+def get_llm_budget():
+    """
+    Returns the LLM usage of the current turn and of its conversation, and
+    the limit that was hit, if any (for the /chat debug payload).
+    """
+    budget = _budget.get()
+    if budget is None:
+        return {"turn": new_usage(), "session": None, "exhausted": None}
+    with _lock:
+        return {
+            "turn": dict(budget["turn"]),
+            "session": dict(budget["session"]) if budget["session"] is not None else None,
+            "exhausted": budget["exhausted"],
+        }
+
+
+def get_budget_stats():
+    """
+    Returns the LLM calls made and refused by profile since the process started.
+    """
+    with _lock:
+        return {
+            "calls": dict(budget_stats["calls"]),
+            "exhausted": {profile: dict(limits) for profile, limits in budget_stats["exhausted"].items()},
+        }
+
+
+def _usages(budget):
+    return [usage for usage in (budget["turn"], budget["session"]) if usage is not None]
+
+
+def _exceeded_limit(budget):
+    """
+    Returns the name of the first limit reached by the budget, or None.
+    """
+    turn, session = budget["turn"], budget["session"]
+    checks = [("turn_calls", turn, "calls", LLM_TURN_MAX_CALLS), ("turn_tokens", turn, None, LLM_TURN_MAX_TOKENS)]
+    if session is not None:
+        checks += [("session_calls", session, "calls", LLM_SESSION_MAX_CALLS), ("session_tokens", session, None, LLM_SESSION_MAX_TOKENS)]
+    for name, usage, key, limit in checks:
+        used = usage[key] if key else usage["input_tokens"] + usage["output_tokens"]
+        if limit and used >= limit:
+            return name
+    return None
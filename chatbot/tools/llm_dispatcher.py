@@ -0,0 +1,221 @@
+# llm_dispatcher.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Concurrent non-streamed LLM calls (enrichment, summaries) are collected for
+# up to LLM_BATCH_MAX_WAIT_MS and sent together through the client's batch
+# API, with at most LLM_BATCH_MAX_INFLIGHT batches in flight per client.
+# While every slot is busy, new calls keep joining the next batch.
+# Off by default: ChatGroq's batch methods still send one HTTP request per
+# prompt, so batching saves no provider calls and only adds the wait and ties
+# each caller to the slowest prompt of its batch. Turn it on for a client
+# whose batch API sends a batch in one request.
+LLM_BATCHING = os.getenv("LLM_BATCHING", "0") == "1"
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+LLM_BATCH_MAX_WAIT = float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "5")) / 1000
+LLM_BATCH_MAX_INFLIGHT = int(os.getenv("LLM_BATCH_MAX_INFLIGHT", "4"))
+# Calls of one batch the client may send at the same time
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", str(LLM_BATCH_MAX_SIZE)))
+
+_dispatchers = {}  # id(llm) -> BatchDispatcher
+_async_dispatchers = {}  # (id(llm), id(loop)) -> AsyncBatchDispatcher
+_lock = threading.Lock()
+
+dispatcher_stats = {"batches": 0, "calls": 0, "largest_batch": 0, "errors": 0}
+
+
+class BatchDispatcher:
+    """
+    Collects the prompts submitted from many threads for one LLM client and
+    sends them in batches from a background thread. Each caller gets a
+    future resolved with its own response or error.
+    """
+
+    def __init__(self, llm, max_size=LLM_BATCH_MAX_SIZE, max_wait=LLM_BATCH_MAX_WAIT,
+                 max_inflight=LLM_BATCH_MAX_INFLIGHT, concurrency=LLM_BATCH_CONCURRENCY):
+        self.llm = llm
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self._pending = []  # (prompt, future, submitted at)
+        self._condition = threading.Condition()
+        self._slots = threading.Semaphore(max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="llm-batch")
+        threading.Thread(target=self._collect, name="llm-batch-collector", daemon=True).start()
+
+    def submit(self, prompt):
+        """
+        Queues a prompt and returns the future of its response.
+        """
+        future = Future()
+        with self._condition:
+            self._pending.append((prompt, future, time.monotonic()))
+            self._condition.notify()
+        return future
+
+    def _collect(self):
+        """
+        Waits for a free slot, then for the first prompt, then until the batch
+        is full or the oldest prompt waited max_wait, and sends the batch.
+        """
+        while True:
+            self._slots.acquire()
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_size]
+                del self._pending[:self.max_size]
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        try:
+            try:
+                results = self.llm.batch(
+                    [prompt for prompt, _, _ in batch],
+                    config={"max_concurrency": self.concurrency}, return_exceptions=True
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+            _count_batch(batch, results)
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+class AsyncBatchDispatcher:
+    """
+    Async counterpart of BatchDispatcher for one client and one event loop:
+    batches are sent with the client's abatch method as event loop tasks.
+    """
+
+    def __init__(self, llm, max_size=LLM_BATCH_MAX_SIZE, max_wait=LLM_BATCH_MAX_WAIT,
+                 max_inflight=LLM_BATCH_MAX_INFLIGHT, concurrency=LLM_BATCH_CONCURRENCY):
+        self.llm = llm
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self._pending = []  # (prompt, future)
+        self._timer = None
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._tasks = set()
+
+    async def submit(self, prompt):
+        """
+        Queues a prompt and waits for its response.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((prompt, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending[:self.max_size]
+        del self._pending[:self.max_size]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        async with self._slots:
+            try:
+                results = await self.llm.abatch(
+                    [prompt for prompt, _ in batch],
+                    config={"max_concurrency": self.concurrency}, return_exceptions=True
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+        _count_batch(batch, results)
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away in the meantime
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def dispatch(llm, prompt):
+    """
+    Calls the LLM through the batching dispatcher of its client and returns
+    the response. Calls the client directly when batching is off or the
+    client has no batch API.
+    """
+    if not LLM_BATCHING or not hasattr(llm, "batch"):
+        return llm.invoke(prompt)
+    return _get_dispatcher(llm).submit(prompt).result()
+
+
+async def adispatch(llm, prompt):
+    """
+    Async counterpart of dispatch.
+    """
+    if not LLM_BATCHING or not hasattr(llm, "abatch"):
+        return await llm.ainvoke(prompt)
+    return await _get_async_dispatcher(llm).submit(prompt)
+
+
+def get_dispatcher_stats():
+    """
+    Returns the number of batches and calls sent and the mean batch size.
+    """
+    with _lock:
+        stats = dict(dispatcher_stats)
+    stats["enabled"] = LLM_BATCHING
+    stats["mean_batch_size"] = stats["calls"] / stats["batches"] if stats["batches"] else 0.0
+    return stats
+
+
+def _get_dispatcher(llm):
+    dispatcher = _dispatchers.get(id(llm))
+    if dispatcher is None or dispatcher.llm is not llm:
+        with _lock:
+            dispatcher = _dispatchers.get(id(llm))
+            if dispatcher is None or dispatcher.llm is not llm:
+                dispatcher = _dispatchers[id(llm)] = BatchDispatcher(llm)
+    return dispatcher
+
+
+def _get_async_dispatcher(llm):
+    key = (id(llm), id(asyncio.get_running_loop()))
+    dispatcher = _async_dispatchers.get(key)
+    if dispatcher is None or dispatcher.llm is not llm:
+        dispatcher = _async_dispatchers[key] = AsyncBatchDispatcher(llm)
+    return dispatcher
+
+
+def _count_batch(batch, results):
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    if errors:
+        logger.warning("%d of %d batched LLM calls failed", errors, len(batch))
+    with _lock:
+        dispatcher_stats["batches"] += 1
+        dispatcher_stats["calls"] += len(batch)
+        dispatcher_stats["errors"] += errors
+        dispatcher_stats["largest_batch"] = max(dispatcher_stats["largest_batch"], len(batch))
@@ -0,0 +1,137 @@
+# llm_registry.py
+import os
+import threading
+from dotenv import load_dotenv
+
+# Read before the settings below (server.py imports this module first)
+load_dotenv()
+
+# Connection pool shared by every LLM client of this process; idle
+# connections are kept open so requests skip the TCP and TLS handshakes
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+
+# Default model; each profile can override it with LLM_MODEL_<PROFILE>
+LLM_MODEL = os.getenv("LLM_MODEL")
+
+# Settings of the client each pipeline stage asks for. Classification and
+# extraction answers must be parseable, so they are deterministic and short.
+LLM_PROFILES = {
+    "default": {},
+    "understanding": {"temperature": 0, "max_tokens": 256},
+    "intent": {"temperature": 0, "max_tokens": 16},
+    "extraction": {"temperature": 0, "max_tokens": 256},
+    "enrichment": {},
+}
+
+_clients = {}
+_overrides = {}
+_http_clients = {}
+_lock = threading.Lock()
+
+llm_stats = {"clients_created": 0, "http_clients_created": 0}
+
+
+def get_llm(profile="default"):
+    """
+    Returns the LLM client of a profile, creating it on first use.
+    Every client shares the same keep-alive HTTP connection pool.
+    """
+    if profile not in LLM_PROFILES:
+        raise ValueError(f"Unknown LLM profile: {profile}")
+    client = _overrides.get(profile) or _overrides.get(None) or _clients.get(profile)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(profile)
+        if client is None:
+            client = create_llm(profile)
+            _clients[profile] = client
+            llm_stats["clients_created"] += 1
+    return client
+
+
+def create_llm(profile):
+    """
+    Builds the ChatGroq client of a profile on the shared HTTP clients.
+    """
+    # Imported here so that starting the server does not load the Groq SDK
+    from langchain_groq import ChatGroq
+
+    settings = dict(LLM_PROFILES[profile])
+    model = os.getenv(f"LLM_MODEL_{profile.upper()}") or LLM_MODEL
+    if model:
+        settings["model"] = model
+    return ChatGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        request_timeout=LLM_REQUEST_TIMEOUT,
+        http_client=_get_http_client("sync"),
+        http_async_client=_get_http_client("async"),
+        **settings
+    )
+
+
+def _get_http_client(kind):
+    """
+    Returns the shared httpx client ("sync" or "async"). Called with _lock held.
+    """
+    client = _http_clients.get(kind)
+    if client is None:
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        client_class = httpx.Client if kind == "sync" else httpx.AsyncClient
+        client = client_class(limits=limits, timeout=LLM_REQUEST_TIMEOUT)
+        _http_clients[kind] = client
+        llm_stats["http_clients_created"] += 1
+    return client
+
+
+def set_llm(client, profile=None):
+    """
+    Replaces the client of a profile, or of every profile when profile is None
+    (e.g., with a fake LLM in benchmarks). Passing None restores the default.
+    """
+    with _lock:
+        if client is None:
+            _overrides.pop(profile, None)
+        else:
+            _overrides[profile] = client
+
+
+def close_llm_clients():
+    """
+    Closes the shared HTTP connection pool; clients are recreated on next use.
+    """
+    with _lock:
+        _clients.clear()
+        http_clients = [_http_clients.pop(kind, None) for kind in ("sync", "async")]
+    if http_clients[0] is not None:
+        http_clients[0].close()
+    return http_clients[1]
+
+
+async def aclose_llm_clients():
+    """
+    Same as close_llm_clients, also closing the async pool (on server shutdown).
+    """
+    async_client = close_llm_clients()
+    if async_client is not None:
+        await async_client.aclose()
+
+
+def get_llm_stats():
+    """
+    Returns the profiles whose client was created and the creation counters.
+    """
+    with _lock:
+        stats = dict(llm_stats)
+        stats["profiles"] = sorted(_clients)
+    return stats
@@ -0,0 +1,177 @@
+# pagination.py
+import contextvars
+import os
+import re
+import secrets
+import threading
+from tools.inventory import get_inventory, match_cars, match_price, car_rows
+from tools.tracing import span
+
+# Cars listed per answer; "show more" (or the continuation token returned
+# with the answer) lists the next ones
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "10"))
+
+# Details of a car as given to the templates (see to_car)
+CAR_FIELDS = ("model", "brand", "year", "color", "price", "location")
+
+# Follow-ups asking for the next page, e.g., "show me more", "next page please"
+MORE_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:(?:show|see|give|list|load)\s+(?:me\s+)?)?(?:the\s+)?"
+    r"(?:more|next|rest|others)(?:\s+(?:ones|cars|results|options|page))?(?:\s+please)?$"
+)
+
+# Listing state of the current turn: the session the listed search is kept
+# in and the continuation returned with the answer; None outside a chat turn
+_turn = contextvars.ContextVar("listing_turn", default=None)
+
+_lock = threading.Lock()
+pagination_stats = {"first_pages": 0, "next_pages": 0, "expired": 0}
+
+
+def start_listings(session=None):
+    """
+    Starts the listing state of the current turn. With a session, a search
+    with more results than one page is kept in it for "show more".
+    """
+    turn = {"session": session, "continuation": None}
+    _turn.set(turn)
+    return turn
+
+
+def is_more_request(query):
+    """
+    Checks whether a message only asks for the next page of the last list.
+    """
+    return MORE_PATTERN.match(" ".join(re.findall(r"[a-z]+", query.lower()))) is not None
+
+
+def list_cars(search, fields=CAR_FIELDS, limit=RESULT_PAGE_SIZE):
+    """
+    Returns the first page of a search as cars with the given fields, and
+    the number of matching cars. A search is {"kind": "cars", "preferences",
+    "require_shop", "require_window"} (see match_cars) or {"kind": "price",
+    "filter", "price"} (see match_price, listed from the cheapest). When more
+    cars match, the search and the key of the last car listed are kept in
+    the session, so the next page starts right after it.
+    """
+    rows, cursor, remaining = search_page(search, None, limit)
+    _count("first_pages")
+    _drop_listing()
+    if remaining:
+        _keep_listing({"search": search, "fields": list(fields), "cursor": cursor, "shown": len(rows)}, remaining)
+    return [to_car(row, fields) for row in rows], len(rows) + remaining
+
+
+def next_page(token=None):
+    """
+    Returns the template and context of the next page of the search kept in
+    the session. A token that is not the one of the last page answers
+    "listing_expired", so an old link cannot skip or repeat cars.
+    """
+    turn = _turn.get()
+    session = turn["session"] if turn is not None else None
+    listing = session.get("listing") if session is not None else None
+    if listing is None:
+        return "listing_none", {}
+    if token and token != listing["token"]:
+        _count("expired")
+        return "listing_expired", {}
+
+    rows, cursor, remaining = search_page(listing["search"], listing["cursor"])
+    _count("next_pages")
+    _drop_listing()
+    if not rows:
+        return "listing_none", {}
+
+    shown = listing["shown"] + len(rows)
+    if remaining:
+        _keep_listing({"search": listing["search"], "fields": listing["fields"], "cursor": cursor, "shown": shown}, remaining)
+    cars = [to_car(row, listing["fields"]) for row in rows]
+    return "listing_more", {"cars": cars, "shown": shown, "total": shown + remaining}
+
+
+def search_page(search, cursor=None, limit=RESULT_PAGE_SIZE):
+    """
+    Returns the rows of the page of a search that follows a cursor (keyset
+    pagination: the sort key of the last car listed), the cursor of the last
+    row and the number of matching cars after the page. Cars are listed in
+    CarID order, price searches by price then CarID, so a page never repeats
+    or skips cars when the inventory changes in between.
+    """
+    import numpy as np
+
+    inventory = get_inventory()
+    car_ids = inventory["car_id"]
+    with span("inventory", "page"):
+        if search["kind"] == "price":
+            prices = inventory["price"]
+            indices = match_price(inventory, search["filter"], search["price"])
+            if cursor is not None:
+                price, car_id = cursor
+                indices = indices[(prices[indices] > price) | ((prices[indices] == price) & (car_ids[indices] > car_id))]
+            page = indices
+            if len(page) > limit:
+                kth = np.partition(prices[page], limit - 1)[limit - 1]
+                page = page[prices[page] <= kth]
+            page = page[np.lexsort((car_ids[page], prices[page]))][:limit]
+            last = [float(prices[page[-1]]), int(car_ids[page[-1]])] if len(page) else None
+        else:
+            indices = match_cars(inventory, search["preferences"], search.get("require_shop", True), search.get("require_window", False))
+            if cursor is not None:
+                indices = indices[np.searchsorted(car_ids[indices], cursor[0], side="right"):]
+            page = indices[:limit]
+            last = [int(car_ids[page[-1]])] if len(page) else None
+        return car_rows(inventory, page), last, len(indices) - len(page)
+
+
+def to_car(row, fields=CAR_FIELDS):
+    """
+    Converts a (Model, Brand, Year, Color, PricePerDay, Location) row for the
+    templates, keeping the given fields.
+    """
+    car = dict(zip(CAR_FIELDS, row))
+    return {field: car[field] for field in fields}
+
+
+def get_continuation():
+    """
+    Returns the continuation of the current turn's answer, {"token", "shown",
+    "total"}, or None when the whole list was shown.
+    """
+    turn = _turn.get()
+    return turn["continuation"] if turn is not None else None
+
+
+def get_pagination_stats():
+    """
+    Returns how many first and next pages were listed and how many
+    continuation tokens had expired.
+    """
+    with _lock:
+        return dict(pagination_stats)
+
+
+def _keep_listing(listing, remaining):
+    """
+    Keeps a listing with a new token in the session of the current turn.
+    """
+    turn = _turn.get()
+    if turn is None or turn["session"] is None:
+        return
+    listing["token"] = secrets.token_urlsafe(12)
+    turn["session"]["listing"] = listing
+    turn["continuation"] = {"token": listing["token"], "shown": listing["shown"], "total": listing["shown"] + remaining}
+
+
+def _drop_listing():
+    """
+    Forgets the listing kept in the session of the current turn.
+    """
+    turn = _turn.get()
+    if turn is not None and turn["session"] is not None:
+        turn["session"].pop("listing", None)
+
+
+def _count(name):
+    with _lock:
+        pagination_stats[name] += 1
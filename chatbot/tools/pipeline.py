@@ -0,0 +1,191 @@
+# pipeline.py
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for the independent stages of a chat turn (LLM calls are I/O bound)
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "16"))
+DEFAULT_STAGE_TIMEOUT = float(os.getenv("PIPELINE_STAGE_TIMEOUT", "30"))
+
+executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="pipeline")
+
+# Bounded pool for the blocking database and cache work of the async server;
+# LLM calls are awaited on the event loop and do not hold a thread
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", "16"))
+blocking_executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+# Small pool of its own for the background LLM polish of template answers, so
+# polishing never holds the workers the stages of a turn are waiting for
+POLISH_MAX_WORKERS = int(os.getenv("POLISH_MAX_WORKERS", "2"))
+polish_executor = ThreadPoolExecutor(max_workers=POLISH_MAX_WORKERS, thread_name_prefix="polish")
+
+# Cancellation flags of the stage running in the current context and of the stages that started it
+_cancel_events = contextvars.ContextVar("pipeline_cancel_events", default=())
+
+_NO_DEFAULT = object()
+
+
+class StageTimeout(Exception):
+    """Raised when a stage without a default value does not finish in time."""
+
+
+class StageCancelled(Exception):
+    """Raised by a stage that noticed it was cancelled."""
+
+
+def stage(fn, *args, timeout=None, default=_NO_DEFAULT, **kwargs):
+    """
+    Describes a pipeline stage: the callable with its arguments, an optional
+    timeout in seconds and an optional default returned on timeout or error.
+    """
+    return {"fn": fn, "args": args, "kwargs": kwargs, "timeout": timeout, "default": default}
+
+
+def is_cancelled():
+    """
+    Returns True when the stage running in the current context was cancelled.
+    Long running stages can check this before starting expensive work.
+    """
+    return any(event.is_set() for event in _cancel_events.get())
+
+
+def raise_if_cancelled():
+    """
+    Raises StageCancelled when the current stage was cancelled.
+    """
+    if is_cancelled():
+        raise StageCancelled("Stage was cancelled")
+
+
+def _run_in_context(context, event, fn, args, kwargs):
+    """
+    Runs a stage inside a copy of the caller's context with its cancellation flag set.
+    Cancelling a stage also cancels the stages it started.
+    """
+    def target():
+        _cancel_events.set((event,) + _cancel_events.get())
+        return fn(*args, **kwargs)
+    return context.run(target)
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Starts a callable on the pipeline pool in a copy of the current context.
+    Returns the future and the event used to cancel it.
+    """
+    event = threading.Event()
+    future = executor.submit(_run_in_context, contextvars.copy_context(), event, fn, args, kwargs)
+    return future, event
+
+
+def start_thread(fn, *args, **kwargs):
+    """
+    Starts a callable on a thread of its own in a copy of the current
+    context, for work that waits on stages of the pipeline pool (a whole
+    chat turn) and so must not hold one of its workers.
+    Returns the thread and the event used to cancel it.
+    """
+    event = threading.Event()
+    thread = threading.Thread(
+        target=_run_in_context, args=(contextvars.copy_context(), event, fn, args, kwargs), daemon=True
+    )
+    thread.start()
+    return thread, event
+
+
+def run_stages(stages, timeout=DEFAULT_STAGE_TIMEOUT):
+    """
+    Runs stages that have no data dependency between them concurrently and
+    returns a dictionary with the result of each stage by name.
+    A stage that times out or fails returns its default; without a default
+    the remaining stages are cancelled and the error is raised.
+    """
+    started = time.monotonic()
+    futures = {}
+    events = {}
+    for name, spec in stages.items():
+        futures[name], events[name] = submit(spec["fn"], *spec["args"], **spec["kwargs"])
+
+    results = {}
+    try:
+        for name, spec in stages.items():
+            stage_timeout = spec["timeout"] if spec["timeout"] is not None else timeout
+            remaining = max(0.0, started + stage_timeout - time.monotonic())
+            try:
+                results[name] = futures[name].result(timeout=remaining)
+            except TimeoutError:
+                logger.warning("Pipeline stage '%s' timed out after %ss", name, stage_timeout)
+                events[name].set()
+                futures[name].cancel()
+                if spec["default"] is _NO_DEFAULT:
+                    raise StageTimeout(f"Stage '{name}' timed out after {stage_timeout}s")
+                results[name] = spec["default"]
+            except Exception as e:
+                if spec["default"] is _NO_DEFAULT:
+                    raise
+                logger.warning("Pipeline stage '%s' failed: %s", name, e)
+                results[name] = spec["default"]
+    except Exception:
+        cancel_all(futures, events)
+        raise
+
+    return results
+
+
+def cancel_all(futures, events):
+    """
+    Cancels pending stages and flags running ones so they can stop early.
+    """
+    for name, future in futures.items():
+        events[name].set()
+        future.cancel()
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Runs blocking work (SQLite queries, cache files) on the bounded blocking
+    pool in a copy of the current context and awaits its result.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, lambda: context.run(fn, *args, **kwargs))
+
+
+async def run_stages_async(stages, timeout=DEFAULT_STAGE_TIMEOUT):
+    """
+    Async counterpart of run_stages for stages whose function is a coroutine
+    function. A stage that times out is cancelled; defaults and errors are
+    handled the same way.
+    """
+    started = time.monotonic()
+    tasks = {name: asyncio.ensure_future(spec["fn"](*spec["args"], **spec["kwargs"])) for name, spec in stages.items()}
+
+    results = {}
+    try:
+        for name, spec in stages.items():
+            stage_timeout = spec["timeout"] if spec["timeout"] is not None else timeout
+            remaining = max(0.0, started + stage_timeout - time.monotonic())
+            try:
+                results[name] = await asyncio.wait_for(tasks[name], remaining)
+            except asyncio.TimeoutError:
+                logger.warning("Pipeline stage '%s' timed out after %ss", name, stage_timeout)
+                if spec["default"] is _NO_DEFAULT:
+                    raise StageTimeout(f"Stage '{name}' timed out after {stage_timeout}s")
+                results[name] = spec["default"]
+            except Exception as e:
+                if spec["default"] is _NO_DEFAULT:
+                    raise
+                logger.warning("Pipeline stage '%s' failed: %s", name, e)
+                results[name] = spec["default"]
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    return results
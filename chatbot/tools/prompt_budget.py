@@ -0,0 +1,153 @@
+# prompt_budget.py
+import math
+import os
+import re
+
+# Tokens the text of a listing may take in an LLM prompt, besides the system
+# prompt; longer lists are summarized (see summarize_cars)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "400"))
+
+# Example cars named per group of a summary, at most
+SAMPLES_PER_GROUP = 2
+
+# Groupings tried for a summary, the one with the fewest groups wins
+GROUP_KEYS = ("brand", "location")
+
+_PIECE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """
+    Estimates the tokens of a text without calling the provider: about four
+    letters or three digits per token and one per punctuation mark, which
+    errs on the high side for English.
+    """
+    tokens = 0
+    for piece in _PIECE.findall(text):
+        if piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def summarize_cars(cars, budget):
+    """
+    Describes a list of cars in at most budget tokens: the cars are grouped
+    by brand or by location, and each group gets its size, its price and
+    year ranges and a few example cars. Examples, then the smallest groups,
+    are left out until the summary fits. The summary only depends on the
+    cars, in a fixed order, so identical lists give identical prompts.
+    """
+    key, groups = _group_cars(cars)
+    for samples in range(SAMPLES_PER_GROUP, -1, -1):
+        lines, costs = _fit_sentences(groups, samples, budget)
+        if len(lines) == len(groups):
+            return " ".join(lines)
+
+    # Even without examples the groups do not fit: keep the largest ones
+    # that leave room to count the others
+    for kept in range(len(lines), 0, -1):
+        rest = groups[kept:]
+        tail = _rest_sentence(sum(len(members) for _, members in rest), len(rest), key, others=True)
+        if sum(costs[:kept]) + estimate_tokens(tail) <= budget:
+            return " ".join(lines[:kept] + [tail])
+    return _rest_sentence(len(cars), len(groups), key, others=False)
+
+
+def _fit_sentences(groups, samples, budget):
+    """
+    Returns the sentences of the groups, and their token counts, until the
+    next one would exceed the budget.
+    """
+    lines, costs, used = [], [], 0
+    for name, members in groups:
+        line = _group_sentence(name, members, samples)
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        costs.append(cost)
+        used += cost
+    return lines, costs
+
+
+def _group_cars(cars):
+    """
+    Returns the grouping key with the fewest distinct values among the cars
+    and the (name, cars) groups for it, largest first.
+    """
+    best_key, best = None, None
+    for key in GROUP_KEYS:
+        if not all(car.get(key) for car in cars):
+            continue
+        groups = {}
+        for car in cars:
+            groups.setdefault(car[key], []).append(car)
+        if best is None or len(groups) < len(best):
+            best_key, best = key, groups
+    if best is None:
+        best = {"": list(cars)}
+    return best_key, sorted(best.items(), key=lambda item: (-len(item[1]), str(item[0])))
+
+
+def _group_sentence(name, cars, samples):
+    """
+    One sentence per group, e.g., "12 Toyota cars from $50.00 to $90.00 per
+    day, from 2019 to 2023, such as the Corolla (2022, red) for $50.00 per day."
+    """
+    label = f"{name} car" if name else "car"
+    sentence = f"{len(cars)} {label}" + ("" if len(cars) == 1 else "s")
+
+    prices = [car["price"] for car in cars if car.get("price") is not None]
+    if prices:
+        low, high = min(prices), max(prices)
+        sentence += f" at ${low:.2f} per day" if low == high else f" from ${low:.2f} to ${high:.2f} per day"
+    years = [car["year"] for car in cars if car.get("year")]
+    if years:
+        sentence += f", from {min(years)}" if min(years) == max(years) else f", from {min(years)} to {max(years)}"
+
+    examples = [_describe(car, name) for car in _representatives(cars, samples)]
+    if examples:
+        sentence += ", such as " + " and ".join(examples)
+    return sentence + "."
+
+
+def _representatives(cars, samples):
+    """
+    The cheapest car of each model, cheapest models first.
+    """
+    chosen = []
+    seen = set()
+    if not samples:
+        return chosen
+    for car in sorted(cars, key=lambda car: (car.get("price") or 0, str(car.get("model")), str(car.get("brand")))):
+        model = (car.get("brand"), car.get("model"))
+        if model not in seen:
+            seen.add(model)
+            chosen.append(car)
+        if len(chosen) == samples:
+            break
+    return chosen
+
+
+def _describe(car, group):
+    parts = [str(part) for part in [car.get("brand"), car.get("model")] if part and part != group]
+    details = [str(car["year"])] if car.get("year") else []
+    if car.get("color"):
+        details.append(car["color"].lower())
+    text = "the " + " ".join(parts) + (f" ({', '.join(details)})" if details else "")
+    if car.get("price") is not None:
+        text += f" for ${car['price']:.2f} per day"
+    if car.get("location") and car["location"] != group:
+        text += f" in {car['location']}"
+    return text
+
+
+def _rest_sentence(cars, groups, key, others):
+    noun = f"{key}s" if key and groups != 1 else (key or "group")
+    if others:
+        return f"Plus {cars} more cars in {groups} other {noun}."
+    return f"{cars} cars in {groups} {noun}."
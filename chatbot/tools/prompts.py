@@ -0,0 +1,23 @@
+# prompts.py
+
+
+def format_chat_prompt(system_prompt, text):
+    """
+    Returns the text sent to the LLM for a system prompt and a user message.
+    """
+    # Imported on first use: langchain_core is the slowest import of the server
+    from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
+
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=text)
+    ]
+    prompt = ChatPromptTemplate(messages)
+    return prompt.format()
+
+
+def load_prompts():
+    """
+    Imports the prompt library ahead of the first request (see tools/warmup.py).
+    """
+    format_chat_prompt("", "")
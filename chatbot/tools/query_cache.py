@@ -0,0 +1,305 @@
+# query_cache.py
+import hashlib
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from tools.entity_extractor import extract_entities
+from tools.intent_router import AMBIGUOUS_WORDS, BOOKING_WORDS, PRICE_WORDS, RECOMMENDATION_WORDS
+from tools.tracing import record_cache
+
+# "on" reuses the understanding of a similar earlier query instead of calling
+# the LLM, "shadow" still calls the LLM and only measures how often the reused
+# answer would have agreed with it (see shadow_accuracy in the stats), "off"
+# disables the cache. Switch to "on" once the measured accuracy allows it.
+QUERY_CACHE_MODE = os.getenv("QUERY_CACHE_MODE", "shadow")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+# Minimum Jaccard similarity between the canonical forms of two queries
+SIMILARITY_THRESHOLD = float(os.getenv("QUERY_SIMILARITY_THRESHOLD", "0.8"))
+
+# MinHash signature split into LSH bands: two queries become candidates when
+# one band is identical, which is likely above ~0.6 similarity and unlikely below.
+# The 32 hash functions are the 16-bit words of one 64-byte BLAKE2b digest;
+# candidates are checked with the exact similarity, so collisions only cost time.
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+_ROWS_PER_BAND = MINHASH_PERMUTATIONS // LSH_BANDS
+_HASH_WORDS = struct.Struct(f"<{MINHASH_PERMUTATIONS}H")
+
+# Words that carry no meaning for the intent or the preferences
+STOPWORDS = {
+    "a", "an", "the", "any", "some", "me", "my", "i", "im", "i'm", "you", "your", "we", "us", "our",
+    "show", "give", "get", "find", "see", "list", "tell", "let", "know",
+    "do", "does", "have", "has", "is", "are", "there", "it", "its", "to", "of", "please", "pls",
+    "can", "could", "would", "will", "like", "want", "need", "looking", "look",
+    "what", "which", "hi", "hello", "hey", "thanks", "thank",
+    # Left over by plural entities, e.g., "teslas"
+    "s",
+}
+# Words that change the answer on their own: two queries are only similar
+# when they contain the same ones, e.g., "not red cars" never reuses "red cars"
+DATE_WORDS = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "today", "tomorrow", "tonight", "weekend", "week", "month", "next", "last",
+}
+# Verbs that pick the intent, e.g., "book a red Toyota" and "return a red Toyota"
+ACTION_WORDS = {
+    "booking", "booked", "reserved", "rent", "renting", "return", "returning", "cancel", "cancelling",
+    "change", "modify", "extend", "compare", "available", "availability",
+}
+EXACT_WORDS = DATE_WORDS | ACTION_WORDS | {
+    # The router's phrases are matched word by word, e.g., "how much"
+    word for phrase in AMBIGUOUS_WORDS + BOOKING_WORDS + PRICE_WORDS + RECOMMENDATION_WORDS
+    for word in phrase.split() if word not in STOPWORDS
+}
+
+# Entity types whose value is also a preference
+SLOT_PREFERENCES = {"color": "color", "location": "location", "brand": "brand", "year": "year", "price": "price"}
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# canonical key -> entry, in least recently used order
+_entries = OrderedDict()
+# (band index, band values) -> canonical keys sharing that band
+_buckets = {}
+_lock = threading.Lock()
+
+query_cache_stats = {
+    "exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+    "shadow_checks": 0, "shadow_intent_matches": 0, "shadow_matches": 0,
+}
+
+
+def canonicalize(query):
+    """
+    Returns the canonical form of a query: lowercase words without
+    punctuation and stopwords, where every entity found by the extractor is
+    replaced by its type (e.g., "Any red cars?" -> ("<color>", "cars")).
+    Also returns the entity values in that order, and the words that must
+    match exactly (numbers, dates, negations).
+    """
+    text = query.lower()
+    tokens = []
+    slots = []
+    position = 0
+    for entity in extract_entities(query):
+        if entity["start"] < position:
+            continue
+        tokens += _words(text[position:entity["start"]])
+        if "value" in entity:
+            kind = entity["type"] if "filter" not in entity else f"price:{entity['filter']}"
+            tokens.append(f"<{kind}>")
+            slots.append((kind, entity["value"]))
+        else:
+            # Relative years ("last year", "4 years ago") are kept as they are
+            tokens.append(f"<year:{entity['text']}>")
+        position = entity["end"]
+    tokens += _words(text[position:])
+
+    exact = tuple(sorted(token for token in tokens if _is_exact(token)))
+    return tuple(tokens), slots, exact
+
+
+def find_similar_understanding(query):
+    """
+    Returns the understanding of an earlier query with the same canonical form,
+    or of the most similar one above SIMILARITY_THRESHOLD, with the entity
+    values of this query substituted in the preferences. Returns None when
+    nothing similar was seen or when the cache is off.
+    """
+    if QUERY_CACHE_MODE not in ("on", "shadow"):
+        return None
+
+    tokens, slots, exact = canonicalize(query)
+    kinds = tuple(kind for kind, _ in slots)
+    key = (tokens, kinds)
+
+    with _lock:
+        entry = _entries.get(key)
+        hit = "exact_hits"
+        if entry is None:
+            entry = _most_similar(_shingles(tokens), kinds, exact)
+            hit = "similar_hits"
+        if entry is not None:
+            _entries.move_to_end(entry["key"])
+            understanding = adapt_understanding(entry, slots)
+        else:
+            understanding = None
+        query_cache_stats[hit if understanding is not None else "misses"] += 1
+
+    record_cache("understanding", understanding is not None)
+    return understanding
+
+
+def remember_understanding(query, understanding, cached=None):
+    """
+    Stores the understanding answered by the LLM for a query. In shadow mode,
+    cached is what the cache found for the query and is compared with the
+    LLM answer.
+    """
+    if QUERY_CACHE_MODE not in ("on", "shadow"):
+        return
+
+    tokens, slots, exact = canonicalize(query)
+    kinds = tuple(kind for kind, _ in slots)
+    key = (tokens, kinds)
+    shingles = _shingles(tokens)
+    entry = {
+        "key": key,
+        "shingles": shingles,
+        "bands": _bands(shingles),
+        "kinds": kinds,
+        "slots": slots,
+        "exact": exact,
+        "understanding": {"intent": understanding["intent"], "preferences": dict(understanding["preferences"])},
+    }
+
+    with _lock:
+        if cached is not None:
+            query_cache_stats["shadow_checks"] += 1
+            if cached["intent"] == understanding["intent"]:
+                query_cache_stats["shadow_intent_matches"] += 1
+                if cached["preferences"] == understanding["preferences"]:
+                    query_cache_stats["shadow_matches"] += 1
+
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _unindex(previous)
+        _entries[key] = entry
+        for band in entry["bands"]:
+            _buckets.setdefault(band, set()).add(key)
+        query_cache_stats["stores"] += 1
+
+        while len(_entries) > QUERY_CACHE_SIZE:
+            _, evicted = _entries.popitem(last=False)
+            _unindex(evicted)
+            query_cache_stats["evictions"] += 1
+
+
+def adapt_understanding(entry, slots):
+    """
+    Returns the understanding of a cached entry with the entity values of the
+    new query in the preferences, or None when a preference cannot be traced
+    back to an entity of the cached query (the LLM read it differently).
+    """
+    preferences = dict(entry["understanding"]["preferences"])
+    for (kind, old), (_, new) in zip(entry["slots"], _pair_slots(entry["slots"], slots)):
+        key = SLOT_PREFERENCES.get(kind.split(":")[0])
+        if key is None or preferences.get(key) is None or _same_value(old, new):
+            continue
+        if not _same_value(preferences[key], old):
+            return None
+        preferences[key] = new
+    return {"intent": entry["understanding"]["intent"], "preferences": preferences}
+
+
+def clear_query_cache():
+    """
+    Forgets every cached understanding.
+    """
+    with _lock:
+        _entries.clear()
+        _buckets.clear()
+
+
+def get_query_cache_stats():
+    """
+    Returns the hit counters, the hit rate and, in shadow mode, the share of
+    reused answers that agreed with the LLM.
+    """
+    with _lock:
+        stats = dict(query_cache_stats)
+        stats["entries"] = len(_entries)
+    stats["mode"] = QUERY_CACHE_MODE
+    lookups = stats["exact_hits"] + stats["similar_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["exact_hits"] + stats["similar_hits"]) / lookups if lookups else 0.0
+    checks = stats["shadow_checks"]
+    stats["shadow_intent_accuracy"] = stats["shadow_intent_matches"] / checks if checks else None
+    stats["shadow_accuracy"] = stats["shadow_matches"] / checks if checks else None
+    return stats
+
+
+def _is_exact(token):
+    if token.startswith("<"):
+        return token.startswith("<year:")
+    return token in EXACT_WORDS or any(char.isdigit() for char in token)
+
+
+def _words(text):
+    return [word for word in _WORD.findall(text) if word not in STOPWORDS]
+
+
+def _shingles(tokens):
+    """
+    Words and pairs of consecutive words of a canonical form.
+    """
+    return frozenset(tokens) | frozenset(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+
+
+def _bands(shingles):
+    """
+    Returns the LSH band keys of the MinHash signature of a shingle set.
+    """
+    hashes = [_HASH_WORDS.unpack(hashlib.blake2b(shingle.encode("utf-8"), digest_size=64).digest()) for shingle in shingles]
+    signature = [min(column) for column in zip(*hashes)] if hashes else [0] * MINHASH_PERMUTATIONS
+    return [
+        (band, tuple(signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]))
+        for band in range(LSH_BANDS)
+    ]
+
+
+def _most_similar(shingles, kinds, exact):
+    """
+    Returns the most similar entry sharing an LSH band with the query and the
+    same entity types and exact words, if it is above the threshold. Called
+    with _lock held.
+    """
+    candidates = set()
+    for band in _bands(shingles):
+        candidates |= _buckets.get(band, set())
+
+    best, best_similarity = None, SIMILARITY_THRESHOLD
+    for key in candidates:
+        entry = _entries[key]
+        if entry["kinds"] != kinds or entry["exact"] != exact:
+            continue
+        similarity = len(shingles & entry["shingles"]) / len(shingles | entry["shingles"])
+        if similarity >= best_similarity:
+            best, best_similarity = entry, similarity
+    return best
+
+
+def _unindex(entry):
+    """
+    Removes an entry from the LSH buckets. Called with _lock held.
+    """
+    for band in entry["bands"]:
+        keys = _buckets.get(band)
+        if keys is not None:
+            keys.discard(entry["key"])
+            if not keys:
+                del _buckets[band]
+
+
+def _pair_slots(cached_slots, slots):
+    """
+    Orders the entities of the new query like those of the cached one, pairing
+    entities of the same type in the order they appear.
+    """
+    remaining = list(slots)
+    paired = []
+    for kind, _ in cached_slots:
+        for index, slot in enumerate(remaining):
+            if slot[0] == kind:
+                paired.append(remaining.pop(index))
+                break
+    return paired
+
+
+def _same_value(first, second):
+    if isinstance(first, (int, float)) and isinstance(second, (int, float)):
+        return float(first) == float(second)
+    return str(first).casefold() == str(second).casefold()
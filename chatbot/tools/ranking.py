@@ -0,0 +1,92 @@
+# ranking.py
+import logging
+import os
+from tools.inventory import get_inventory, car_rows, available_between, CATEGORICAL_PREFERENCES
+from tools.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Cars suggested when nothing matches every preference
+RANKING_TOP_K = int(os.getenv("RANKING_TOP_K", "5"))
+
+# Weight of each preference in the score of a car; a car that satisfies
+# every preference that is set scores their sum
+RANKING_WEIGHTS = {
+    "brand": 1.5,
+    "color": 1.0,
+    "location": 1.0,
+    "price": 1.0,
+    "year": 0.75,
+    "dates": 1.0,
+}
+# Partial credit: a car over the price ceiling loses it linearly until this
+# share of the ceiling above it, and a car of another year until this many
+# years away; 0 (or less) gives no partial credit
+PRICE_TOLERANCE = max(float(os.getenv("RANKING_PRICE_TOLERANCE", "0.5")), 0.0)
+YEAR_TOLERANCE = max(int(os.getenv("RANKING_YEAR_TOLERANCE", "4")), 0)
+
+
+def rank_cars(preferences, k=RANKING_TOP_K, require_shop=True):
+    """
+    Returns the rows of the k cars that best satisfy the preferences, from
+    the best. Color, brand, location and the availability window score
+    their full weight when they match; price and year also score part of
+    it when they are close. Ties go to the cheaper car. Cars that satisfy
+    none of the preferences are left out.
+    """
+    import numpy as np
+
+    inventory = get_inventory()
+    with span("inventory", "rank") as attributes:
+        scores = score_cars(inventory, preferences)
+        if not require_shop:
+            candidates = np.flatnonzero(scores > 0)
+        else:
+            candidates = np.flatnonzero((scores > 0) & inventory["in_shop"])
+        attributes["candidates"] = len(candidates)
+
+        # Only the k best are sorted: a partition finds the k-th best score, then
+        # the cars scoring at least that much are ordered by score and price
+        if len(candidates) > k:
+            kth = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+            candidates = candidates[scores[candidates] >= kth]
+        order = np.lexsort((inventory["price"][candidates], -scores[candidates]))
+        return car_rows(inventory, candidates[order[:k]])
+
+
+def score_cars(inventory, preferences):
+    """
+    Returns the score of every car of the inventory for the preferences.
+    """
+    import numpy as np
+
+    scores = np.zeros(len(inventory["models"]), dtype=np.float64)
+    for key in CATEGORICAL_PREFERENCES:
+        value = preferences.get(key)
+        if value:
+            code = inventory["codes"][key].get(str(value).lower())
+            if code is not None:
+                scores += RANKING_WEIGHTS[key] * (inventory[key] == code)
+
+    price = _number(preferences.get("price"))
+    if price and PRICE_TOLERANCE:
+        over = np.maximum(inventory["price"] - price, 0) / (price * PRICE_TOLERANCE)
+        scores += RANKING_WEIGHTS["price"] * np.clip(1 - over, 0, 1)
+    elif price:
+        scores += RANKING_WEIGHTS["price"] * (inventory["price"] <= price)
+
+    year = _number(preferences.get("year"))
+    if year:
+        distance = np.abs(inventory["year"] - int(year)) / (YEAR_TOLERANCE + 1)
+        scores += RANKING_WEIGHTS["year"] * np.clip(1 - distance, 0, 1)
+
+    if preferences.get("start_date") and preferences.get("end_date"):
+        scores += RANKING_WEIGHTS["dates"] * available_between(inventory, preferences["start_date"], preferences["end_date"])
+    return scores
+
+
+def _number(value):
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,417 @@
+# rendering.py
+import logging
+import os
+import threading
+from tools.enrichment import enrich_response_with_llm, enrich_response_with_llm_async, ENRICHMENT_PROMPT
+from tools.response_cache import get_cached_response, get_model_name
+from tools.pipeline import polish_executor, run_blocking, POLISH_MAX_WORKERS
+from tools.prompt_budget import estimate_tokens, summarize_cars, PROMPT_TOKEN_BUDGET
+from tools.streaming import emit_event
+
+logger = logging.getLogger(__name__)
+
+# Rendering modes:
+#   template        - deterministic template only, no LLM call
+#   llm             - template text rephrased by the LLM (previous behavior)
+#   template_polish - template now, LLM polish in the background; later
+#                     identical answers are served from the response cache
+RENDER_MODES = ("template", "llm", "template_polish")
+DEFAULT_RENDER_MODE = os.getenv("RENDER_MODE", "llm")
+
+# Per-intent overrides, e.g., RENDER_MODE_PRICE_QUERY=template
+INTENTS = [
+    "availability_query", "price_query", "color_query", "location_query", "year_query",
+    "recommendation_request", "brand_query", "booking", "general_query"
+]
+render_modes = {
+    intent: os.getenv(f"RENDER_MODE_{intent.upper()}", DEFAULT_RENDER_MODE) for intent in INTENTS
+}
+
+# Answers that never go through the LLM (errors and plain prompts for more details)
+STATIC_TEMPLATES = {
+    "database_error", "general_help",
+    "availability_missing_dates", "availability_date_error", "availability_cars", "availability_none",
+    "recommendation_fallback", "recommendation_none",
+    "booking_start", "booking_need_details", "booking_date_error", "booking_multiple", "booking_fallback", "booking_none",
+    "listing_more", "listing_none", "listing_expired",
+}
+
+# Load shedding: skip the LLM when asked to, or when too many renders are in flight
+shed_enrichment = os.getenv("SHED_ENRICHMENT", "0") == "1"
+MAX_INFLIGHT_ENRICHMENTS = int(os.getenv("MAX_INFLIGHT_ENRICHMENTS", "32"))
+
+_inflight = 0
+_inflight_lock = threading.Lock()
+_polishing = set()
+
+render_stats = {"template": 0, "llm": 0, "polish_scheduled": 0, "polish_dropped": 0, "shed": 0, "summarized": 0}
+
+
+def set_render_mode(mode, intent=None):
+    """
+    Switches the rendering mode for one intent, or for all intents when none is given.
+    """
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode: {mode}")
+    for name in ([intent] if intent else INTENTS):
+        render_modes[name] = mode
+
+
+def set_shed_enrichment(enabled):
+    """
+    Turns load shedding on or off. While on, every answer uses its template.
+    """
+    global shed_enrichment
+    shed_enrichment = enabled
+
+
+def get_render_stats():
+    """
+    Returns how many answers were rendered by template or by the LLM.
+    """
+    with _inflight_lock:
+        stats = dict(render_stats)
+        stats["inflight"] = _inflight
+    stats["modes"] = dict(render_modes)
+    stats["shedding"] = shed_enrichment
+    return stats
+
+
+def render_reply(intent, template, context, llm, system_prompt=ENRICHMENT_PROMPT):
+    """
+    Renders a node or agent answer from one of the TEMPLATES using the mode
+    configured for the intent. The template text is also the input given
+    to the LLM, so both modes state the same facts (a long list of cars is
+    summarized for the LLM, see prompt_text).
+    """
+    text = render_template(template, context)
+    mode = _reply_mode(intent, template)
+
+    if mode in ("static", "template", "shed"):
+        return _template_reply(text, shed=mode == "shed")
+
+    prompt = prompt_text(template, context, text)
+    if mode == "template_polish":
+        cached = get_cached_response(system_prompt, prompt, get_model_name(llm))
+        if cached is not None:
+            emit_event("token", {"text": cached})
+            return cached
+        schedule_polish(prompt, llm, system_prompt)
+        return _template_reply(text)
+
+    if not _start_enrichment():
+        return _template_reply(text, shed=True)
+    try:
+        return enrich_response_with_llm(prompt, llm, system_prompt)
+    finally:
+        _finish_enrichment()
+
+
+async def render_reply_async(intent, template, context, llm, system_prompt=ENRICHMENT_PROMPT):
+    """
+    Async counterpart of render_reply for the async server: same modes and
+    load shedding, but the LLM call is awaited instead of holding a thread.
+    """
+    text = render_template(template, context)
+    mode = _reply_mode(intent, template)
+
+    if mode in ("static", "template", "shed"):
+        return _template_reply(text, shed=mode == "shed")
+
+    prompt = prompt_text(template, context, text)
+    if mode == "template_polish":
+        cached = await run_blocking(get_cached_response, system_prompt, prompt, get_model_name(llm))
+        if cached is not None:
+            emit_event("token", {"text": cached})
+            return cached
+        schedule_polish(prompt, llm, system_prompt)
+        return _template_reply(text)
+
+    if not _start_enrichment():
+        return _template_reply(text, shed=True)
+    try:
+        return await enrich_response_with_llm_async(prompt, llm, system_prompt)
+    finally:
+        _finish_enrichment()
+
+
+def render_template(template, context):
+    """
+    Returns the text of a template filled with the given context.
+    """
+    return TEMPLATES[template](context)
+
+
+def prompt_text(template, context, text):
+    """
+    Returns the text given to the LLM for an answer: the template text, or,
+    when it exceeds PROMPT_TOKEN_BUDGET, the template with its list of cars
+    summarized to fit (see summarize_cars). The summary comes after the
+    system prompt and only depends on the cars, so repeated questions send
+    the same prompt and keep provider-side prompt caching effective.
+    """
+    cars = context.get("cars")
+    if not cars or estimate_tokens(text) <= PROMPT_TOKEN_BUDGET:
+        return text
+    skeleton = estimate_tokens(render_template(template, dict(context, car_summary="")))
+    summary = summarize_cars(cars, max(PROMPT_TOKEN_BUDGET - skeleton, 0))
+    with _inflight_lock:
+        render_stats["summarized"] += 1
+    return render_template(template, dict(context, car_summary=summary))
+
+
+def schedule_polish(text, llm, system_prompt):
+    """
+    Asks the LLM to polish a template answer in the background and stores the
+    result in the response cache. Duplicate requests are ignored, and so are
+    requests made while every worker of the polish pool is busy.
+    """
+    key = (system_prompt, text)
+    with _inflight_lock:
+        if key in _polishing:
+            return
+        if len(_polishing) >= POLISH_MAX_WORKERS:
+            render_stats["polish_dropped"] += 1
+            return
+        _polishing.add(key)
+        render_stats["polish_scheduled"] += 1
+
+    def polish():
+        try:
+            enrich_response_with_llm(text, llm, system_prompt)
+        except Exception as e:
+            logger.warning("Background polish failed: %s", e)
+        finally:
+            with _inflight_lock:
+                _polishing.discard(key)
+
+    # Submitted without the caller's context so nothing is streamed to the client
+    polish_executor.submit(polish)
+
+
+def _reply_mode(intent, template):
+    """
+    Returns how an answer is rendered: "static" for templates that never go
+    through the LLM, "shed" while shedding load, otherwise the intent's mode.
+    """
+    mode = render_modes.get(intent, DEFAULT_RENDER_MODE)
+    if template in STATIC_TEMPLATES:
+        return "static"
+    if mode != "template" and shed_enrichment:
+        return "shed"
+    return mode
+
+
+def _start_enrichment():
+    """
+    Counts an LLM render in flight, or returns False when too many already are.
+    """
+    global _inflight
+    with _inflight_lock:
+        if _inflight >= MAX_INFLIGHT_ENRICHMENTS:
+            return False
+        _inflight += 1
+        render_stats["llm"] += 1
+    return True
+
+
+def _finish_enrichment():
+    """
+    Marks an LLM render as finished.
+    """
+    global _inflight
+    with _inflight_lock:
+        _inflight -= 1
+
+
+def _template_reply(text, shed=False):
+    """
+    Counts and streams an answer rendered from its template.
+    """
+    with _inflight_lock:
+        render_stats["template"] += 1
+        if shed:
+            render_stats["shed"] += 1
+    emit_event("token", {"text": text})
+    return text
+
+
+# Template helpers
+
+def describe_car(car):
+    """
+    Describes a car, e.g., "the Toyota Corolla (2022, red)".
+    """
+    name = " ".join(str(part) for part in [car.get("brand"), car.get("model")] if part)
+    details = [str(car["year"])] if car.get("year") else []
+    if car.get("color"):
+        details.append(car["color"].lower())
+    return f"the {name}" + (f" ({', '.join(details)})" if details else "")
+
+
+def car_sentence(car):
+    """
+    One sentence per car, with the price and location when known.
+    """
+    sentence = capitalize_first(describe_car(car)) + " is available"
+    if car.get("price") is not None:
+        sentence += f" for ${car['price']:.2f} per day"
+    if car.get("location"):
+        sentence += f" in {car['location']}"
+    return sentence + "."
+
+
+def car_sentences(cars):
+    """
+    Joins the sentences of several cars.
+    """
+    return " ".join(car_sentence(car) for car in cars)
+
+
+def car_list(context, sentences=car_sentences):
+    """
+    The cars of a listing as sentences, or their summary when the listing
+    is rendered for an LLM prompt that would exceed its budget.
+    """
+    if "car_summary" in context:
+        return context["car_summary"]
+    return sentences(context["cars"])
+
+
+def price_sentences(cars):
+    """
+    One sentence per model with its daily price, and monthly price when known.
+    """
+    return " ".join(
+        f"The {car['model']} costs ${car['price']:.2f} per day"
+        + (f" or ${car['monthly_price']:.2f} per month." if car.get("monthly_price") is not None else ".")
+        for car in cars
+    )
+
+
+def capitalize_first(text):
+    """
+    Capitalizes the first letter only, keeping names such as "BMW" intact.
+    """
+    return text[:1].upper() + text[1:]
+
+
+def count_cars(cars, noun="car", total=None):
+    """
+    Returns "1 car" or "3 cars"; total counts the cars of a list shown one page at a time.
+    """
+    count = len(cars) if total is None else total
+    return f"{count} {noun}" + ("" if count == 1 else "s")
+
+
+def more_sentence(context):
+    """
+    Tells how to see the rest of a list when only its first page is shown.
+    """
+    total = context.get("total")
+    shown = context.get("shown", len(context["cars"]))
+    if total is None or shown >= total:
+        return ""
+    return f" These are {shown} of {total}; say \"show more\" to see the next ones."
+
+
+HELP_SENTENCE = "Let me know if you'd like to book one of them or need anything else."
+
+
+TEMPLATES = {
+    # Shared
+    "database_error": lambda c: "Sorry, I couldn't look that up right now. Please try again in a moment.",
+    "general_help": lambda c: "I'm here to help! You can ask for car prices, availability, or recommendations.",
+
+    # Brand node
+    "brand_missing": lambda c: "Please specify a valid brand in your query. For example, BMW, Tesla, or Toyota.",
+    "brand_cars": lambda c: (
+        f"We have {count_cars(c['cars'], total=c.get('total'))} by {c['brand']}. {car_list(c)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "brand_no_cars": lambda c: f"Sorry, we don't have any cars by {c['brand']} right now. Would you like to see another brand?",
+
+    # Color node
+    "color_missing": lambda c: "Please specify a color in your query.",
+    "color_cars": lambda c: (
+        f"Here are the cars available in {c['color']}. {car_list(c)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "color_no_cars": lambda c: f"Sorry, no cars are available in {c['color']} right now. Would you like to try another color?",
+
+    # Location node
+    "location_unknown": lambda c: (
+        "We currently don't have any shops in the specified location. "
+        f"Our available shops are in: {', '.join(c['locations'])}."
+    ),
+    "location_cars": lambda c: (
+        f"We have {count_cars(c['cars'], total=c.get('total'))} available in {c['location']}. {car_list(c)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "location_no_cars": lambda c: f"Sorry, no cars are available in {c['location']} right now.",
+
+    # Price node
+    "price_missing": lambda c: "Please specify a car brand, model, or price range to provide price information.",
+    "price_filter": lambda c: (
+        f"Here are the cars available for {c['comparison']} ${c['price']:.2f} per day. {car_list(c)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "price_filter_none": lambda c: f"Sorry, no cars are available for {c['comparison']} ${c['price']:.2f} per day.",
+    "price_model": lambda c: (
+        f"The {c['model']} costs ${c['daily_price']:.2f} per day"
+        + (f" or ${c['monthly_price']:.2f} per month." if c.get("monthly_price") is not None else ".")
+    ),
+    "price_model_none": lambda c: f"Sorry, price information for the {c['model']} is not available.",
+    "price_brand": lambda c: (
+        f"Here are the prices for {c['brand']} models. {car_list(c, price_sentences)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "price_brand_none": lambda c: f"Sorry, no pricing information is available for {c['brand']}.",
+
+    # Year node
+    "year_missing": lambda c: "Please specify a valid year in your query. For example, 'cars from 2022' or 'cars from four years ago.'",
+    "year_cars": lambda c: (
+        f"We have {count_cars(c['cars'], total=c.get('total'))} from {c['year']}. {car_list(c)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "year_no_cars": lambda c: f"Sorry, no cars from {c['year']} are available.",
+
+    # Availability node
+    "availability_missing_dates": lambda c: "Please specify valid start and end dates in YYYY-MM-DD format or natural language.",
+    "availability_date_error": lambda c: "Sorry, I couldn't understand those dates. Please try a format like 'January 5' or '2024-01-05'.",
+    "availability_cars": lambda c: (
+        f"Here are the cars available from {c['start_date']} to {c['end_date']}. {car_sentences(c['cars'])}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "availability_none": lambda c: f"No cars are available from {c['start_date']} to {c['end_date']}.",
+
+    # Recommendation agent
+    "recommendation_cars": lambda c: (
+        f"I found {count_cars(c['cars'], total=c.get('total'))} matching your preferences. {car_list(c)}{more_sentence(c)} {HELP_SENTENCE}"
+    ),
+    "recommendation_fallback": lambda c: (
+        f"Sorry, no cars fully matched your preferences. However, you might like these. {car_sentences(c['cars'])}"
+    ),
+    "recommendation_none": lambda c: "Unfortunately, no cars matched your preferences.",
+
+    # Booking agent
+    "booking_start": lambda c: "Great! Let's start your booking. What are your preferences for the car? (e.g., color, brand, location, date range).",
+    "booking_need_details": lambda c: "I still need more details to help you. Could you share your preferences for the car? (e.g., color, brand, location, etc.)",
+    "booking_date_error": lambda c: "Sorry, I couldn't understand those dates. Please try a format like 'January 5' or '2024-01-05'.",
+    "booking_option": lambda c: (
+        f"{capitalize_first(describe_car(c['car']))} is a great option for you at ${float(c['car']['price']):.2f} per day "
+        f"in {c['car']['location']}. Please note this is a suggested option, not a final confirmation. "
+        "I'm available to help with recommendations, more bookings, or any questions."
+    ),
+    "booking_multiple": lambda c: (
+        "I found multiple cars matching your preferences. Please choose one from the options below. "
+        + " ".join(f"Option {idx + 1} is {describe_car(car)} for ${car['price']:.2f} per day in {car['location']}." for idx, car in enumerate(c["cars"]))
+        + more_sentence(c)
+    ),
+    "booking_fallback": lambda c: (
+        "No exact matches were found for your preferences, but you might be interested in the following cars. "
+        + car_sentences(c["cars"])
+    ),
+    "booking_none": lambda c: "Unfortunately, I couldn't find any cars matching your preferences. Please try adjusting your criteria or starting over.",
+
+    # Next pages of a list (see tools/pagination.py)
+    "listing_more": lambda c: (
+        f"Here {'is' if len(c['cars']) == 1 else 'are'} {count_cars(c['cars'], noun='more car')}. {car_sentences(c['cars'])}"
+        + (more_sentence(c) or f" That's all {c['total']} of them.") + f" {HELP_SENTENCE}"
+    ),
+    "listing_none": lambda c: "There is nothing more to show. Ask me for cars by brand, color, location, price or dates.",
+    "listing_expired": lambda c: "That page was already shown or has expired. Say \"show more\" to continue your latest list.",
+}
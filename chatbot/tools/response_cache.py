@@ -0,0 +1,199 @@
+# response_cache.py
+import logging
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from tools.database import DATABASE_PATH, get_inventory_version
+from tools.tracing import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Disk store shared by every server worker, kept next to rental_car.db
+CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(DATABASE_PATH), "response_cache.db")
+)
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+MEMORY_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+DISK_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_DISK_ENTRIES", "50000"))
+
+# In-process LRU: key -> (response, created_at, inventory_version)
+_memory = OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+
+cache_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+
+def make_cache_key(prompt_template, base_response, model):
+    """
+    Builds the cache key from the prompt template, the base response and the model.
+    """
+    payload = json.dumps([prompt_template, base_response, model])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_model_name(llm):
+    """
+    Returns the model name of an LLM client for use in cache keys.
+    """
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def get_cached_response(prompt_template, base_response, model):
+    """
+    Returns the cached LLM response, or None on a miss.
+    Entries expire after CACHE_TTL seconds or when the inventory changes.
+    """
+    if not CACHE_ENABLED:
+        return None
+
+    key = make_cache_key(prompt_template, base_response, model)
+    version = get_inventory_version()
+    now = time.time()
+
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            response, created_at, entry_version = entry
+            if now - created_at <= CACHE_TTL and entry_version == version:
+                _memory.move_to_end(key)
+                cache_stats["memory_hits"] += 1
+                record_cache("response", True)
+                return response
+            del _memory[key]
+
+    try:
+        conn = _get_connection()
+        row = conn.execute(
+            "SELECT Response, CreatedAt, InventoryVersion FROM ResponseCache WHERE CacheKey = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            response, created_at, entry_version = row
+            if now - created_at <= CACHE_TTL and entry_version == version:
+                conn.execute("UPDATE ResponseCache SET LastUsed = ? WHERE CacheKey = ?", (now, key))
+                conn.commit()
+                _remember(key, response, created_at, entry_version)
+                with _lock:
+                    cache_stats["disk_hits"] += 1
+                record_cache("response", True)
+                return response
+            conn.execute("DELETE FROM ResponseCache WHERE CacheKey = ?", (key,))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.warning("Response cache error: %s", e)
+
+    with _lock:
+        cache_stats["misses"] += 1
+    record_cache("response", False)
+    return None
+
+
+def set_cached_response(prompt_template, base_response, model, response):
+    """
+    Stores an LLM response in memory and in the shared disk store.
+    """
+    if not CACHE_ENABLED:
+        return
+
+    key = make_cache_key(prompt_template, base_response, model)
+    version = get_inventory_version()
+    now = time.time()
+    _remember(key, response, now, version)
+
+    try:
+        conn = _get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO ResponseCache (CacheKey, Response, CreatedAt, LastUsed, InventoryVersion) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, response, now, now, version)
+        )
+        conn.commit()
+        with _lock:
+            cache_stats["stores"] += 1
+            stores = cache_stats["stores"]
+        # Trim the disk store now and then instead of on every write
+        if stores % 100 == 0:
+            _prune_disk(conn, now)
+    except sqlite3.Error as e:
+        logger.warning("Response cache error: %s", e)
+
+
+def invalidate_response_cache():
+    """
+    Drops every cached response, e.g., after the inventory was changed.
+    """
+    with _lock:
+        _memory.clear()
+        cache_stats["invalidations"] += 1
+    try:
+        conn = _get_connection()
+        conn.execute("DELETE FROM ResponseCache")
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning("Response cache error: %s", e)
+
+
+def get_cache_stats():
+    """
+    Returns the hit/miss counters and the hit rate of the response cache.
+    """
+    with _lock:
+        stats = dict(cache_stats)
+        stats["memory_entries"] = len(_memory)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+    return stats
+
+
+def _remember(key, response, created_at, version):
+    """
+    Adds an entry to the in-process LRU, evicting the least recently used ones.
+    """
+    with _lock:
+        _memory[key] = (response, created_at, version)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_MAX_ENTRIES:
+            _memory.popitem(last=False)
+            cache_stats["evictions"] += 1
+
+
+def _prune_disk(conn, now):
+    """
+    Removes expired entries and keeps the disk store under DISK_MAX_ENTRIES.
+    """
+    conn.execute("DELETE FROM ResponseCache WHERE CreatedAt < ?", (now - CACHE_TTL,))
+    conn.execute(
+        "DELETE FROM ResponseCache WHERE CacheKey IN ("
+        "SELECT CacheKey FROM ResponseCache ORDER BY LastUsed DESC LIMIT -1 OFFSET ?)",
+        (DISK_MAX_ENTRIES,)
+    )
+    conn.commit()
+
+
+def _get_connection():
+    """
+    Returns this thread's connection to the disk store, creating the table if needed.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ResponseCache (
+                CacheKey TEXT PRIMARY KEY,
+                Response TEXT NOT NULL,
+                CreatedAt REAL NOT NULL,
+                LastUsed REAL NOT NULL,
+                InventoryVersion TEXT
+            )
+        """)
+        conn.commit()
+        _local.conn = conn
+    return conn
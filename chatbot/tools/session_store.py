@@ -0,0 +1,354 @@
+# session_store.py
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from tools.database import DATABASE_PATH
+from tools.pipeline import run_blocking
+from tools.user_preferences import DEFAULT_PREFERENCES
+from tools.llm_budget import new_usage
+
+# "memory" keeps sessions in this process; "sqlite" shares them between workers
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH",
+    os.path.join(os.path.dirname(DATABASE_PATH), "sessions.db")
+)
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(60 * 60)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+# Hard cap on the serialized size of all stored sessions
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+# How long a turn may hold its session; longer than the routing timeout
+SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "90"))
+# How often the async server retries a session held by another turn
+SESSION_POLL_INTERVAL = 0.05
+
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "session_id"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class SessionBusy(Exception):
+    """Raised when another turn of the same session holds it for too long."""
+
+
+def new_session():
+    """
+    Returns the state of a new conversation: the user preferences, the
+    booking session and the LLM usage counted against the session budget.
+    """
+    return {
+        "preferences": dict(DEFAULT_PREFERENCES),
+        "booking": {"active_booking": False, "preferences": {}},
+        "llm_usage": new_usage(),
+    }
+
+
+def new_session_id():
+    """
+    Returns a random session id.
+    """
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id):
+    """
+    Checks that a session id sent by a client is safe to use as a key.
+    """
+    return bool(session_id) and SESSION_ID_PATTERN.match(session_id) is not None
+
+
+class MemorySessionStore:
+    """
+    Sessions kept in this process as serialized JSON, in least recently used
+    order. Expired sessions are dropped, and the least recently used ones are
+    evicted beyond SESSION_MAX_ENTRIES or SESSION_MAX_BYTES.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()  # id -> (data, last_used)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._session_locks = {}  # id -> [lock, number of turns waiting or holding it]
+        self.stats = {"loads": 0, "saves": 0, "expired": 0, "evictions": 0}
+
+    def acquire(self, session_id, timeout):
+        """
+        Holds the session for a turn. Returns the token to release it with,
+        or None when the session is still held after timeout seconds.
+        """
+        with self._lock:
+            entry = self._session_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        if entry[0].acquire(timeout=timeout):
+            return uuid.uuid4().hex
+        self._forget_lock(session_id, entry)
+        return None
+
+    def release(self, session_id, token):
+        with self._lock:
+            entry = self._session_locks.get(session_id)
+        if entry is not None:
+            entry[0].release()
+            self._forget_lock(session_id, entry)
+
+    def _forget_lock(self, session_id, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._session_locks.pop(session_id, None)
+
+    def load(self, session_id):
+        with self._lock:
+            self.stats["loads"] += 1
+            item = self._sessions.get(session_id)
+            if item is None:
+                return None
+            data, last_used = item
+            if time.time() - last_used > self.ttl:
+                self._remove(session_id)
+                self.stats["expired"] += 1
+                return None
+            self._sessions.move_to_end(session_id)
+        return json.loads(data)
+
+    def save(self, session_id, session):
+        data = json.dumps(session)
+        with self._lock:
+            self.stats["saves"] += 1
+            self._remove(session_id)
+            self._sessions[session_id] = (data, time.time())
+            self._bytes += len(data)
+            while self._sessions and (len(self._sessions) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._sessions))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._remove(session_id)
+
+    def _remove(self, session_id):
+        item = self._sessions.pop(session_id, None)
+        if item is not None:
+            self._bytes -= len(item[0])
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({"backend": "memory", "sessions": len(self._sessions), "bytes": self._bytes})
+        return stats
+
+
+class SQLiteSessionStore:
+    """
+    Sessions stored in a SQLite file shared by every worker. A turn holds its
+    session through a lease (LockedUntil), so two workers never interleave
+    turns of the same user; a crashed worker's lease simply runs out.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES,
+                 max_bytes=SESSION_MAX_BYTES, lease=SESSION_LOCK_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lease = lease
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"loads": 0, "saves": 0, "expired": 0, "evictions": 0}
+
+    def acquire(self, session_id, timeout):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        conn = self._get_connection()
+        while True:
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO Sessions (SessionID, Size, LastUsed, LockedUntil) VALUES (?, 0, ?, 0)",
+                    (session_id, now)
+                )
+                acquired = conn.execute(
+                    "UPDATE Sessions SET LockedUntil = ?, LockToken = ? WHERE SessionID = ? AND LockedUntil < ?",
+                    (now + self.lease, token, session_id, now)
+                ).rowcount
+            if acquired:
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(SESSION_POLL_INTERVAL)
+
+    def release(self, session_id, token):
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE Sessions SET LockedUntil = 0, LockToken = NULL WHERE SessionID = ? AND LockToken = ?",
+                (session_id, token)
+            )
+
+    def load(self, session_id):
+        self._count("loads")
+        row = self._get_connection().execute(
+            "SELECT Data, LastUsed FROM Sessions WHERE SessionID = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        if time.time() - row[1] > self.ttl:
+            self._count("expired")
+            return None
+        return json.loads(row[0])
+
+    def save(self, session_id, session):
+        data = json.dumps(session)
+        now = time.time()
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO Sessions (SessionID, Data, Size, LastUsed, LockedUntil) VALUES (?, ?, ?, ?, 0) "
+                "ON CONFLICT (SessionID) DO UPDATE SET Data = excluded.Data, Size = excluded.Size, LastUsed = excluded.LastUsed",
+                (session_id, data, len(data), now)
+            )
+        saves = self._count("saves")
+        # Evict now and then instead of on every write
+        if saves % 100 == 0:
+            self.prune()
+
+    def delete(self, session_id):
+        conn = self._get_connection()
+        with conn:
+            conn.execute("DELETE FROM Sessions WHERE SessionID = ?", (session_id,))
+
+    def prune(self):
+        """
+        Removes expired sessions, then the least recently used ones beyond the caps.
+        Sessions in the middle of a turn are kept.
+        """
+        now = time.time()
+        conn = self._get_connection()
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM Sessions WHERE LastUsed < ? AND LockedUntil < ?", (now - self.ttl, now)
+            ).rowcount
+            evicted = conn.execute(
+                "DELETE FROM Sessions WHERE LockedUntil < ? AND SessionID IN ("
+                "SELECT SessionID FROM ("
+                "SELECT SessionID, ROW_NUMBER() OVER recent AS Position, SUM(Size) OVER recent AS Total "
+                "FROM Sessions WINDOW recent AS (ORDER BY LastUsed DESC)"
+                ") WHERE Position > ? OR Total > ?)",
+                (now, self.max_entries, self.max_bytes)
+            ).rowcount
+        self._count("expired", expired)
+        self._count("evictions", evicted)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+            return self.stats[name]
+
+    def get_stats(self):
+        row = self._get_connection().execute("SELECT COUNT(*), COALESCE(SUM(Size), 0) FROM Sessions").fetchone()
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({"backend": "sqlite", "sessions": row[0], "bytes": row[1]})
+        return stats
+
+    def _get_connection(self):
+        """
+        Returns this thread's connection, creating the table if needed.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS Sessions (
+                    SessionID TEXT PRIMARY KEY,
+                    Data TEXT,
+                    Size INTEGER NOT NULL,
+                    LastUsed REAL NOT NULL,
+                    LockedUntil REAL NOT NULL,
+                    LockToken TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS SessionsLastUsed ON Sessions (LastUsed)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+
+SESSION_BACKENDS = {"memory": MemorySessionStore, "sqlite": SQLiteSessionStore}
+
+session_store = SESSION_BACKENDS[SESSION_BACKEND]()
+
+
+def set_session_store(store):
+    """
+    Replaces the session backend, e.g., with a SQLiteSessionStore on another path.
+    """
+    global session_store
+    session_store = store
+
+
+@contextmanager
+def open_session(session_id):
+    """
+    Holds the session for one chat turn: waits for other turns of the same
+    session to finish, yields its state and saves it when the turn succeeds.
+    """
+    store = session_store
+    token = store.acquire(session_id, SESSION_LOCK_TIMEOUT)
+    if token is None:
+        raise SessionBusy("Another message of this conversation is still being processed.")
+    try:
+        session = store.load(session_id) or new_session()
+        yield session
+        store.save(session_id, session)
+    finally:
+        store.release(session_id, token)
+
+
+@asynccontextmanager
+async def open_session_async(session_id):
+    """
+    Async counterpart of open_session. Waiting for the session polls the
+    store instead of blocking a thread of the blocking pool.
+    """
+    store = session_store
+    deadline = time.monotonic() + SESSION_LOCK_TIMEOUT
+    token = await run_blocking(store.acquire, session_id, 0)
+    while token is None:
+        if time.monotonic() >= deadline:
+            raise SessionBusy("Another message of this conversation is still being processed.")
+        await asyncio.sleep(SESSION_POLL_INTERVAL)
+        token = await run_blocking(store.acquire, session_id, 0)
+    try:
+        session = await run_blocking(store.load, session_id) or new_session()
+        yield session
+        await run_blocking(store.save, session_id, session)
+    finally:
+        await run_blocking(store.release, session_id, token)
+
+
+def read_session(session_id):
+    """
+    Returns a copy of the session state without holding it, or a new session.
+    """
+    return session_store.load(session_id) or new_session()
+
+
+def get_session_stats():
+    """
+    Returns the backend, the number and size of stored sessions and the eviction counters.
+    """
+    return session_store.get_stats()
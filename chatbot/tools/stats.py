@@ -0,0 +1,35 @@
+# stats.py
+from tools.intent_router import get_router_stats
+from tools.response_cache import get_cache_stats
+from tools.rendering import get_render_stats
+from tools.database import get_database_stats
+from tools.vocabulary import get_vocabulary_stats
+from tools.inventory import get_inventory_stats
+from tools.pagination import get_pagination_stats
+from tools.entity_extractor import get_extractor_stats
+from tools.session_store import get_session_stats
+from tools.llm_registry import get_llm_stats
+from tools.llm_budget import get_budget_stats
+from tools.query_cache import get_query_cache_stats
+from tools.llm_dispatcher import get_dispatcher_stats
+
+
+def collect_stats():
+    """
+    Gathers the counters reported by the /stats route of both servers.
+    """
+    return {
+        "router": get_router_stats(),
+        "response_cache": get_cache_stats(),
+        "query_cache": get_query_cache_stats(),
+        "rendering": get_render_stats(),
+        "database": get_database_stats(),
+        "vocabulary": get_vocabulary_stats(),
+        "inventory": get_inventory_stats(),
+        "pagination": get_pagination_stats(),
+        "entity_extractor": get_extractor_stats(),
+        "sessions": get_session_stats(),
+        "llm": get_llm_stats(),
+        "llm_budget": get_budget_stats(),
+        "llm_batching": get_dispatcher_stats()
+    }
@@ -0,0 +1,137 @@
+# streaming.py
+import asyncio
+import contextvars
+import json
+import queue
+from tools.pipeline import start_thread
+from tools.tracing import record_llm_usage
+from tools.llm_dispatcher import dispatch, adispatch
+
+# Callback receiving the events of the turn being streamed, None when not streaming
+_event_sink = contextvars.ContextVar("stream_event_sink", default=None)
+
+_END_OF_STREAM = object()
+
+
+def is_streaming():
+    """
+    Returns True when the current turn is served by the streaming endpoint.
+    """
+    return _event_sink.get() is not None
+
+
+def emit_event(event, data):
+    """
+    Sends a structured event (e.g., "token" or "car_details") to the client
+    when the current turn is streamed. Does nothing otherwise.
+    """
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event, data)
+
+
+def invoke_llm(llm, prompt, profile="enrichment"):
+    """
+    Calls the LLM and returns the response text. When the turn is streamed,
+    the tokens are forwarded to the client as they are generated; otherwise
+    the call is batched with the concurrent ones (see llm_dispatcher.py).
+    """
+    if not is_streaming():
+        response = dispatch(llm, prompt)
+        record_llm_usage(response, profile)
+        return response.content
+
+    chunks = []
+    for chunk in llm.stream(prompt):
+        record_llm_usage(chunk, profile)
+        if chunk.content:
+            chunks.append(chunk.content)
+            emit_event("token", {"text": chunk.content})
+    return "".join(chunks)
+
+
+async def ainvoke_llm(llm, prompt, profile="enrichment"):
+    """
+    Async counterpart of invoke_llm: awaits the LLM without holding a thread.
+    """
+    if not is_streaming():
+        response = await adispatch(llm, prompt)
+        record_llm_usage(response, profile)
+        return response.content
+
+    chunks = []
+    async for chunk in llm.astream(prompt):
+        record_llm_usage(chunk, profile)
+        if chunk.content:
+            chunks.append(chunk.content)
+            emit_event("token", {"text": chunk.content})
+    return "".join(chunks)
+
+
+def format_sse(event, data):
+    """
+    Formats an event in the server-sent events wire format.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_turn(handle_turn, *args):
+    """
+    Runs a chat turn on its own thread and yields its events as SSE. The
+    turn schedules its stages on the pipeline pool, so it must not run there.
+    The final result is sent as a "done" event, failures as an "error" event.
+    """
+    events = queue.Queue()
+
+    def run():
+        _event_sink.set(lambda event, data: events.put((event, data)))
+        try:
+            events.put(("done", handle_turn(*args)))
+        except Exception as e:
+            events.put(("error", {"error": f"An error occurred: {str(e)}"}))
+        finally:
+            events.put(_END_OF_STREAM)
+
+    thread, cancel_event = start_thread(run)
+    try:
+        while True:
+            item = events.get()
+            if item is _END_OF_STREAM:
+                break
+            yield format_sse(*item)
+    finally:
+        # The client went away before the turn finished
+        if thread.is_alive():
+            cancel_event.set()
+
+
+async def astream_turn(handle_turn, *args):
+    """
+    Async counterpart of stream_turn for a coroutine function. Events may be
+    emitted from the event loop or from the blocking pool. The turn is
+    cancelled when the client goes away.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    async def run():
+        _event_sink.set(lambda event, data: loop.call_soon_threadsafe(events.put_nowait, (event, data)))
+        try:
+            result = await handle_turn(*args)
+            loop.call_soon_threadsafe(events.put_nowait, ("done", result))
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, ("error", {"error": f"An error occurred: {str(e)}"}))
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, _END_OF_STREAM)
+
+    task = asyncio.ensure_future(run())
+    try:
+        while True:
+            item = await events.get()
+            if item is _END_OF_STREAM:
+                break
+            yield format_sse(*item)
+    finally:
+        # The client went away before the turn finished
+        if not task.done():
+            task.cancel()
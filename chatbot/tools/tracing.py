@@ -0,0 +1,210 @@
+# tracing.py
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from tools.llm_budget import charge_llm_tokens, get_budget_stats
+
+# Hot path messages are logged at DEBUG, so the default level writes nothing per request
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Adds the spans of the turn to the /chat response (debugging only)
+TRACE_RESPONSES = os.getenv("TRACE_RESPONSES", "0") == "1"
+
+METRICS_PREFIX = "chatbot"
+# Upper bounds, in seconds, of the span duration histogram buckets
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans of the current turn, None outside a traced turn
+_trace = contextvars.ContextVar("trace", default=None)
+# Attributes of the innermost open span
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_lock = threading.Lock()
+_durations = {}  # (kind, name) -> [count per bucket..., count above the last bucket, sum]
+_errors = {}  # (kind, name) -> count
+_tokens = {}  # (name, "input" or "output") -> count
+_cache_requests = {}  # (cache, "hit" or "miss") -> count
+
+
+def configure_logging(level=LOG_LEVEL):
+    """
+    Sends the log records of the chatbot to stderr at the configured level.
+    """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def start_trace():
+    """
+    Starts collecting the spans of the current turn.
+    """
+    trace = {"started": time.perf_counter(), "spans": []}
+    _trace.set(trace)
+    return trace
+
+
+def is_tracing():
+    """
+    Returns True when the spans of the current turn are collected.
+    """
+    return _trace.get() is not None
+
+
+def get_trace():
+    """
+    Returns the spans of the current turn in the order they finished.
+    """
+    trace = _trace.get()
+    return list(trace["spans"]) if trace is not None else []
+
+
+@contextmanager
+def span(kind, name=None, **attributes):
+    """
+    Times a stage of the pipeline, e.g., span("llm", "intent") or
+    span("node", "price_query"). The duration goes to the metrics and, in a
+    traced turn, to the trace together with the attributes; the yielded
+    dictionary takes attributes known only once the stage ran.
+    """
+    token = _current_span.set(attributes)
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield attributes
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _current_span.reset(token)
+        _observe(kind, name or "", duration, failed)
+        trace = _trace.get()
+        if trace is not None:
+            record = {
+                "span": kind,
+                "start_ms": round((started - trace["started"]) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+            }
+            if name:
+                record["name"] = name
+            if failed:
+                record["error"] = True
+            record.update(attributes)
+            trace["spans"].append(record)
+
+
+def record_llm_usage(message, name):
+    """
+    Counts the tokens reported in an LLM response (or streamed chunk) under
+    the given profile name, and adds them to the current span and to the
+    LLM budget of the turn.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    counts = {"input": usage.get("input_tokens", 0), "output": usage.get("output_tokens", 0)}
+    charge_llm_tokens(counts["input"], counts["output"])
+    with _lock:
+        for kind, count in counts.items():
+            _tokens[(name, kind)] = _tokens.get((name, kind), 0) + count
+    attributes = _current_span.get()
+    if attributes is not None:
+        attributes["input_tokens"] = attributes.get("input_tokens", 0) + counts["input"]
+        attributes["output_tokens"] = attributes.get("output_tokens", 0) + counts["output"]
+
+
+def record_cache(cache, hit):
+    """
+    Counts a lookup in one of the caches, and marks the current span.
+    """
+    result = "hit" if hit else "miss"
+    with _lock:
+        _cache_requests[(cache, result)] = _cache_requests.get((cache, result), 0) + 1
+    attributes = _current_span.get()
+    if attributes is not None:
+        attributes[f"{cache}_cache"] = result
+
+
+def _observe(kind, name, duration, failed):
+    with _lock:
+        buckets = _durations.get((kind, name))
+        if buckets is None:
+            buckets = _durations[(kind, name)] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                break
+        else:
+            index = len(DURATION_BUCKETS)
+        buckets[index] += 1
+        buckets[-1] += duration
+        if failed:
+            _errors[(kind, name)] = _errors.get((kind, name), 0) + 1
+
+
+def render_metrics():
+    """
+    Returns the span durations, errors, LLM calls and tokens, refused LLM
+    calls and cache lookups in the Prometheus text exposition format.
+    """
+    with _lock:
+        durations = {key: list(value) for key, value in _durations.items()}
+        errors = dict(_errors)
+        tokens = dict(_tokens)
+        cache_requests = dict(_cache_requests)
+    budget = get_budget_stats()
+
+    lines = [
+        f"# HELP {METRICS_PREFIX}_span_duration_seconds Duration of the pipeline stages.",
+        f"# TYPE {METRICS_PREFIX}_span_duration_seconds histogram",
+    ]
+    for (kind, name), buckets in sorted(durations.items()):
+        labels = f'span="{_escape(kind)}",name="{_escape(name)}"'
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, buckets):
+            cumulative += count
+            lines.append(f'{METRICS_PREFIX}_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        total = sum(buckets[:-1])
+        lines.append(f'{METRICS_PREFIX}_span_duration_seconds_bucket{{{labels},le="+Inf"}} {total}')
+        lines.append(f"{METRICS_PREFIX}_span_duration_seconds_sum{{{labels}}} {buckets[-1]:.6f}")
+        lines.append(f"{METRICS_PREFIX}_span_duration_seconds_count{{{labels}}} {total}")
+
+    lines += [
+        f"# HELP {METRICS_PREFIX}_span_errors_total Pipeline stages that raised.",
+        f"# TYPE {METRICS_PREFIX}_span_errors_total counter",
+    ]
+    for (kind, name), count in sorted(errors.items()):
+        lines.append(f'{METRICS_PREFIX}_span_errors_total{{span="{_escape(kind)}",name="{_escape(name)}"}} {count}')
+
+    lines += [
+        f"# HELP {METRICS_PREFIX}_llm_calls_total LLM calls allowed by the turn budget.",
+        f"# TYPE {METRICS_PREFIX}_llm_calls_total counter",
+    ]
+    for name, count in sorted(budget["calls"].items()):
+        lines.append(f'{METRICS_PREFIX}_llm_calls_total{{profile="{_escape(name)}"}} {count}')
+
+    lines += [
+        f"# HELP {METRICS_PREFIX}_llm_budget_exhausted_total LLM calls refused by the turn or session budget.",
+        f"# TYPE {METRICS_PREFIX}_llm_budget_exhausted_total counter",
+    ]
+    for name, limits in sorted(budget["exhausted"].items()):
+        for limit, count in sorted(limits.items()):
+            lines.append(f'{METRICS_PREFIX}_llm_budget_exhausted_total{{profile="{_escape(name)}",limit="{limit}"}} {count}')
+
+    lines += [
+        f"# HELP {METRICS_PREFIX}_llm_tokens_total Tokens reported by the LLM provider.",
+        f"# TYPE {METRICS_PREFIX}_llm_tokens_total counter",
+    ]
+    for (name, kind), count in sorted(tokens.items()):
+        lines.append(f'{METRICS_PREFIX}_llm_tokens_total{{profile="{_escape(name)}",kind="{kind}"}} {count}')
+
+    lines += [
+        f"# HELP {METRICS_PREFIX}_cache_requests_total Cache lookups by result.",
+        f"# TYPE {METRICS_PREFIX}_cache_requests_total counter",
+    ]
+    for (cache, result), count in sorted(cache_requests.items()):
+        lines.append(f'{METRICS_PREFIX}_cache_requests_total{{cache="{_escape(cache)}",result="{result}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
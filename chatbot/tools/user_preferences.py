@@ -1,88 +1,54 @@
 # user_preferences
+import logging
 
-from langchain_core.prompts.chat import SystemMessage, HumanMessage, ChatPromptTemplate
-import json
+logger = logging.getLogger(__name__)
 
 
 
 
-# Initialize user preferences
-user_preferences = {
+# Preferences of a new session
+DEFAULT_PREFERENCES = {
     "color": None,
     "location": None,
     "price_range": None,
     "brand": None,
     "year": None,
     "start_date": None,  #
-    "end_date": None     
+    "end_date": None
+}
+
+# Understanding keys that are stored under a different name
+PREFERENCE_ALIASES = {
+    "price": "price_range"
 }
 
 
 
 
-def update_preferences_from_query(query, llm):
+def update_preferences(preferences, session):
     """
-    Updates preferences based on a user query.
-    Extracts preferences using the LLM and updates the global `user_preferences`.
+    Updates the preferences stored in the user's session with preferences
+    already extracted by the understanding stage, so no extra LLM call is needed.
     """
-    # Extract preferences using the LLM
-    extracted_preferences = extract_preferences_with_llm(query, llm)
-    print("Extracted Preferences:", extracted_preferences)  
-
+    logger.debug("Extracted Preferences: %s", preferences)
 
+    # Update the session
+    user_preferences = session["preferences"]
+    for key, value in preferences.items():
+        key = PREFERENCE_ALIASES.get(key, key)
+        if key in user_preferences and value is not None:
+            user_preferences[key] = value
 
 
-    # Update the global 
-    for key in user_preferences.keys():
-        if key in extracted_preferences:
-            user_preferences[key] = extracted_preferences[key]
 
 
+    return dict(user_preferences)
 
 
-    return user_preferences
 
 
-def extract_preferences_with_llm(query, llm):
-    """
-    Extracts preferences from the user's query using LLM, including start_date and end_date.
-    """
-    messages = [
-        SystemMessage(content=(
-            "You are a car rental assistant. Analyze the user's query and extract preferences in JSON format. "
-            "Preferences include 'color', 'location', 'price', 'brand', 'year', 'start_date', and 'end_date'. "
-            "Ensure the response is valid JSON, e.g., {\"color\": \"blue\", \"start_date\": \"2023-12-01\", \"end_date\": \"2023-12-10\"}."
-        )),
-        HumanMessage(content=query)
-    ]
-    prompt = ChatPromptTemplate(messages)
-    response = llm.invoke(prompt.format())
-    try:
-        preferences = json.loads(response.content.strip())
-        print("Extracted Preferences:", preferences) 
-        return preferences
-    except json.JSONDecodeError:
-        return user_preferences  # Default fallback
-    
-
-    except (json.JSONDecodeError, ValueError) as e:
-        # lig the error and return default preferences
-        print(f"Error extracting preferences with LLM: {e}")
-        return {
-            "color": None,
-            "location": None,
-            "price": None,
-            "brand": None,
-            "year": None,
-            "start_date": None,
-            "end_date": None,
-        }
-
-
-
-
-def get_preferences():
+def get_preferences(session):
     """
-    Returns the current user preferences.
+    Returns the preferences stored in the user's session.
     """
-    return user_preferences
+    return dict(session["preferences"])
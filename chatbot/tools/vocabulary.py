@@ -0,0 +1,70 @@
+# vocabulary.py
+import logging
+import sqlite3
+import threading
+from tools.database import fetch_all, get_inventory_version
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary queries, one per entity type
+VOCABULARY_QUERIES = {
+    "brands": "SELECT DISTINCT Brand FROM Cars",
+    "models": "SELECT DISTINCT Model FROM Cars",
+    "colors": "SELECT DISTINCT Color FROM Cars",
+    "locations": "SELECT DISTINCT Location FROM Shop",
+}
+
+# Process-wide index: {"version": ..., "terms": {kind: [(lowercase, original), ...]}}
+_vocabulary = None
+_lock = threading.Lock()
+
+vocabulary_stats = {"builds": 0, "version": None}
+
+
+def get_vocabulary():
+    """
+    Returns the vocabulary index, rebuilding it only when the inventory version changed.
+    """
+    global _vocabulary
+    version = get_inventory_version()
+    vocabulary = _vocabulary
+    if vocabulary is not None and vocabulary["version"] == version:
+        return vocabulary
+
+    with _lock:
+        if _vocabulary is None or _vocabulary["version"] != version:
+            _vocabulary = build_vocabulary(version)
+        return _vocabulary
+
+
+def build_vocabulary(version):
+    """
+    Loads the brands, models, colors and locations from the database.
+    """
+    terms = {}
+    for kind, sql in VOCABULARY_QUERIES.items():
+        try:
+            values = [row[0] for row in fetch_all(sql) if row[0]]
+        except sqlite3.Error as e:
+            logger.error("Database error while building the vocabulary: %s", e)
+            values = []
+        terms[kind] = [(value.lower(), value) for value in values]
+
+    vocabulary_stats["builds"] += 1
+    vocabulary_stats["version"] = version
+    logger.info("Vocabulary built for inventory version %s: %s", version, ", ".join(f"{len(v)} {k}" for k, v in terms.items()))
+    return {"version": version, "terms": terms}
+
+
+def get_terms(kind):
+    """
+    Returns the original values of one entity type, e.g., every location.
+    """
+    return [original for _, original in get_vocabulary()["terms"][kind]]
+
+
+def get_vocabulary_stats():
+    """
+    Returns how often the vocabulary was built and the inventory version it reflects.
+    """
+    return dict(vocabulary_stats)
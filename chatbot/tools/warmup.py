@@ -0,0 +1,52 @@
+# warmup.py
+import logging
+import os
+import time
+from tools.entity_extractor import load_extractor
+from tools.prompts import load_prompts
+from tools.inventory import load_inventory
+from tools.llm_registry import get_llm, LLM_PROFILES
+
+logger = logging.getLogger(__name__)
+
+# Whether the servers warm up before accepting traffic; importing the app
+# never does, so workers that are forked from it start quickly
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+
+def warmup():
+    """
+    Loads what the first request would otherwise pay for: the entity
+    vocabulary and extractor, the prompt library, the inventory snapshot,
+    the date and number parsers and the LLM clients. Returns the seconds spent on each step.
+    """
+    steps = {
+        "extractor": load_extractor,
+        "prompts": load_prompts,
+        "inventory": load_inventory,
+        "parsers": load_parsers,
+        "llm_clients": load_llm_clients,
+    }
+    timings = {}
+    for name, step in steps.items():
+        started = time.perf_counter()
+        step()
+        timings[name] = round(time.perf_counter() - started, 4)
+    logger.info("Warmup finished: %s", timings)
+    return timings
+
+
+def load_parsers():
+    """
+    Imports the natural language date and number parsers.
+    """
+    import dateutil.parser
+    import word2number.w2n
+
+
+def load_llm_clients():
+    """
+    Creates the client of every LLM profile (no request is sent).
+    """
+    for profile in LLM_PROFILES:
+        get_llm(profile)
@@ -0,0 +1,196 @@
+# check_query_plans.py
+"""
+Guards the lookup queries against full table scans.
+
+Builds a scratch database from initialize.sql, sample_data.sql and the
+migrations, runs the nodes and agents on it while recording every statement
+they execute, and checks each filtered query with EXPLAIN QUERY PLAN.
+Exits with status 1 when a query scans Cars, Shop or CarAvailability
+without an index, when a statement fails or an error is logged while the
+lookups run, when one of the REQUIRED_STATEMENTS was not executed, or when
+a price question does not list the cars of PRICE_ANSWERS.
+
+Usage: python database/check_query_plans.py
+"""
+import logging
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(DATABASE_DIR, "..", "chatbot")
+
+# Tables that must always be searched through an index when a query filters on them
+INDEXED_TABLES = ["Cars", "Shop", "CarAvailability"]
+
+PREFERENCES = [
+    {"color": "red"},
+    {"brand": "tesla"},
+    {"location": "miami"},
+    {"year": 2022},
+    {"price": 70},
+    {"brand": "Toyota", "color": "Blue"},
+    {"color": "Red", "price": 100},
+    {"brand": "Tesla", "location": "New York", "year": 2023},
+    {"color": "Black", "start_date": "2024-01-02", "end_date": "2024-01-05"},
+]
+
+QUERIES = [
+    "red cars", "Tesla models", "cars in Miami", "cars from 2022", "cars under 70", "cars above 100",
+    "how much is the Corolla", "Toyota prices", "cars for 70",
+]
+
+# Statements the lookups must still execute, so the check keeps covering
+# the queries on the hot path: the inventory snapshot and vocabulary loads
+# and the price of a model, which still queries the database directly
+REQUIRED_STATEMENTS = {
+    "inventory snapshot": r"FROM Cars ORDER BY CarID",
+    "availability windows": r"FROM AvailabilityIndex",
+    "vocabulary": r"SELECT DISTINCT",
+    "price by model": r"FROM Cars WHERE Model = ",
+}
+
+# Price questions and the models they must list on the sample inventory
+PRICE_ANSWERS = {
+    "Toyota prices": ("price_brand", ["Corolla", "Camry", "RAV4"]),
+    "cars for 70": ("price_filter", ["Accord"]),
+    "cars under 55": ("price_filter", ["Corolla", "Camry"]),
+    "cars above 150": ("price_filter", ["Model X"]),
+    "cars for 45": ("price_filter_none", []),
+}
+
+
+class ErrorLog(logging.Handler):
+    """
+    Keeps the errors logged while the lookups run, e.g., the database errors
+    the nodes turn into an error reply.
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def create_database(path):
+    """
+    Creates the scratch database with the sample inventory.
+    """
+    conn = sqlite3.connect(path)
+    for name in ["initialize.sql", "sample_data.sql"]:
+        with open(os.path.join(DATABASE_DIR, name), encoding="utf-8") as f:
+            conn.executescript(f.read())
+    conn.close()
+
+
+def record_statements():
+    """
+    Runs the lookups of the nodes and agents and returns the statements they executed.
+    """
+    from tools.database import get_connection
+    from agents.booking_agent import query_cars_with_preferences, fetch_fallback_cars
+    from agents.recommendation_agent import recommend_cars_with_groq
+    from nodes.availability import check_availability
+    from nodes.brand import get_models_by_brand_with_groq
+    from nodes.color import get_cars_by_color_with_groq
+    from nodes.location import get_cars_by_location_with_groq
+    from nodes.price import handle_price_query
+    from nodes.year import get_cars_by_year_with_groq
+
+    statements = []
+    errors = ErrorLog()
+    logging.getLogger().addHandler(errors)
+    get_connection().set_trace_callback(statements.append)
+
+    for preferences in PREFERENCES:
+        query_cars_with_preferences(preferences)
+        fetch_fallback_cars(preferences)
+        recommend_cars_with_groq(preferences, None)
+        if preferences.get("start_date"):
+            check_availability(preferences)
+    for query in QUERIES:
+        for node in [get_models_by_brand_with_groq, get_cars_by_color_with_groq, get_cars_by_location_with_groq,
+                     handle_price_query, get_cars_by_year_with_groq]:
+            node(query, None)
+
+    get_connection().set_trace_callback(None)
+    logging.getLogger().removeHandler(errors)
+    return list(dict.fromkeys(statements)), errors.messages
+
+
+def check_price_answers():
+    """
+    Returns the PRICE_ANSWERS queries answered with another template or other cars.
+    """
+    from nodes.price import find_price_answer
+
+    wrong = []
+    for query, expected in PRICE_ANSWERS.items():
+        template, context = find_price_answer(query)
+        answer = (template, [car["model"] for car in context.get("cars", [])])
+        if answer != expected:
+            wrong.append(f"{query!r} answered {answer}, expected {expected}")
+    return wrong
+
+
+def find_full_scans(conn, statement):
+    """
+    Returns the plan lines of a statement that scan an indexed table without an index.
+    """
+    plan = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+    pattern = re.compile(r"^SCAN (" + "|".join(INDEXED_TABLES) + r")$")
+    return [row[3] for row in plan if pattern.match(row[3])]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rental_car.db")
+        create_database(path)
+        os.environ["RENTAL_DB_PATH"] = path
+        os.environ["RESPONSE_CACHE_PATH"] = os.path.join(directory, "response_cache.db")
+        os.environ["RENDER_MODE"] = "template"
+        sys.path.insert(0, CHATBOT_DIR)
+
+        statements, errors = record_statements()
+        conn = sqlite3.connect(path)
+        failures = 0
+        for message in errors:
+            failures += 1
+            print("Error logged: " + message)
+        for message in check_price_answers():
+            failures += 1
+            print("Wrong price answer: " + message)
+        for name, pattern in REQUIRED_STATEMENTS.items():
+            if not any(re.search(pattern, " ".join(statement.split())) for statement in statements):
+                failures += 1
+                print(f"Not executed: {name} ({pattern})")
+
+        checked = 0
+        for statement in statements:
+            # Only filtered lookups have to be index seeks; "--" lines are the
+            # R*Tree module's own statements on its shadow tables
+            normalized = " ".join(statement.split())
+            if normalized.startswith("--") or " WHERE " not in normalized or normalized.endswith("WHERE 1=1") or "InventoryVersion" in normalized:
+                continue
+            checked += 1
+            try:
+                scans = find_full_scans(conn, statement)
+            except sqlite3.Error as e:
+                failures += 1
+                print(f"Statement failed ({e}):\n    " + normalized)
+                continue
+            if scans:
+                failures += 1
+                print("Full scan (" + ", ".join(scans) + "):\n    " + normalized)
+        conn.close()
+
+    print(f"Recorded {len(statements)} statements, checked the plans of {checked}; {failures} failures.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
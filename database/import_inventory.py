@@ -0,0 +1,315 @@
+# import_inventory.py
+"""
+Loads shops, cars and availability windows from CSV or JSONL feeds.
+
+Each feed has the columns of its table in database/initialize.sql (Shop:
+ShopID, Location; Cars: CarID, Model, Brand, Year, Color, PricePerDay, ShopID;
+CarAvailability: CarID, StartDate, EndDate), as a CSV header or as JSONL keys;
+files ending in .gz are decompressed on the fly.
+
+The feeds are streamed into a scratch staging database in chunks, then merged
+into the rental database in a single transaction: shops and cars are
+upserted by their ID, and a car listed in the availability feed gets its
+windows replaced. The triggers of the three tables, and for large feeds
+their secondary indexes, are dropped for the merge and recreated before it
+commits, and the inventory version is bumped once. The database is in WAL mode, so the chatbot keeps
+reading the previous inventory until the merge commits.
+
+Usage: python database/import_inventory.py [--shops FILE] [--cars FILE]
+       [--availability FILE] [--database PATH] [--chunk-size N]
+       [--indexes auto|rebuild|keep]
+"""
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.join(DATABASE_DIR, "..", "chatbot")
+
+DEFAULT_DATABASE = os.getenv("RENTAL_DB_PATH", os.path.join(DATABASE_DIR, "rental_car.db"))
+
+# Rows per executemany call, and rows between two progress lines
+CHUNK_SIZE = 50000
+PROGRESS_EVERY = 500000
+
+# Share of the existing rows above which a feed has the indexes rebuilt
+# after the merge instead of maintained row by row (--indexes auto), and
+# the R*Tree over the availability windows recreated instead of updated
+REBUILD_SHARE = 0.25
+
+# Invalid rows reported by line before only being counted
+MAX_REPORTED_ERRORS = 10
+
+# Tables loaded, with their columns and the conversion of each one
+FEEDS = {
+    "shops": ("Shop", [("ShopID", int), ("Location", str)]),
+    "cars": ("Cars", [("CarID", int), ("Model", str), ("Brand", str), ("Year", int), ("Color", str),
+                      ("PricePerDay", float), ("ShopID", int)]),
+    "availability": ("CarAvailability", [("CarID", int), ("StartDate", date.fromisoformat), ("EndDate", date.fromisoformat)]),
+}
+
+# Columns that may be empty
+OPTIONAL_COLUMNS = {("Cars", "ShopID")}
+
+# Staging tables: the last row of a shop or car in its feed wins
+STAGING_SCHEMA = """
+CREATE TABLE Shop (ShopID INTEGER PRIMARY KEY, Location TEXT NOT NULL);
+CREATE TABLE Cars (
+    CarID INTEGER PRIMARY KEY, Model TEXT NOT NULL, Brand TEXT NOT NULL, Year INTEGER NOT NULL,
+    Color TEXT NOT NULL, PricePerDay REAL NOT NULL, ShopID INTEGER
+);
+CREATE TABLE CarAvailability (CarID INTEGER NOT NULL, StartDate DATE NOT NULL, EndDate DATE NOT NULL);
+"""
+
+# Julian day number of a date, as stored in the AvailabilityIndex R*Tree
+# (see database/migrations/0003_availability_index.sql)
+DAY_NUMBER = "CAST(julianday({}) + 0.5 AS INTEGER)"
+
+
+def open_feed(path):
+    """
+    Opens a feed as text, decompressing .gz files.
+    """
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(path):
+    """
+    Yields (line number, record) for every record of a CSV or JSONL feed.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    with open_feed(path) as f:
+        if name.endswith((".jsonl", ".ndjson")):
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+        elif name.endswith(".csv"):
+            # Line 1 is the header
+            for number, record in enumerate(csv.DictReader(f), start=2):
+                yield number, record
+        else:
+            raise ValueError(f"Unknown feed format: {path} (expected .csv or .jsonl)")
+
+
+def convert(table, columns, record):
+    """
+    Returns the row of a record for its table, or raises ValueError.
+    """
+    row = []
+    for column, kind in columns:
+        value = record.get(column)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            if (table, column) not in OPTIONAL_COLUMNS:
+                raise ValueError(f"missing {column}")
+            row.append(None)
+            continue
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid {column}: {value!r}")
+        row.append(value.isoformat() if isinstance(value, date) else value)
+    return row
+
+
+def stage_feed(staging, feed, path, chunk_size, progress_every):
+    """
+    Streams a feed into its staging table with one executemany per chunk, in
+    a single transaction. Returns the rows loaded and skipped and the seconds spent.
+    """
+    table, columns = FEEDS[feed]
+    verb = "INSERT" if table == "CarAvailability" else "INSERT OR REPLACE"
+    statement = f"{verb} INTO {table} ({', '.join(name for name, _ in columns)}) VALUES ({', '.join('?' * len(columns))})"
+    loaded = skipped = 0
+    next_progress = progress_every
+    started = time.perf_counter()
+
+    def rows():
+        nonlocal skipped
+        for number, record in read_records(path):
+            try:
+                yield convert(table, columns, record)
+            except ValueError as e:
+                skipped += 1
+                if skipped <= MAX_REPORTED_ERRORS:
+                    print(f"    {os.path.basename(path)}:{number}: skipped, {e}")
+
+    staging.execute("BEGIN")
+    iterator = rows()
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        staging.executemany(statement, chunk)
+        loaded += len(chunk)
+        if loaded >= next_progress:
+            elapsed = time.perf_counter() - started
+            print(f"    {feed}: {loaded} rows, {loaded / elapsed:,.0f} rows/s")
+            next_progress += progress_every
+    staging.execute("COMMIT")
+    return loaded, skipped, time.perf_counter() - started
+
+
+def prepare_database(conn):
+    """
+    Creates the schema of an empty database, switches it to WAL and applies
+    the pending migrations, as the chatbot does on startup.
+    """
+    sys.path.insert(0, CHATBOT_DIR)
+    from tools.database import apply_migrations
+
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Cars'").fetchone() is None:
+        with open(os.path.join(DATABASE_DIR, "initialize.sql"), encoding="utf-8") as f:
+            conn.executescript(f.read())
+    apply_migrations(conn)
+
+
+def deferred_objects(conn, keep_indexes):
+    """
+    Returns (type, name, sql) of the triggers, and unless keep_indexes the
+    indexes, on the loaded tables, so they can be dropped for the merge and
+    recreated after it.
+    """
+    types = ("trigger",) if keep_indexes else ("trigger", "index")
+    tables = [table for table, _ in FEEDS.values()]
+    return conn.execute(
+        f"SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL "
+        f"AND type IN ({', '.join('?' * len(types))}) AND tbl_name IN ({', '.join('?' * len(tables))})",
+        [*types, *tables]
+    ).fetchall()
+
+
+def merge(conn, staging_path, keep_indexes):
+    """
+    Merges the staged feeds into the database in one transaction and
+    returns the seconds spent on the rows and on rebuilding the indexes.
+    """
+    conn.execute("ATTACH DATABASE ? AS feed", (staging_path,))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        deferred = deferred_objects(conn, keep_indexes)
+        for kind, name, _ in deferred:
+            conn.execute(f"DROP {kind.upper()} {name}")
+
+        started = time.perf_counter()
+        # "WHERE true" lets SQLite parse ON CONFLICT after INSERT ... SELECT
+        conn.execute("""
+            INSERT INTO Shop (ShopID, Location) SELECT ShopID, Location FROM feed.Shop WHERE true
+            ON CONFLICT (ShopID) DO UPDATE SET Location = excluded.Location
+        """)
+        conn.execute("""
+            INSERT INTO Cars (CarID, Model, Brand, Year, Color, PricePerDay, ShopID)
+            SELECT CarID, Model, Brand, Year, Color, PricePerDay, ShopID FROM feed.Cars WHERE true
+            ON CONFLICT (CarID) DO UPDATE SET Model = excluded.Model, Brand = excluded.Brand, Year = excluded.Year,
+                Color = excluded.Color, PricePerDay = excluded.PricePerDay, ShopID = excluded.ShopID
+        """)
+
+        # The windows of the cars in the feed replace their current ones; the
+        # R*Tree is kept in sync here since its triggers are dropped
+        conn.execute("CREATE TEMP TABLE FeedWindows AS SELECT AvailabilityID FROM CarAvailability WHERE CarID IN (SELECT CarID FROM feed.CarAvailability)")
+        replaced = conn.execute("SELECT COUNT(*) FROM temp.FeedWindows").fetchone()[0]
+        windows = conn.execute("SELECT COUNT(*) FROM CarAvailability").fetchone()[0]
+        rebuild_rtree = replaced > windows * REBUILD_SHARE
+        if rebuild_rtree:
+            # The R*Tree deletes entries one by one, even all of them: recreating it is faster
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'AvailabilityIndex'").fetchone()[0]
+            conn.execute("DROP TABLE AvailabilityIndex")
+            conn.execute(sql)
+        else:
+            conn.execute("DELETE FROM AvailabilityIndex WHERE ID IN (SELECT AvailabilityID FROM temp.FeedWindows)")
+        conn.execute("DELETE FROM CarAvailability WHERE AvailabilityID IN (SELECT AvailabilityID FROM temp.FeedWindows)")
+        conn.execute("DROP TABLE temp.FeedWindows")
+        # New windows get IDs above every remaining one; a rebuilt R*Tree takes them all
+        last_id = 0 if rebuild_rtree else conn.execute("SELECT COALESCE(MAX(AvailabilityID), 0) FROM CarAvailability").fetchone()[0]
+        conn.execute("INSERT INTO CarAvailability (CarID, StartDate, EndDate) SELECT CarID, StartDate, EndDate FROM feed.CarAvailability")
+        conn.execute(f"""
+            INSERT INTO AvailabilityIndex (ID, StartDay, EndDay, CarID)
+            SELECT AvailabilityID, {DAY_NUMBER.format('StartDate')}, {DAY_NUMBER.format('EndDate')}, CarID
+            FROM CarAvailability WHERE AvailabilityID > ?
+        """, (last_id,))
+        rows_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _, _, sql in deferred:
+            conn.execute(sql)
+        conn.execute("UPDATE InventoryVersion SET Version = Version + 1 WHERE ID = 1")
+        index_seconds = time.perf_counter() - started
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE feed")
+    return rows_seconds, index_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shops", help="Shop feed (.csv or .jsonl, optionally .gz)")
+    parser.add_argument("--cars", help="Cars feed")
+    parser.add_argument("--availability", help="CarAvailability feed")
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--progress-every", type=int, default=PROGRESS_EVERY)
+    parser.add_argument("--indexes", choices=["auto", "rebuild", "keep"], default="auto",
+                        help="Rebuild the indexes after the merge or maintain them row by row; "
+                             "auto rebuilds them for feeds larger than a quarter of the tables")
+    args = parser.parse_args()
+
+    feeds = [(feed, getattr(args, feed)) for feed in FEEDS if getattr(args, feed)]
+    if not feeds:
+        parser.error("give at least one of --shops, --cars and --availability")
+
+    started = time.perf_counter()
+    # The staging database sits next to the target so the merge reads from the same disk
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(args.database))) as directory:
+        staging_path = os.path.join(directory, "staging.db")
+        staging = sqlite3.connect(staging_path, isolation_level=None)
+        staging.execute("PRAGMA journal_mode=OFF")
+        staging.execute("PRAGMA synchronous=OFF")
+        staging.executescript(STAGING_SCHEMA)
+
+        print(f"Staging feeds in {staging_path}")
+        totals = {}
+        for feed, path in feeds:
+            loaded, skipped, seconds = stage_feed(staging, feed, path, args.chunk_size, args.progress_every)
+            totals[feed] = loaded
+            print(f"{feed:13} {loaded:10} rows {skipped:6} skipped {seconds:7.1f}s {loaded / max(seconds, 1e-9):12,.0f} rows/s")
+        staging.close()
+
+        conn = sqlite3.connect(args.database, isolation_level=None, timeout=60)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        prepare_database(conn)
+        print(f"Merging into {args.database}")
+        keep_indexes = args.indexes == "keep"
+        if args.indexes == "auto":
+            existing = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table, _ in FEEDS.values())
+            keep_indexes = sum(totals.values()) <= existing * REBUILD_SHARE
+        rows_seconds, index_seconds = merge(conn, staging_path, keep_indexes)
+        # Copies the merged pages into the database without waiting for readers
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        version = conn.execute("SELECT Version FROM InventoryVersion WHERE ID = 1").fetchone()[0]
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
+    print(f"Merged in {rows_seconds:.1f}s, indexes and triggers rebuilt in {index_seconds:.1f}s; inventory version {version}")
+    print(f"Imported {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
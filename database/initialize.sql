@@ -19,3 +19,6 @@ CREATE TABLE CarAvailability (
     EndDate DATE NOT NULL,
     FOREIGN KEY (CarID) REFERENCES Cars(CarID)
 );
+
+-- Indexes, the inventory version and later schema changes are versioned in
+-- database/migrations and applied by the chatbot on startup.
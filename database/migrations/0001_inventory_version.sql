@@ -0,0 +1,17 @@
+-- Bumped on every inventory change so caches built on the inventory know when to refresh
+CREATE TABLE IF NOT EXISTS InventoryVersion (
+    ID INTEGER PRIMARY KEY CHECK (ID = 1),
+    Version INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO InventoryVersion (ID, Version) VALUES (1, 1);
+
+CREATE TRIGGER IF NOT EXISTS CarsInsertVersion AFTER INSERT ON Cars BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS CarsUpdateVersion AFTER UPDATE ON Cars BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS CarsDeleteVersion AFTER DELETE ON Cars BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS ShopInsertVersion AFTER INSERT ON Shop BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS ShopUpdateVersion AFTER UPDATE ON Shop BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS ShopDeleteVersion AFTER DELETE ON Shop BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS AvailabilityInsertVersion AFTER INSERT ON CarAvailability BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS AvailabilityUpdateVersion AFTER UPDATE ON CarAvailability BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS AvailabilityDeleteVersion AFTER DELETE ON CarAvailability BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
@@ -0,0 +1,17 @@
+-- Case-insensitive lookups: queries compare with "= ? COLLATE NOCASE" so these
+-- indexes can be used instead of LOWER(column), which forces a full scan
+CREATE INDEX IF NOT EXISTS CarsColorPrice ON Cars (Color COLLATE NOCASE, PricePerDay);
+CREATE INDEX IF NOT EXISTS CarsBrandColor ON Cars (Brand COLLATE NOCASE, Color COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS CarsModel ON Cars (Model COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ShopLocation ON Shop (Location COLLATE NOCASE);
+
+-- Year and price filters
+CREATE INDEX IF NOT EXISTS CarsYearPrice ON Cars (Year, PricePerDay);
+CREATE INDEX IF NOT EXISTS CarsPrice ON Cars (PricePerDay);
+
+-- Foreign keys used by the joins
+CREATE INDEX IF NOT EXISTS CarsShop ON Cars (ShopID);
+CREATE INDEX IF NOT EXISTS AvailabilityCar ON CarAvailability (CarID, StartDate, EndDate);
+
+-- Date range lookups
+CREATE INDEX IF NOT EXISTS AvailabilityDates ON CarAvailability (StartDate, EndDate);
@@ -0,0 +1,48 @@
+-- Give CarAvailability an explicit key: VACUUM may renumber implicit rowids,
+-- and the R*Tree below refers to each window by its key
+CREATE TABLE CarAvailabilityNew (
+    AvailabilityID INTEGER PRIMARY KEY,
+    CarID INTEGER NOT NULL,
+    StartDate DATE NOT NULL,
+    EndDate DATE NOT NULL,
+    FOREIGN KEY (CarID) REFERENCES Cars(CarID)
+);
+
+INSERT INTO CarAvailabilityNew (AvailabilityID, CarID, StartDate, EndDate)
+SELECT rowid, CarID, StartDate, EndDate FROM CarAvailability;
+
+DROP TABLE CarAvailability;
+ALTER TABLE CarAvailabilityNew RENAME TO CarAvailability;
+
+-- Recreate what was dropped with the old table, except the AvailabilityDates
+-- index of 0002: date range lookups go through the AvailabilityIndex R*Tree
+-- below, so it is not recreated (and dropped in case a copy is left)
+DROP INDEX IF EXISTS AvailabilityDates;
+CREATE INDEX IF NOT EXISTS AvailabilityCar ON CarAvailability (CarID, StartDate, EndDate);
+CREATE TRIGGER IF NOT EXISTS AvailabilityInsertVersion AFTER INSERT ON CarAvailability BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS AvailabilityUpdateVersion AFTER UPDATE ON CarAvailability BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+CREATE TRIGGER IF NOT EXISTS AvailabilityDeleteVersion AFTER DELETE ON CarAvailability BEGIN UPDATE InventoryVersion SET Version = Version + 1; END;
+
+-- R*Tree over the availability windows as Julian day numbers, so "which cars
+-- are free between X and Y" is answered without scanning CarAvailability.
+-- CarID is stored alongside each window; the triggers below keep it in sync.
+CREATE VIRTUAL TABLE IF NOT EXISTS AvailabilityIndex USING rtree_i32(ID, StartDay, EndDay, +CarID);
+
+INSERT INTO AvailabilityIndex (ID, StartDay, EndDay, CarID)
+SELECT AvailabilityID, CAST(julianday(StartDate) + 0.5 AS INTEGER), CAST(julianday(EndDate) + 0.5 AS INTEGER), CarID
+FROM CarAvailability;
+
+CREATE TRIGGER IF NOT EXISTS AvailabilityIndexInsert AFTER INSERT ON CarAvailability BEGIN
+    INSERT INTO AvailabilityIndex (ID, StartDay, EndDay, CarID)
+    VALUES (NEW.AvailabilityID, CAST(julianday(NEW.StartDate) + 0.5 AS INTEGER), CAST(julianday(NEW.EndDate) + 0.5 AS INTEGER), NEW.CarID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS AvailabilityIndexUpdate AFTER UPDATE ON CarAvailability BEGIN
+    DELETE FROM AvailabilityIndex WHERE ID = OLD.AvailabilityID;
+    INSERT INTO AvailabilityIndex (ID, StartDay, EndDay, CarID)
+    VALUES (NEW.AvailabilityID, CAST(julianday(NEW.StartDate) + 0.5 AS INTEGER), CAST(julianday(NEW.EndDate) + 0.5 AS INTEGER), NEW.CarID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS AvailabilityIndexDelete AFTER DELETE ON CarAvailability BEGIN
+    DELETE FROM AvailabilityIndex WHERE ID = OLD.AvailabilityID;
+END;
@@ -1,5 +1,9 @@
 
 const API_URL = 'http://127.0.0.1:5000/chat';
+const STREAM_URL = 'http://127.0.0.1:5000/chat/stream';
+
+// Conversation id assigned by the server, sent back with every message
+let sessionId = sessionStorage.getItem('sessionId');
 
 const chatInput = document.querySelector('.chat-input');
 const sendIcon = document.querySelector('.send-icon');
@@ -9,10 +13,15 @@ const bookingContainer = document.querySelector('.summary-section .inner-contain
 function createMessageElement(message, isUser = false) {
     const messageDiv = document.createElement('div');
     messageDiv.classList.add('message', isUser ? 'user-message' : 'ai-message');
-    let formattedMessage = message.replace(/([.?!])\s+/g, '$1<br><br>');
-    messageDiv.innerHTML = `<p>${formattedMessage}</p>`;
+    updateMessageElement(messageDiv, message);
     messagesContainer.prepend(messageDiv);
     messagesContainer.scrollTop = 0;
+    return messageDiv;
+}
+
+function updateMessageElement(messageDiv, message) {
+    let formattedMessage = message.replace(/([.?!])\s+/g, '$1<br><br>');
+    messageDiv.innerHTML = `<p>${formattedMessage}</p>`;
 }
 
 function addBookingCard(details) {
@@ -31,6 +40,53 @@ function addBookingCard(details) {
     bookingContainer.appendChild(cardDiv);
 }
 
+function requestHeaders() {
+    const headers = { 'Content-Type': 'application/json' };
+    if (sessionId) headers['X-Session-ID'] = sessionId;
+    return headers;
+}
+
+function rememberSession(response) {
+    const id = response.headers.get('X-Session-ID');
+    if (id) {
+        sessionId = id;
+        sessionStorage.setItem('sessionId', id);
+    }
+}
+
+function showResponse(data) {
+    if (data.response) {
+        if (data.response.car_details) {
+            // Add booking card if car details are provided
+            addBookingCard(data.response.car_details);
+        }
+        createMessageElement(data.response.message || data.response);
+    } else {
+        createMessageElement("Error: Could not get response from chatbot.");
+    }
+}
+
+async function sendMessageWithoutStreaming(message) {
+    const response = await fetch(API_URL, {
+        method: 'POST',
+        headers: requestHeaders(),
+        body: JSON.stringify({ message })
+    });
+
+    rememberSession(response);
+    showResponse(await response.json());
+}
+
+function parseServerSentEvent(block) {
+    let event = 'message';
+    let data = '';
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+    });
+    return { event, data: data ? JSON.parse(data) : null };
+}
+
 async function sendMessage() {
     const message = chatInput.value.trim();
     if (!message) return;
@@ -39,21 +95,55 @@ async function sendMessage() {
     chatInput.value = '';
 
     try {
-        const response = await fetch(API_URL, {
+        const response = await fetch(STREAM_URL, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: requestHeaders(),
             body: JSON.stringify({ message })
         });
+        rememberSession(response);
+
+        if (!response.ok || !response.body) {
+            // Streaming not available, use the regular endpoint
+            await sendMessageWithoutStreaming(message);
+            return;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let streamedText = '';
+        let messageDiv = null;
+        let cardShown = false;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const { event, data } = parseServerSentEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
 
-        const data = await response.json();
-        if (data.response) {
-            if (data.response.car_details) {
-                // Add booking card if car details are provided
-                addBookingCard(data.response.car_details);
+                if (event === 'token') {
+                    streamedText += data.text;
+                    if (!messageDiv) messageDiv = createMessageElement(streamedText);
+                    else updateMessageElement(messageDiv, streamedText);
+                } else if (event === 'car_details') {
+                    addBookingCard(data);
+                    cardShown = true;
+                } else if (event === 'done') {
+                    const finalResponse = data.response || {};
+                    if (finalResponse.car_details && !cardShown) addBookingCard(finalResponse.car_details);
+                    const finalText = finalResponse.message || (typeof finalResponse === 'string' ? finalResponse : '');
+                    if (!messageDiv) createMessageElement(finalText || "Error: Could not get response from chatbot.");
+                    else if (finalText) updateMessageElement(messageDiv, finalText);
+                } else if (event === 'error') {
+                    createMessageElement("Error: Could not get response from chatbot.");
+                    console.error("Error:", data.error);
+                }
             }
-            createMessageElement(data.response.message || data.response);
-        } else {
-            createMessageElement("Error: Could not get response from chatbot.");
         }
     } catch (error) {
         createMessageElement("Error: Could not connect to chatbot.");